@@ -1,19 +1,41 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from config import Config
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config import Config, engine_options
+from app.db_routing import RoutingSession, pin_after_write
+from app.pool_stats import instrument_engines, instrumented_engine_options
+from app.query_stats import init_query_stats
+from app.metrics import init_metrics
+from app.password_hasher import init_password_hasher
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS')
+    if options is None:
+        options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_POOL_PROFILE'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = instrumented_engine_options(options)
     
     db.init_app(app)
+    with app.app_context():
+        instrument_engines(app, db.engines)
     login_manager.init_app(app)
+    app.after_request(pin_after_write)
+    proxies = app.config.get('TRUSTED_PROXY_COUNT', 0)
+    if proxies:
+        # Иначе remote_addr - адрес прокси, и ограничение входов по IP общее для всех клиентов
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    init_query_stats(app)
+    init_metrics(app)
+    init_password_hasher(app)
     
     from app.routes import main
     app.register_blueprint(main)
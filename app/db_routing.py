@@ -0,0 +1,119 @@
+"""Маршрутизация чтения на реплики базы данных.
+
+Реплики задаются переменной DATABASE_REPLICA_URLS (адреса через запятую) и
+становятся bind-ами replica_0, replica_1, ... Запросы SELECT внутри методов,
+помеченных @replica_reads, уходят на реплику по кругу; все остальное, включая
+чтение после записи, идет на основную базу:
+
+- запись в текущем запросе (flush, INSERT/UPDATE/DELETE через session.execute)
+  закрепляет сессию за основной базой до конца запроса (флаг в g);
+- после такого запроса клиенту на REPLICA_PIN_SECONDS секунд ставится отметка
+  в cookie-сессии, чтобы страница после редиректа формы не читала отстающую реплику.
+"""
+import inspect
+import time
+from contextlib import contextmanager
+from functools import wraps
+from itertools import count
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica_'
+PIN_SESSION_KEY = 'db_primary_until'
+
+_round_robin = count()
+
+
+def replica_reads(method):
+    """Разрешает методу читать с реплики (если она настроена и сессия не закреплена).
+
+    Для генераторов разрешение действует на время их итерации, а не создания.
+    """
+    if inspect.isgeneratorfunction(method):
+        @wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            with _replica_scope():
+                yield from method(*args, **kwargs)
+        return generator_wrapper
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with _replica_scope():
+            return method(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def _replica_scope():
+    if not has_app_context():
+        yield
+        return
+    depth = g.get('db_replica_depth', 0)
+    g.db_replica_depth = depth + 1
+    try:
+        yield
+    finally:
+        g.db_replica_depth = depth
+
+
+def use_primary():
+    """Закрепляет чтение текущего запроса за основной базой"""
+    if has_app_context():
+        g.db_wrote = True
+
+
+def _pinned_to_primary() -> bool:
+    if g.get('db_wrote'):
+        return True
+    if has_request_context():
+        until = flask_session.get(PIN_SESSION_KEY)
+        return until is not None and until > time.time()
+    return False
+
+
+def pin_after_write(response):
+    """after_request: продлевает закрепление за основной базой после записи"""
+    if g.get('db_wrote') and current_app.config.get('DATABASE_REPLICA_URLS'):
+        flask_session[PIN_SESSION_KEY] = time.time() + current_app.config['REPLICA_PIN_SECONDS']
+    return response
+
+
+def _replica_engines(engines) -> list:
+    return [engine for key, engine in engines.items()
+            if key is not None and key.startswith(REPLICA_BIND_PREFIX)]
+
+
+def reads_from_replica() -> bool:
+    """Пойдет ли SELECT в текущем контексте на реплику"""
+    return (
+        has_app_context()
+        and g.get('db_replica_depth', 0) > 0
+        and not _pinned_to_primary()
+        and bool(_replica_engines(current_app.extensions['sqlalchemy'].engines))
+    )
+
+
+class RoutingSession(Session):
+    """Сессия, отправляющая SELECT из @replica_reads на реплики"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and clause is not None
+                and getattr(clause, 'is_select', False)
+                and has_app_context() and g.get('db_replica_depth', 0) > 0
+                and not _pinned_to_primary()):
+            replicas = _replica_engines(self._db.engines)
+            if replicas:
+                return replicas[next(_round_robin) % len(replicas)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush(session, flush_context):
+    use_primary()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        use_primary()
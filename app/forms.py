@@ -2,7 +2,13 @@ import re
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, DateField, IntegerField, SelectField
 from wtforms.validators import DataRequired, Length, ValidationError, Optional
+from sqlalchemy import select
+from app import db
 from app.models import User, Employee
+from app.services.hierarchy_service import HierarchyService
+from app.services.position_service import PositionService
+
+NO_BOSS_CHOICE = (0, 'Нет руководителя')
 
 class LoginForm(FlaskForm):
     username = StringField('Имя пользователя', validators=[DataRequired(message='Обязательное поле'), Length(min=2, max=20)])
@@ -34,17 +40,48 @@ class EmployeeForm(FlaskForm):
     position = SelectField('Должность', validators=[DataRequired(message='Обязательное поле')], choices=[])
     hire_date = DateField('Дата приема', validators=[DataRequired(message='Обязательное поле')])
     salary = IntegerField('Зарплата', validators=[DataRequired(message='Обязательное поле')])
-    boss_id = SelectField('Руководитель', coerce=int, validators=[Optional()])
+    # Кандидаты подгружаются на странице через /api/employees/bosses,
+    # поэтому выбранное значение проверяется в validate_boss_id, а не по choices
+    boss_id = SelectField('Руководитель', coerce=int, validators=[Optional()], validate_choice=False)
     submit = SubmitField('Сохранить')
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, employee_id=None, **kwargs):
         super(EmployeeForm, self).__init__(*args, **kwargs)
+        # Редактируемый сотрудник не может быть руководителем сам себе
+        self.employee_id = employee_id
         # Динамически загружаем должности при создании формы
         self.position.choices = self.get_position_choices()
+        self.boss_id.choices = [NO_BOSS_CHOICE]
+    
+    def load_boss_choice(self):
+        """Оставляет в списке руководителей только вариант "нет" и выбранного руководителя"""
+        choices = [NO_BOSS_CHOICE]
+        if self.boss_id.data:
+            boss = db.session.execute(
+                select(Employee.id, Employee.full_name, Employee.position)
+                .where(Employee.id == self.boss_id.data)
+            ).first()
+            if boss:
+                choices.append((boss.id, f"{boss.full_name} ({boss.position})"))
+        self.boss_id.choices = choices
+    
+    def validate_boss_id(self, boss_id):
+        if not boss_id.data:
+            return
+        if self.employee_id is not None and boss_id.data == self.employee_id:
+            raise ValidationError('Сотрудник не может быть руководителем сам себе')
+        if self.employee_id is not None and HierarchyService().is_in_subtree(boss_id.data, self.employee_id):
+            raise ValidationError('Нельзя назначить руководителем своего подчиненного')
+        # Поиск по первичному ключу вместо сравнения со всем списком сотрудников
+        exists = db.session.execute(
+            select(Employee.id).where(Employee.id == boss_id.data)
+        ).first()
+        if exists is None:
+            raise ValidationError('Руководитель не найден')
     
     def get_position_choices(self):
         """Получает список должностей из базы и добавляет опцию для новой должности"""
-        positions = Employee.get_unique_positions()
+        positions = PositionService().get_names()
         choices = [(pos, pos) for pos in positions]
         choices.append(('', '-- Выберите должность --'))  # Пустая опция по умолчанию
         choices.append(('__new__', '+ Добавить новую должность'))  # Опция для добавления новой
@@ -63,7 +100,7 @@ class EmployeeFormWithCustomPosition(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(EmployeeFormWithCustomPosition, self).__init__(*args, **kwargs)
         # Загружаем существующие должности
-        positions = Employee.get_unique_positions()
+        positions = PositionService().get_names()
         self.position_select.choices = [('', '-- Выберите из списка --')] + [(pos, pos) for pos in positions]
     
     def validate(self, **kwargs):
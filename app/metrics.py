@@ -0,0 +1,349 @@
+"""Метрики приложения в текстовом формате Prometheus (/metrics).
+
+Реестр хранит счетчики, gauge и гистограммы с метками в памяти процесса под
+блокировкой. При нескольких процессах (gunicorn с воркерами) задается
+METRICS_DIR: каждый процесс не чаще раза в METRICS_FLUSH_INTERVAL секунд
+атомарно записывает снимок своего реестра в metrics_<pid>.json, а /metrics
+складывает снимки всех процессов. Gauge учитываются только у живых процессов,
+счетчики и гистограммы - у всех, поэтому каталог очищается при развертывании.
+"""
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+from flask import g, has_app_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """Метрика одного типа; значения по кортежам значений меток"""
+
+    def __init__(self, registry, kind: str, name: str, help_text: str, labels=(), buckets=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+        self.values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = value
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+
+class MetricsRegistry:
+    """Метрики процесса и их сложение по снимкам процессов в METRICS_DIR"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+        self.derived = []
+        self.directory = None
+        self.flush_interval = 1.0
+        self._flushed_at = 0.0
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Metric(self, 'counter', name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Metric(self, 'gauge', name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Metric(self, 'histogram', name, help_text, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector):
+        """Функция без аргументов, обновляющая метрики перед снимком"""
+        self.collectors.append(collector)
+
+    def register_derived(self, derive):
+        """Функция, дополняющая сложенный по процессам снимок вычисляемыми метриками"""
+        self.derived.append(derive)
+
+    def snapshot(self) -> dict:
+        for collector in self.collectors:
+            collector()
+        with self.lock:
+            return {
+                metric.name: {
+                    'kind': metric.kind,
+                    'help': metric.help,
+                    'labels': list(metric.labels),
+                    'buckets': list(metric.buckets) if metric.buckets else None,
+                    'values': [[list(key), _copy_value(value)] for key, value in metric.values.items()]
+                }
+                for metric in self.metrics.values()
+            }
+
+    def configure(self, directory=None, flush_interval: float = 1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Записывает снимок процесса в METRICS_DIR (запись во временный файл и rename)"""
+        if not self.directory:
+            return
+        self._flushed_at = time.monotonic()
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temp_path, path)
+
+    def collect(self) -> dict:
+        """Снимок, сложенный по всем процессам (или только текущему без METRICS_DIR)"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, 'metrics_*.json'))):
+            pid = int(os.path.basename(path)[len('metrics_'):-len('.json')])
+            try:
+                with open(path, encoding='utf-8') as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            _merge(merged, snapshot, alive=_pid_alive(pid))
+        return merged
+
+    def render(self) -> str:
+        metrics = self.collect()
+        for derive in self.derived:
+            derive(metrics)
+        return render_text(metrics)
+
+
+def _copy_value(value):
+    if isinstance(value, list):
+        buckets, total, count = value
+        return [list(buckets), total, count]
+    return value
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _merge(merged: dict, snapshot: dict, alive: bool):
+    for name, metric in snapshot.items():
+        if metric['kind'] == 'gauge' and not alive:
+            continue
+        target = merged.setdefault(name, {**metric, 'values': []})
+        index = {tuple(labels): position for position, (labels, _) in enumerate(target['values'])}
+        for labels, value in metric['values']:
+            position = index.get(tuple(labels))
+            if position is None:
+                index[tuple(labels)] = len(target['values'])
+                target['values'].append([labels, value])
+            elif metric['kind'] == 'histogram':
+                buckets, total, count = target['values'][position][1]
+                target['values'][position][1] = [
+                    [a + b for a, b in zip(buckets, value[0])], total + value[1], count + value[2]
+                ]
+            else:
+                target['values'][position][1] += value
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render_text(metrics: dict) -> str:
+    """Текстовый формат экспозиции Prometheus 0.0.4"""
+    lines = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["kind"]}')
+        for labels, value in sorted(metric['values'], key=lambda item: item[0]):
+            if metric['kind'] == 'histogram':
+                buckets, total, count = value
+                for bound, bucket_count in zip(metric['buckets'], buckets):
+                    le = (('le', _format_value(bound)),)
+                    lines.append(f'{name}_bucket{_format_labels(metric["labels"], labels, le)} {bucket_count}')
+                lines.append(f'{name}_bucket{_format_labels(metric["labels"], labels, (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{_format_labels(metric["labels"], labels)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(metric["labels"], labels)} {count}')
+            else:
+                lines.append(f'{name}{_format_labels(metric["labels"], labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'Обработанные HTTP-запросы', ('endpoint', 'method', 'status'))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса', ('endpoint',))
+http_in_flight = registry.gauge(
+    'http_requests_in_flight', 'HTTP-запросы в обработке', ('endpoint',))
+db_queries = registry.counter(
+    'db_queries_total', 'SQL-запросы, выполненные при обработке HTTP-запросов', ('endpoint',))
+db_time = registry.counter(
+    'db_query_duration_seconds_total', 'Время SQL-запросов при обработке HTTP-запросов', ('endpoint',))
+cache_hits = registry.counter('cache_hits_total', 'Попадания в кеши', ('cache',))
+cache_misses = registry.counter('cache_misses_total', 'Промахи кешей', ('cache',))
+password_hash_in_flight = registry.gauge(
+    'password_hash_in_flight', 'Операции с паролями в пуле хеширования и его очереди')
+password_hash_rejected = registry.counter(
+    'password_hash_rejected_total', 'Операции с паролями, отклоненные при переполненной очереди')
+login_throttled = registry.counter(
+    'login_throttled_total', 'Входы, отклоненные из-за лимита неудачных попыток', ('scope',))
+
+
+def _collect_caches():
+    from app.services.position_service import position_list_cache
+    from app.services.search_service import employee_count_cache, employee_page_cache
+
+    caches = {
+        'employee_pages': employee_page_cache,
+        'employee_counts': employee_count_cache,
+        'position_list': position_list_cache,
+    }
+    for name, cache in caches.items():
+        stats = cache.stats()
+        cache_hits.set(stats['hits'], cache=name)
+        cache_misses.set(stats['misses'], cache=name)
+
+
+def _collect_password_hasher():
+    from app.password_hasher import password_hasher
+
+    stats = password_hasher.stats()
+    password_hash_in_flight.set(stats['in_flight'])
+    password_hash_rejected.set(stats['rejected'])
+
+
+def _collect_login_throttle():
+    from app.routes import login_throttle
+
+    for scope, rejected in login_throttle.stats()['rejected'].items():
+        login_throttled.set(rejected, scope=scope)
+
+
+def _cache_hit_ratio(metrics: dict):
+    # Доля считается по сумме попаданий и промахов всех процессов, а не усредняется
+    hits = {tuple(labels): value for labels, value in metrics.get('cache_hits_total', {}).get('values', [])}
+    misses = {tuple(labels): value for labels, value in metrics.get('cache_misses_total', {}).get('values', [])}
+    metrics['cache_hit_ratio'] = {
+        'kind': 'gauge',
+        'help': 'Доля попаданий в кеши',
+        'labels': ['cache'],
+        'buckets': None,
+        'values': [
+            [list(labels), hits[labels] / (hits[labels] + misses.get(labels, 0))
+             if hits[labels] + misses.get(labels, 0) else 0.0]
+            for labels in hits
+        ]
+    }
+
+
+registry.register_collector(_collect_caches)
+registry.register_collector(_collect_password_hasher)
+registry.register_collector(_collect_login_throttle)
+registry.register_derived(_cache_hit_ratio)
+
+
+def _endpoint() -> str:
+    # Имя обработчика, а не путь: число рядов не зависит от id в URL
+    return request.endpoint or 'unmatched'
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_endpoint = _endpoint()
+    http_in_flight.inc(endpoint=g.metrics_endpoint)
+
+
+def _record_response(response):
+    _finish_request(response.status_code)
+    return response
+
+
+def _teardown_request(exception):
+    if has_app_context() and 'metrics_started' in g:
+        _finish_request(500)
+
+
+def _finish_request(status: int):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    endpoint = g.metrics_endpoint
+    http_in_flight.dec(endpoint=endpoint)
+    http_requests.inc(endpoint=endpoint, method=request.method, status=status)
+    http_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+    stats = g.get('query_stats')
+    if stats is not None:
+        db_queries.inc(stats.count, endpoint=endpoint)
+        db_time.inc(stats.total_time, endpoint=endpoint)
+    registry.maybe_flush()
+
+
+def init_metrics(app):
+    registry.configure(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_INTERVAL', 1.0))
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_teardown_request)
+    if registry.directory:
+        atexit.register(registry.flush)
@@ -0,0 +1,84 @@
+"""Версионированные миграции схемы.
+
+Каждая миграция - функция upgrade(connection) с номером версии. Примененные
+версии записываются в таблицу schema_migrations, поэтому run_migrations
+применяет только новые, по порядку, каждую в своей транзакции. Миграции
+написаны так, чтобы их можно было выполнить и на базе, созданной
+db.create_all() по текущим моделям.
+"""
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from app.models import Employee, EmployeeClosure, EmployeeRollup, LoginLog, TableVersionRow, seed_table_versions
+from app.services.position_service import migrate_positions
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable
+
+
+def _create_hierarchy_tables(connection):
+    EmployeeClosure.__table__.create(connection, checkfirst=True)
+    EmployeeRollup.__table__.create(connection, checkfirst=True)
+
+
+def _create_access_path_indexes(connection):
+    existing = {index['name'] for index in inspect(connection).get_indexes('employees')}
+    # Одиночный индекс по position_id покрывается составным (position_id, salary)
+    if 'ix_employees_position_id' in existing:
+        connection.execute(text('DROP INDEX ix_employees_position_id'))
+
+    for table in (Employee.__table__, LoginLog.__table__):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _create_table_versions(connection):
+    TableVersionRow.__table__.create(connection, checkfirst=True)
+    seed_table_versions(connection)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Справочник должностей и employees.position_id', migrate_positions),
+    Migration(2, 'Таблицы иерархии и сводок по поддеревьям', _create_hierarchy_tables),
+    Migration(3, 'Индексы под фильтры, сортировки и журнал входов', _create_access_path_indexes),
+    Migration(4, 'Версии таблиц для сброса кешей во всех процессах', _create_table_versions),
+]
+
+
+def applied_versions(connection) -> List[int]:
+    schema_migrations.create(connection, checkfirst=True)
+    return connection.execute(
+        select(schema_migrations.c.version).order_by(schema_migrations.c.version)
+    ).scalars().all()
+
+
+def run_migrations(engine) -> List[int]:
+    """Применяет недостающие миграции; возвращает номера примененных версий"""
+    with engine.begin() as connection:
+        done = set(applied_versions(connection))
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version in done:
+            continue
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.utcnow()
+            ))
+        applied.append(migration.version)
+    return applied
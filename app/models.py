@@ -1,7 +1,10 @@
 from app import db, login_manager
 from flask_login import UserMixin
 from datetime import datetime
-import bcrypt
+from app.password_hasher import HasherBusyError, hash_rounds, password_hasher
+from sqlalchemy import event, exists, insert, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import relationship
 
 class User(UserMixin, db.Model):
@@ -17,11 +20,21 @@ class User(UserMixin, db.Model):
     # Связь с логами
     login_logs = db.relationship('LoginLog', backref='user', lazy=True)
     
-    def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    def set_password(self, password, min_rounds=None):
+        self.password_hash = password_hasher.hash(password, min_rounds)
     
-    def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+    def check_password(self, password, rehash=False):
+        """Проверяет пароль; с rehash=True хеш с устаревшей стоимостью пересчитывается
+        (сохраняется вместе со следующим commit)"""
+        if not password_hasher.verify(password, self.password_hash):
+            return False
+        if rehash and password_hasher.needs_rehash(self.password_hash):
+            try:
+                self.set_password(password, min_rounds=hash_rounds(self.password_hash))
+            except HasherBusyError:
+                # Пароль верный; пересчет подождет следующего входа, а не превратится в 503
+                pass
+        return True
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -37,15 +50,32 @@ class LoginLog(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.Text, nullable=True)
     
+    __table_args__ = (
+        # Журнал пользователя: WHERE user_id = ? ORDER BY login_time DESC
+        db.Index('ix_login_logs_user_time', 'user_id', 'login_time'),
+    )
+    
     def __repr__(self):
         return f'<LoginLog {self.user_id} {self.login_time}>'
 
+class Position(db.Model):
+    """Справочник должностей: текст хранится один раз, сотрудники ссылаются по id"""
+    __tablename__ = 'positions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f'<Position {self.name}>'
+
 class Employee(db.Model):
     __tablename__ = 'employees'
     
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(100), nullable=False)
     position = db.Column(db.String(50), nullable=False)
+    # Ссылка на справочник; текстовая колонка остается для совместимости и заполняется вместе с ней
+    position_id = db.Column(db.Integer, db.ForeignKey('positions.id'), nullable=True)
     hire_date = db.Column(db.Date, nullable=False)
     salary = db.Column(db.Integer, nullable=False)
     boss_id = db.Column(db.Integer, db.ForeignKey('employees.id'))
@@ -53,6 +83,18 @@ class Employee(db.Model):
     # Self-referential relationship
     boss = relationship('Employee', remote_side=[id], backref='subordinates')
     
+    __table_args__ = (
+        # Фильтры по диапазону и сортировки с пагинацией по курсору (значение, id)
+        db.Index('ix_employees_salary_id', 'salary', 'id'),
+        db.Index('ix_employees_hire_date_id', 'hire_date', 'id'),
+        db.Index('ix_employees_full_name_id', 'full_name', 'id'),
+        db.Index('ix_employees_position_name_id', 'position', 'id'),
+        # Фильтр по должности вместе с диапазоном зарплаты
+        db.Index('ix_employees_position_salary', 'position_id', 'salary'),
+        # Подчиненные руководителя: переводы, удаление, поддерево
+        db.Index('ix_employees_boss_id', 'boss_id'),
+    )
+    
     def __repr__(self):
         return f'<Employee {self.full_name}>'
     
@@ -69,9 +111,120 @@ class Employee(db.Model):
 
     @staticmethod
     def get_unique_positions():
-        """Получает список уникальных должностей из базы"""
-        positions = db.session.query(Employee.position).distinct().all()
-        return [position[0] for position in positions if position[0]]
+        """Получает список должностей, занятых хотя бы одним сотрудником"""
+        in_use = exists().where(Employee.position_id == Position.id)
+        return db.session.execute(
+            select(Position.name).where(in_use).order_by(Position.name)
+        ).scalars().all()
+
+def insert_positions(connection, names):
+    """Добавляет должности в справочник, пропуская уже существующие.
+
+    Одну и ту же новую должность могут одновременно добавлять несколько
+    транзакций: вставка без ON CONFLICT упала бы на уникальности name.
+    """
+    rows = [{'name': name} for name in names]
+    if not rows:
+        return
+    dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(connection.dialect.name)
+    if dialect_insert is not None:
+        connection.execute(dialect_insert(Position).on_conflict_do_nothing(index_elements=['name']), rows)
+        return
+    for row in rows:
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(Position), row)
+        except IntegrityError:
+            pass
+
+def position_id_for(connection, name):
+    """Возвращает id должности из справочника, добавляя ее при необходимости"""
+    position_id_query = select(Position.id).where(Position.name == name)
+    position_id = connection.execute(position_id_query).scalar()
+    if position_id is None:
+        insert_positions(connection, [name])
+        position_id = connection.execute(position_id_query).scalar()
+    return position_id
+
+@event.listens_for(Employee, 'before_insert')
+@event.listens_for(Employee, 'before_update')
+def _sync_position_id(mapper, connection, target):
+    # Любая запись через ORM поддерживает position_id в соответствии с текстом должности
+    if target.position and (target.position_id is None
+                            or inspect(target).attrs.position.history.has_changes()):
+        target.position_id = position_id_for(connection, target.position)
+
+class EmployeeClosure(db.Model):
+    """Таблица замыкания иерархии: все пары (руководитель, подчиненный) на любой глубине.
+
+    Для каждого сотрудника есть строка (id, id, 0). Поддерживается HierarchyService
+    в тех же транзакциях, что и изменения employees.
+    """
+    __tablename__ = 'employee_closure'
+    
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('employees.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('employees.id', ondelete='CASCADE'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        # Первичный ключ обслуживает поиск поддерева, этот индекс - цепочку руководителей
+        db.Index('ix_employee_closure_descendant', 'descendant_id', 'depth'),
+    )
+    
+    def __repr__(self):
+        return f'<EmployeeClosure {self.ancestor_id}->{self.descendant_id} ({self.depth})>'
+
+class EmployeeRollup(db.Model):
+    """Сводка по поддереву сотрудника: численность и фонд зарплаты с ним самим, уровень в иерархии"""
+    __tablename__ = 'employee_rollups'
+    
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id', ondelete='CASCADE'), primary_key=True)
+    headcount = db.Column(db.Integer, nullable=False, default=1)
+    salary_total = db.Column(db.BigInteger, nullable=False, default=0)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'employee_id': self.employee_id,
+            'headcount': self.headcount,
+            'salary_total': self.salary_total,
+            'depth': self.depth
+        }
+    
+    def __repr__(self):
+        return f'<EmployeeRollup {self.employee_id}: {self.headcount}, {self.salary_total}>'
+
+class TableVersionRow(db.Model):
+    """Текущая версия таблицы для ключей кешей (app.services.cache.TableVersion).
+
+    Меняется в транзакции каждой записи в таблицу, поэтому ее видят все процессы.
+    """
+    __tablename__ = 'table_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.String(32), nullable=False)
+    # Время записи по часам сервера приложения (time.time())
+    bumped_at = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<TableVersionRow {self.name}: {self.version}>'
+
+# Таблицы, версии которых ведутся в table_versions
+VERSIONED_TABLES = ('employees',)
+
+def seed_table_versions(connection):
+    """Добавляет недостающие строки версий: запись потом только обновляет их"""
+    table = TableVersionRow.__table__
+    existing = set(connection.execute(select(table.c.name)).scalars())
+    missing = [name for name in VERSIONED_TABLES if name not in existing]
+    if missing:
+        connection.execute(insert(table), [{'name': name, 'version': '', 'bumped_at': 0.0} for name in missing])
+
+@event.listens_for(TableVersionRow.__table__, 'after_create')
+def _seed_created_table_versions(target, connection, **kw):
+    # Строки создаются вместе с таблицей (db.create_all), а не первой записью:
+    # два первых писателя разных процессов столкнулись бы на INSERT
+    seed_table_versions(connection)
 
 @login_manager.user_loader
 def load_user(user_id):
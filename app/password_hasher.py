@@ -0,0 +1,190 @@
+"""Хеширование и проверка паролей bcrypt в ограниченном пуле потоков.
+
+bcrypt отпускает GIL, поэтому хеши считаются параллельно в пуле из
+workers потоков (по умолчанию - число ядер), а не в потоках запросов. Сверх
+workers в очереди ждут не больше max_queue операций: при переполнении
+сразу выбрасывается HasherBusyError, и запрос получает 503 вместо того,
+чтобы всплеск входов занял все потоки сервера.
+
+Стоимость (rounds) задается явно или подбирается в фоновом потоке при
+настройке так, чтобы один хеш занимал около target_ms миллисекунд на этой
+машине; до конца подбора используется MIN_ROUNDS.
+Хеши с меньшей стоимостью пересчитываются при успешном входе; стоимость
+хеша при этом никогда не снижается.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import bcrypt
+
+# Нижняя граница подбора стоимости - стоимость bcrypt.gensalt() по умолчанию, чтобы подбор
+# не ослаблял хеши; явно заданная стоимость может быть ниже (тесты)
+MIN_ROUNDS = 12
+MAX_ROUNDS = 16
+
+
+class HasherBusyError(RuntimeError):
+    """Очередь хеширования паролей переполнена"""
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """Стоимость из хеша bcrypt вида $2b$12$..."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = MIN_ROUNDS, max_rounds: int = MAX_ROUNDS) -> int:
+    """Наибольшая стоимость, при которой хеш считается не дольше target_ms.
+
+    Каждый шаг стоимости удваивает время, поэтому замер останавливается,
+    как только следующий шаг превысил бы цель.
+    """
+    rounds = min_rounds
+    while rounds < max_rounds:
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms * 2 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+# Подобранная стоимость по целевому времени: одна машина - один замер на процесс
+_calibrated = {}
+# Идущие замеры: целевое время -> хешеры, ждущие его результата
+_calibrating = {}
+_calibration_lock = threading.Lock()
+
+
+class PasswordHasher:
+    def __init__(self, rounds: Optional[int] = None, target_ms: float = 250.0,
+                 workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._calibration = None
+        self.rejected = 0
+        self.in_flight = 0
+        self.configure(rounds, target_ms, workers, max_queue)
+
+    def configure(self, rounds: Optional[int] = None, target_ms: float = 250.0,
+                  workers: Optional[int] = None, max_queue: Optional[int] = None):
+        """Меняет настройки; пул пересоздается при следующей операции"""
+        self.shutdown()
+        self._rounds = rounds
+        self.target_ms = target_ms
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        if rounds is None:
+            self._start_calibration()
+
+    def _start_calibration(self):
+        # Замер занимает несколько целевых времен: в потоке запроса он задержал бы
+        # вход и все хеширования, ждущие стоимость
+        target_ms = self.target_ms
+        with _calibration_lock:
+            if target_ms in _calibrated:
+                self._rounds = _calibrated[target_ms]
+                return
+            if target_ms in _calibrating:
+                _calibrating[target_ms].append(self)
+                return
+            _calibrating[target_ms] = [self]
+
+        def calibrate():
+            rounds = calibrate_rounds(target_ms)
+            with _calibration_lock:
+                _calibrated[target_ms] = rounds
+                waiting = _calibrating.pop(target_ms, [])
+            for hasher in waiting:
+                with hasher._lock:
+                    # Хешер могли перенастроить, пока шел замер
+                    if hasher._rounds is None and hasher.target_ms == target_ms:
+                        hasher._rounds = rounds
+
+        self._calibration = threading.Thread(target=calibrate, name='bcrypt-calibration', daemon=True)
+        self._calibration.start()
+
+    @property
+    def rounds(self) -> int:
+        """Текущая стоимость; пока идет подбор - MIN_ROUNDS"""
+        return MIN_ROUNDS if self._rounds is None else self._rounds
+
+    def hash(self, password: str, min_rounds: Optional[int] = None) -> str:
+        """Хеш с текущей стоимостью, но не дешевле min_rounds"""
+        salt = bcrypt.gensalt(max(self.rounds, min_rounds or 0))
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+    def stats(self) -> dict:
+        return {
+            'rounds': self._rounds,
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusyError('Слишком много одновременных операций с паролями')
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._pool().submit(func, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+        return self._executor
+
+    def _reset_after_fork(self):
+        # Потоки пула родителя в дочернем процессе не существуют
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        # Поток подбора стоимости тоже остался в родителе
+        _calibrating.clear()
+        if self._rounds is None:
+            self._start_calibration()
+
+
+password_hasher = PasswordHasher()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=password_hasher._reset_after_fork)
+
+
+def init_password_hasher(app):
+    password_hasher.configure(
+        rounds=app.config.get('BCRYPT_ROUNDS'),
+        target_ms=app.config.get('BCRYPT_TARGET_MS', 250.0),
+        workers=app.config.get('BCRYPT_WORKERS'),
+        max_queue=app.config.get('BCRYPT_MAX_QUEUE'),
+    )
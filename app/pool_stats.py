@@ -0,0 +1,208 @@
+"""Наблюдение за пулами соединений SQLAlchemy.
+
+Для каждого engine приложения (основная база и реплики) считаются время
+получения соединения из пула, занятость пула и использование переполнения,
+время удержания соединения запросом и время жизни соединений. Числа
+доступны через /api/db/pool-stats и помогают подбирать число воркеров под
+размер пула.
+"""
+import threading
+import time
+from collections import deque
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Сколько последних замеров хранится для перцентилей
+SAMPLE_SIZE = 1024
+
+
+def _percentile(samples, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, замеряющий ожидание соединения в connect().
+
+    Pool-события срабатывают уже после получения соединения, поэтому
+    ожидание свободного места в пуле видно только снаружи вызова.
+    """
+    stats = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            if self.stats is not None:
+                self.stats.record_timeout(time.perf_counter() - started)
+            raise
+        if self.stats is not None:
+            self.stats.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() создает новый пул того же класса: счетчики переносятся
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def instrumented_engine_options(options: dict) -> dict:
+    """Добавляет InstrumentedQueuePool к настройкам engine с QueuePool"""
+    if 'pool_size' in options and 'poolclass' not in options:
+        return {**options, 'poolclass': InstrumentedQueuePool}
+    return options
+
+
+class PoolStats:
+    """Счетчики одного пула; обновляются из pool-событий в разных потоках"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=SAMPLE_SIZE)
+        self._holds = deque(maxlen=SAMPLE_SIZE)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waits_recorded = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.invalidations = 0
+        self.lifetimes_recorded = 0
+        self.lifetime_total = 0.0
+        self.lifetime_max = 0.0
+
+    @property
+    def pool(self):
+        # После engine.dispose() пул новый, слушатели событий переходят в него
+        return self.engine.pool
+
+    def attach(self):
+        pool = self.pool
+        if isinstance(pool, InstrumentedQueuePool):
+            pool.stats = self
+        event.listen(pool, 'connect', self._on_connect)
+        event.listen(pool, 'checkout', self._on_checkout)
+        event.listen(pool, 'checkin', self._on_checkin)
+        event.listen(pool, 'close', self._on_close)
+        event.listen(pool, 'close_detached', self._on_close_detached)
+        event.listen(pool, 'invalidate', self._on_invalidate)
+        return self
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self._waits.append(seconds)
+            self.waits_recorded += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self, seconds: float):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max = max(self.wait_max, seconds)
+
+    def _on_connect(self, dbapi_connection, record):
+        record.info['connected_at'] = time.monotonic()
+        with self._lock:
+            self.connections_opened += 1
+
+    def _on_checkout(self, dbapi_connection, record, proxy):
+        record.info['checked_out_at'] = time.monotonic()
+        overflow = self.pool.overflow() if hasattr(self.pool, 'overflow') else 0
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self.peak_overflow = max(self.peak_overflow, overflow)
+
+    def _on_checkin(self, dbapi_connection, record):
+        checked_out_at = record.info.pop('checked_out_at', None)
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+            if checked_out_at is not None:
+                self._holds.append(time.monotonic() - checked_out_at)
+
+    def _on_close(self, dbapi_connection, record):
+        self._record_closed(record.info.pop('connected_at', None))
+
+    def _on_close_detached(self, dbapi_connection):
+        self._record_closed(None)
+
+    def _on_invalidate(self, dbapi_connection, record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def _record_closed(self, connected_at: Optional[float]):
+        with self._lock:
+            self.connections_closed += 1
+            if connected_at is not None:
+                lifetime = time.monotonic() - connected_at
+                self.lifetimes_recorded += 1
+                self.lifetime_total += lifetime
+                self.lifetime_max = max(self.lifetime_max, lifetime)
+
+    def to_dict(self) -> dict:
+        pool = self.pool
+        size = pool.size() if hasattr(pool, 'size') else None
+        max_overflow = getattr(pool, '_max_overflow', None)
+        capacity = size + max_overflow if size is not None and max_overflow is not None and max_overflow >= 0 else None
+        with self._lock:
+            waits = list(self._waits)
+            holds = list(self._holds)
+            return {
+                'pool_class': type(pool).__name__,
+                'size': size,
+                'max_overflow': max_overflow,
+                'timeout': getattr(pool, '_timeout', None),
+                'checked_out': self.checked_out,
+                'idle': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+                'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+                'saturation': round(self.checked_out / capacity, 3) if capacity else None,
+                'peak_checked_out': self.peak_checked_out,
+                'peak_overflow': self.peak_overflow,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'checkout_wait_ms': {
+                    'avg': _ms(self.wait_total / self.waits_recorded) if self.waits_recorded else None,
+                    'p50': _ms(_percentile(waits, 0.5)),
+                    'p95': _ms(_percentile(waits, 0.95)),
+                    'max': _ms(self.wait_max),
+                },
+                'hold_ms': {
+                    'p50': _ms(_percentile(holds, 0.5)),
+                    'p95': _ms(_percentile(holds, 0.95)),
+                    'max': _ms(max(holds)) if holds else None,
+                },
+                'connections': {
+                    'opened': self.connections_opened,
+                    'closed': self.connections_closed,
+                    'invalidated': self.invalidations,
+                    'avg_lifetime_s': (round(self.lifetime_total / self.lifetimes_recorded, 3)
+                                       if self.lifetimes_recorded else None),
+                    'max_lifetime_s': round(self.lifetime_max, 3),
+                },
+            }
+
+
+def instrument_engines(app, engines) -> dict:
+    """Подключает PoolStats к пулам engine-ов; результат хранится в app.extensions"""
+    stats = {
+        key or 'default': PoolStats(engine).attach()
+        for key, engine in engines.items()
+    }
+    app.extensions['pool_stats'] = stats
+    return stats
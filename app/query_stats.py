@@ -0,0 +1,119 @@
+"""Счетчик SQL-запросов на HTTP-запрос и поиск N+1.
+
+Слушатели before/after_cursor_execute считают выполненные запросы и время в
+базе для текущего запроса (g.query_stats) и для открытых count_queries().
+Запросы сравниваются по форме: текст с параметрами-заполнителями, списки IN
+сворачиваются. Форма, повторившаяся QUERY_REPEAT_THRESHOLD раз и больше,
+обычно означает ленивую загрузку в цикле; в режиме отладки об этом сообщают
+заголовки ответа, иначе - запись в журнале.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Tuple
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Заполнители параметров разных драйверов: ?, %s, %(name)s, :name
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_IN_LIST = re.compile(r'\(\s*' + _PLACEHOLDER + r'(?:\s*,\s*' + _PLACEHOLDER + r')+\s*\)')
+
+_local = threading.local()
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: пробелы нормализованы, списки параметров IN свернуты"""
+    return _IN_LIST.sub('(?)', ' '.join(statement.split()))
+
+
+class QueryStats:
+    """Число запросов, суммарное время в базе и повторы форм запросов"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Формы, выполненные threshold раз и больше, по убыванию числа повторов"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    @property
+    def total_ms(self) -> float:
+        return round(self.total_time * 1000, 3)
+
+
+def _collectors() -> List[QueryStats]:
+    collectors = list(getattr(_local, 'stack', ()))
+    if has_app_context() and 'query_stats' in g:
+        collectors.append(g.query_stats)
+    return collectors
+
+
+@contextmanager
+def count_queries():
+    """Считает запросы всех engine-ов в текущем потоке внутри блока"""
+    stats = QueryStats()
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(stats)
+    try:
+        yield stats
+    finally:
+        stack.remove(stats)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started_at', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for stats in _collectors():
+        stats.record(statement, elapsed)
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+
+def _report_request(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    repeated = stats.repeated(current_app.config['QUERY_REPEAT_THRESHOLD'])
+    if current_app.debug:
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time-Ms'] = str(stats.total_ms)
+        if repeated:
+            shape, count = repeated[0]
+            response.headers['X-Query-Repeated'] = f'{count}x {shape[:200]}'.encode('ascii', 'replace').decode()
+    elif repeated:
+        for shape, count in repeated:
+            logger.warning('Повтор запроса %d раз (%d запросов, %.1f мс) на %s %s: %s',
+                           count, stats.count, stats.total_ms, request.method, request.path, shape)
+    return response
+
+
+def init_query_stats(app):
+    app.config.setdefault('QUERY_REPEAT_THRESHOLD', 5)
+    app.before_request(_start_request)
+    app.after_request(_report_request)
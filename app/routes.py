@@ -1,20 +1,51 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, session
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, session, Response, stream_with_context, current_app
 from flask_login import login_user, logout_user, current_user, login_required
 from app.forms import LoginForm, RegistrationForm, EmployeeForm
-from app.models import User, Employee, LoginLog
+from app.models import User, LoginLog
 from app.services.auth_service import AuthService
+from app.services.auth_activity_service import AuthActivityService
+from app.services.login_throttle import LoginThrottle, throttle_backend
 from app.services.employee_service import EmployeeService
-from app.services.search_service import SearchService
+from app.services.search_service import SearchService, InvalidCursorError
+from app.services.name_index import employee_name_index
+from app.services.employee_filter import EmployeeFilter
+from app.services.export_service import ExportService
+from app.services.import_service import ImportService, ImportFormatError
+from app.services.hierarchy_service import HierarchyService
+from app.services.position_service import PositionService
+from app.metrics import registry as metrics_registry
+from app.password_hasher import HasherBusyError
 from app import db
+from config import Config
 from datetime import datetime
+import math
 import sqlalchemy.exc as sql_exc
 from app.services.analytics_service import AnalyticsService
 
 main = Blueprint('main', __name__)
 
-employee_service = EmployeeService()
+hierarchy_service = HierarchyService()
+employee_service = EmployeeService(hierarchy_service)
 search_service = SearchService()
-auth_service = AuthService()
+auth_service = AuthService(
+    log_file=Config.AUTH_LOG_FILE,
+    batch_size=Config.AUTH_LOG_BATCH_SIZE,
+    flush_interval=Config.AUTH_LOG_FLUSH_INTERVAL,
+    fsync=Config.AUTH_LOG_FSYNC,
+    max_bytes=Config.AUTH_LOG_MAX_BYTES
+)
+login_throttle = LoginThrottle(
+    ip_limit=Config.LOGIN_THROTTLE_IP_LIMIT,
+    user_limit=Config.LOGIN_THROTTLE_USER_LIMIT,
+    window=Config.LOGIN_THROTTLE_WINDOW,
+    backend=throttle_backend(Config.LOGIN_THROTTLE_DB)
+)
+# Неудачные входы из журнала авторизации питают ограничение попыток
+auth_service.add_listener(login_throttle.record_event)
+auth_activity_service = AuthActivityService(auth_service.log_file, Config.AUTH_ACTIVITY_CHECKPOINT)
+export_service = ExportService(search_service)
+position_service = PositionService()
+import_service = ImportService(hierarchy=hierarchy_service)
 
 @main.route('/')
 def index():
@@ -34,10 +65,16 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        # Превышен лимит неудачных попыток: ни запроса пользователя, ни bcrypt
+        retry_after = login_throttle.check(request.remote_addr, form.username.data)
+        if retry_after:
+            flash('Слишком много неудачных попыток входа. Пожалуйста, повторите позже.', 'error')
+            return render_template('login.html', form=form), 429, {'Retry-After': str(math.ceil(retry_after))}
         try:
             user = User.query.filter_by(username=form.username.data).first()
             
-            if user and user.check_password(form.password.data) and user.is_active:
+            # Хеш с устаревшей стоимостью обновляется и сохраняется вместе с записью о входе
+            if user and user.check_password(form.password.data, rehash=True) and user.is_active:
                 # Логируем вход
                 login_log = auth_service.create_login_log(
                     user.id,
@@ -68,6 +105,9 @@ def login():
                     ip_address=request.remote_addr
                 )
                 flash('Ошибка входа. Пожалуйста, проверьте имя пользователя и пароль', 'error')
+        except HasherBusyError:
+            flash('Сервер перегружен. Пожалуйста, повторите вход через несколько секунд.', 'error')
+            return render_template('login.html', form=form), 503, {'Retry-After': '1'}
         except Exception as e:
             flash('Ошибка базы данных. Пожалуйста, попробуйте снова.', 'error')
             print(f"Login error: {e}")
@@ -121,6 +161,10 @@ def register():
         except sql_exc.IntegrityError:
             db.session.rollback()
             flash('Имя пользователя или email уже существуют.', 'error')
+        except HasherBusyError:
+            db.session.rollback()
+            flash('Сервер перегружен. Пожалуйста, повторите попытку через несколько секунд.', 'error')
+            return render_template('register.html', form=form), 503, {'Retry-After': '1'}
         except Exception as e:
             db.session.rollback()
             flash('Произошла ошибка при регистрации. Пожалуйста, попробуйте снова.', 'error')
@@ -132,64 +176,23 @@ def register():
 @login_required
 def employees():
     page = request.args.get('page', 1, type=int)
-    search_query = request.args.get('search', '')
     sort_by = request.args.get('sort_by', 'id')
     sort_order = request.args.get('sort_order', 'asc')
     
-    # Получаем параметры фильтрации по зарплате
-    min_salary = request.args.get('min_salary', type=int)
-    max_salary = request.args.get('max_salary', type=int)
-    
-    # Получаем параметры фильтрации по дате приема
-    start_date_str = request.args.get('start_date', '')
-    end_date_str = request.args.get('end_date', '')
-    
-    # Конвертируем строки в даты
-    start_date = None
-    end_date = None
-    
-    if start_date_str:
-        try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            flash('Неверный формат начальной даты', 'error')
-            start_date_str = ''
-    
-    if end_date_str:
-        try:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            flash('Неверный формат конечной даты', 'error')
-            end_date_str = ''
-    
-    # Валидация: начальная дата не может быть больше конечной
-    if start_date and end_date and start_date > end_date:
-        flash('Начальная дата не может быть больше конечной', 'error')
-        start_date, end_date = end_date, start_date
-        start_date_str, end_date_str = end_date_str, start_date_str
-    
-    # Валидация: минимальная зарплата не может быть больше максимальной
-    if min_salary and max_salary and min_salary > max_salary:
-        flash('Минимальная зарплата не может быть больше максимальной', 'error')
-        min_salary, max_salary = max_salary, min_salary
+    # Разбираем поиск и фильтры по зарплате и дате приема один раз
+    spec, errors = EmployeeFilter.from_args(request.args)
+    for error in errors:
+        flash(error, 'error')
     
     try:
-        if search_query:
-            pagination = search_service.search_employees(
-                search_query, page, 20, 
-                min_salary=min_salary, 
-                max_salary=max_salary,
-                start_date=start_date,
-                end_date=end_date
-            )
-        else:
-            pagination = search_service.get_sorted_employees(
-                sort_by, sort_order, page, 20,
-                min_salary=min_salary,
-                max_salary=max_salary,
-                start_date=start_date,
-                end_date=end_date
-            )
+        # Проекция с именем руководителя: одна выборка на страницу без N+1
+        pagination = search_service.list_employee_rows(
+            sort_by=sort_by,
+            sort_order=sort_order,
+            page=page,
+            per_page=20,
+            spec=spec
+        )
         
         employees = pagination.items
         
@@ -200,27 +203,73 @@ def employees():
             'employees.html',
             employees=employees,
             pagination=pagination,
-            search_query=search_query,
+            search_query=spec.search,
             sort_by=sort_by,
             sort_order=sort_order,
-            min_salary=min_salary,
-            max_salary=max_salary,
-            start_date=start_date_str,
-            end_date=end_date_str,
+            min_salary=spec.min_salary,
+            max_salary=spec.max_salary,
+            start_date=spec.start_date.isoformat() if spec.start_date else '',
+            end_date=spec.end_date.isoformat() if spec.end_date else '',
             now=now
         )
     except Exception as e:
         flash(f'Ошибка загрузки сотрудников: {str(e)}', 'error')
         return render_template('employees.html', employees=[])
 
+@main.route('/employees/export')
+@login_required
+def export_employees():
+    """Потоковая выгрузка отфильтрованного списка сотрудников в CSV или JSONL"""
+    export_format = request.args.get('format', 'csv')
+    sort_by = request.args.get('sort_by', 'id')
+    sort_order = request.args.get('sort_order', 'asc')
+    
+    spec, errors = EmployeeFilter.from_args(request.args)
+    if errors:
+        return jsonify({'error': '; '.join(errors)}), 400
+    
+    if export_format == 'jsonl':
+        chunks = export_service.iter_jsonl(spec, sort_by, sort_order)
+        mimetype = 'application/x-ndjson'
+    elif export_format == 'csv':
+        chunks = export_service.iter_csv(spec, sort_by, sort_order)
+        mimetype = 'text/csv'
+    else:
+        return jsonify({'error': 'Неподдерживаемый формат выгрузки'}), 400
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=employees.{export_format}'}
+    )
+
+@main.route('/employees/import', methods=['POST'])
+@login_required
+def import_employees():
+    """Массовый импорт сотрудников из загруженного CSV, возвращает отчет по строкам"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Файл не выбран'}), 400
+    
+    try:
+        report = import_service.import_csv(upload.stream)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    auth_service.log_auth_event(
+        current_user.username,
+        'IMPORT_EMPLOYEES',
+        session_duration=f"Imported employees: {report.imported} of {report.total}"
+    )
+    
+    return jsonify(report.to_dict())
+
 @main.route('/employee/add', methods=['GET', 'POST'])
 @login_required
 def add_employee():
     form = EmployeeForm()
-    
-    # Заполняем выпадающий список руководителей
-    bosses = Employee.query.all()
-    form.boss_id.choices = [(0, 'Нет руководителя')] + [(boss.id, f"{boss.full_name} ({boss.position})") for boss in bosses]
+    # В списке руководителей только выбранный; остальные ищутся через /api/employees/bosses
+    form.load_boss_choice()
     
     if form.validate_on_submit():
         try:
@@ -264,11 +313,7 @@ def edit_employee(employee_id):
         flash('Сотрудник не найден', 'error')
         return redirect(url_for('main.employees'))
     
-    form = EmployeeForm()
-    
-    # Заполняем выпадающий список руководителей (исключая текущего сотрудника)
-    bosses = Employee.query.filter(Employee.id != employee_id).all()
-    form.boss_id.choices = [(0, 'Нет руководителя')] + [(boss.id, f"{boss.full_name} ({boss.position})") for boss in bosses]
+    form = EmployeeForm(employee_id=employee_id)
     
     if request.method == 'GET':
         form.full_name.data = employee.full_name
@@ -277,6 +322,9 @@ def edit_employee(employee_id):
         form.salary.data = employee.salary
         form.boss_id.data = employee.boss_id if employee.boss_id else 0
     
+    # В списке руководителей только выбранный; остальные ищутся через /api/employees/bosses
+    form.load_boss_choice()
+    
     if form.validate_on_submit():
         try:
             boss_id = form.boss_id.data if form.boss_id.data != 0 else None
@@ -345,6 +393,194 @@ def user_logs():
     logs = auth_service.get_user_logs(current_user.id)
     return render_template('user_logs.html', logs=logs)
 
+@main.route('/api/auth-log')
+@login_required
+def api_auth_log():
+    """События журнала авторизации за интервал: start/end - дата или 'YYYY-MM-DD HH:MM:SS'"""
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    try:
+        events = auth_service.get_auth_events(
+            start, end,
+            action=request.args.get('action') or None,
+            username=request.args.get('username') or None,
+            limit=limit
+        )
+        counts = auth_service.count_auth_events(start, end)
+    except ValueError:
+        return jsonify({'error': 'Неверный формат даты'}), 400
+    return jsonify({'events': events, 'counts': counts})
+
+@main.route('/api/auth-log/activity')
+@login_required
+def api_auth_activity():
+    """Неудачные входы, входы по часам и изменения по операторам за интервал дней"""
+    top = min(max(request.args.get('top', 20, type=int), 1), 1000)
+    try:
+        refreshed = auth_activity_service.refresh()
+        report = auth_activity_service.report(
+            request.args.get('start') or None,
+            request.args.get('end') or None,
+            top=top
+        )
+    except ValueError:
+        return jsonify({'error': 'Неверный формат даты'}), 400
+    report['refreshed'] = refreshed
+    return jsonify(report)
+
+@main.route('/api/employees')
+@login_required
+def api_employees():
+    """API списка сотрудников с пагинацией по курсору"""
+    sort_by = request.args.get('sort_by', 'id')
+    sort_order = request.args.get('sort_order', 'asc')
+    cursor = request.args.get('cursor') or None
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    spec, errors = EmployeeFilter.from_args(request.args)
+    if errors:
+        return jsonify({'error': '; '.join(errors)}), 400
+
+    try:
+        if spec.search:
+            result = search_service.search_employees_keyset(
+                spec.search, cursor, per_page, spec=spec
+            )
+        else:
+            result = search_service.get_sorted_employees_keyset(
+                sort_by, sort_order, cursor, per_page, spec=spec
+            )
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        # Текст исключения может содержать SQL и детали базы - только в лог
+        current_app.logger.exception('Ошибка обработки %s', request.path)
+        return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
+
+    return jsonify({
+        'items': [emp.to_dict() for emp in result.items],
+        'next_cursor': result.next_cursor,
+        'has_next': result.has_next
+    })
+
+@main.route('/api/employees/bosses')
+@login_required
+def api_boss_lookup():
+    """Постраничный поиск кандидатов в руководители для формы сотрудника"""
+    query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 50)
+    exclude_id = request.args.get('exclude', type=int)
+    
+    try:
+        items, has_next = search_service.lookup_bosses(query, page, per_page, exclude_id)
+    except Exception:
+        current_app.logger.exception('Ошибка обработки %s', request.path)
+        return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
+    
+    return jsonify({'items': items, 'page': page, 'has_next': has_next})
+
+@main.route('/api/employees/<int:employee_id>/subtree')
+@login_required
+def api_employee_subtree(employee_id):
+    """Подчиненные сотрудника на любой глубине (по курсору) и цепочка его руководителей"""
+    if employee_service.get_employee_by_id(employee_id) is None:
+        return jsonify({'error': 'Сотрудник не найден'}), 404
+    max_depth = request.args.get('max_depth', type=int)
+    cursor = request.args.get('cursor') or None
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+    
+    try:
+        result = hierarchy_service.get_subtree_page(employee_id, max_depth, cursor, limit)
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'id': employee_id,
+        'ancestors': hierarchy_service.get_ancestors(employee_id),
+        'items': result.items,
+        'total': hierarchy_service.count_subtree(employee_id, max_depth),
+        'next_cursor': result.next_cursor,
+        'has_next': result.has_next
+    })
+
+@main.route('/api/employees/<int:employee_id>/rollup')
+@login_required
+def api_employee_rollup(employee_id):
+    """Численность и фонд зарплаты всей структуры сотрудника"""
+    rollup = hierarchy_service.rollups.get_rollup(employee_id)
+    if rollup is None:
+        return jsonify({'error': 'Сотрудник не найден'}), 404
+    return jsonify(rollup)
+
+@main.route('/api/employees/raise-salary', methods=['POST'])
+@login_required
+def api_raise_salary():
+    """Массовое повышение зарплаты сотрудникам под фильтром.
+    
+    Без фильтров операция касается всех сотрудников, поэтому требует явного "all": true.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        percent = float(data.get('percent'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Не указан процент повышения'}), 400
+    
+    spec = EmployeeFilter.from_json(data.get('filters'))
+    if spec.is_empty and data.get('all') is not True:
+        return jsonify({'error': 'Укажите фильтр сотрудников или "all": true для всех'}), 400
+    try:
+        updated = employee_service.raise_salary(spec, percent)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    auth_service.log_auth_event(
+        current_user.username,
+        'RAISE_SALARY',
+        session_duration=f"Raised salary by {percent}% for {updated} employees"
+    )
+    return jsonify({'updated': updated})
+
+@main.route('/api/employees/<int:employee_id>/reassign', methods=['POST'])
+@login_required
+def api_reassign_subordinates(employee_id):
+    """Перевод всех подчиненных сотрудника к другому руководителю"""
+    data = request.get_json(silent=True) or {}
+    to_id = data.get('to_id')
+    # bool - подкласс int, но true/false в JSON - не id
+    if to_id is not None and (not isinstance(to_id, int) or isinstance(to_id, bool)):
+        return jsonify({'error': 'Ожидается id руководителя или null'}), 400
+    try:
+        moved = employee_service.reassign_subordinates(employee_id, to_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    auth_service.log_auth_event(
+        current_user.username,
+        'REASSIGN_SUBORDINATES',
+        session_duration=f"Reassigned {len(moved)} subordinates of {employee_id} to {to_id}"
+    )
+    return jsonify({'moved': moved})
+
+@main.route('/api/employees/delete', methods=['POST'])
+@login_required
+def api_delete_employees():
+    """Удаление набора сотрудников по списку id"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(
+            isinstance(employee_id, int) and not isinstance(employee_id, bool) for employee_id in ids):
+        return jsonify({'error': 'Ожидается список id сотрудников'}), 400
+    
+    deleted = employee_service.delete_employees(ids)
+    
+    auth_service.log_auth_event(
+        current_user.username,
+        'DELETE_EMPLOYEE',
+        session_duration=f"Deleted employees: {deleted}"
+    )
+    return jsonify({'deleted': deleted})
+
 @main.route('/api/employees/search')
 @login_required
 def api_search_employees():
@@ -353,27 +589,52 @@ def api_search_employees():
         return jsonify([])
     
     try:
-        employees = Employee.query.filter(
-            Employee.full_name.ilike(f'%{query}%')
-        ).limit(10).all()
-        return jsonify([{
-            'id': emp.id,
-            'full_name': emp.full_name,
-            'position': emp.position
-        } for emp in employees])
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        # Автодополнение отвечает из индекса в памяти, без запроса к базе
+        return jsonify(employee_name_index.search(query, limit=10))
+    except Exception:
+        current_app.logger.exception('Ошибка обработки %s', request.path)
+        return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
     
+@main.route('/api/cache/stats')
+@login_required
+def get_cache_stats():
+    """API для получения статистики кешей списка сотрудников"""
+    return jsonify(search_service.cache_stats())
+
+@main.route('/metrics')
+def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/api/db/pool-stats')
+@login_required
+def get_pool_stats():
+    """Состояние пулов соединений: основная база и реплики"""
+    stats = current_app.extensions.get('pool_stats', {})
+    return jsonify({name: pool.to_dict() for name, pool in stats.items()})
+
     # Новый маршрут для получения должностей через API
 @main.route('/api/positions')
 @login_required
 def get_positions():
     """API endpoint для получения списка должностей"""
     try:
-        positions = Employee.get_unique_positions()
-        return jsonify(positions)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return jsonify(position_service.get_names())
+    except Exception:
+        current_app.logger.exception('Ошибка обработки %s', request.path)
+        return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
+
+@main.route('/api/positions/stats')
+@login_required
+def get_position_stats():
+    """Численность и средняя зарплата по должностям с фильтрами списка сотрудников"""
+    spec, errors = EmployeeFilter.from_args(request.args)
+    if errors:
+        return jsonify({'error': '; '.join(errors)}), 400
+    return jsonify(position_service.headcount_by_position(spec))
     
 
 @main.route('/analytics')
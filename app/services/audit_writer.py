@@ -0,0 +1,224 @@
+import atexit
+import csv
+import io
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from typing import Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('batch', 'interval', 'never')
+
+# Маркер истечения ожидания очереди в потоке-писателе
+_TICK = object()
+
+# Все открытые писатели процесса: дописываются при выходе и сбрасываются после fork
+_writers = weakref.WeakSet()
+
+
+def lock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def unlock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def encode_rows(rows, errors: str = 'strict') -> bytes:
+    """Строки CSV в байтах UTF-8, как их пишет csv.writer"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8', errors)
+
+
+class AuditLogWriter:
+    """Фоновая запись строк CSV-журнала пачками.
+
+    write() только кладет строку в очередь, поэтому запрос не ждет диска.
+    Поток-писатель собирает пачку до batch_size строк или flush_interval
+    секунд и дописывает ее одним write() под эксклюзивной блокировкой файла
+    (flock, в Windows - msvcrt.locking), так что строки разных процессов не
+    перемешиваются. fsync: 'batch' - после каждой пачки, 'interval' - не
+    чаще раза в fsync_interval секунд, 'never' - на усмотрение ОС.
+    """
+
+    def __init__(self, path: str, header: Optional[List[str]] = None,
+                 batch_size: int = 100, flush_interval: float = 1.0,
+                 fsync: str = 'batch', fsync_interval: float = 5.0,
+                 max_queue: int = 10000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Неизвестная политика fsync: {fsync!r}, доступны: {", ".join(FSYNC_POLICIES)}')
+        self.path = path
+        self.header = header
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue
+        self.written = 0
+        self.dropped = 0
+        self._synced_at = 0.0
+        self._reset()
+        _writers.add(self)
+        if header:
+            self.ensure_header(path)
+
+    def _reset(self):
+        self._start_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._closed = False
+
+    def ensure_header(self, path: str):
+        """Создает файл с заголовком, если его нет.
+
+        Файл готовится под временным именем и появляется через os.link, который
+        не перезаписывает существующий: другой процесс не увидит его без заголовка.
+        """
+        if os.path.exists(path):
+            return
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.new'
+        with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerow(self.header)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Файловая система без жестких ссылок
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, 'w', newline='', encoding='utf-8') as file:
+                    csv.writer(file).writerow(self.header)
+        finally:
+            os.remove(temp_path)
+
+    def write(self, row: Iterable):
+        """Ставит строку в очередь записи; при переполненной очереди строка отбрасывается"""
+        if self._closed:
+            raise RuntimeError('Журнал закрыт')
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(list(row))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('Очередь журнала %s переполнена, строка отброшена', self.path)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Ждет записи всех строк, поставленных в очередь до вызова"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Дописывает очередь и останавливает поток"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f'audit-writer:{os.path.basename(self.path)}', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        waiters = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _TICK
+            if item is None:
+                stopping = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not _TICK:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            due = deadline is not None and time.monotonic() >= deadline
+            if batch and (stopping or waiters or due or len(batch) >= self.batch_size):
+                self._write_batch(batch)
+                batch = []
+                deadline = None
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+
+    def _write_batch(self, rows: List[list]):
+        data = encode_rows(rows)
+        try:
+            with open(self.path, 'ab') as file:
+                lock_file(file)
+                try:
+                    file.seek(0, os.SEEK_END)
+                    file.write(data)
+                    file.flush()
+                    self._maybe_fsync(file)
+                finally:
+                    unlock_file(file)
+            self.written += len(rows)
+        except OSError:
+            logger.exception('Не удалось записать %d строк в журнал %s', len(rows), self.path)
+
+    def _maybe_fsync(self, file):
+        if self.fsync == 'batch' or (
+                self.fsync == 'interval' and time.monotonic() - self._synced_at >= self.fsync_interval):
+            os.fsync(file.fileno())
+            self._synced_at = time.monotonic()
+
+
+def _reset_after_fork():
+    # Поток родителя в дочернем процессе не существует, его очередь уже записывает родитель
+    for writer in list(_writers):
+        writer._reset()
+
+
+@atexit.register
+def _drain_all():
+    for writer in list(_writers):
+        writer.close()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
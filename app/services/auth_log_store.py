@@ -0,0 +1,395 @@
+"""Журнал авторизации, разбитый на сегменты по дням и размеру.
+
+Текущие события пишутся в сам файл журнала (auth_logs.csv). Когда приходит
+строка следующего дня или файл превышает max_bytes, он под блокировкой
+переименовывается в сегмент auth_logs.<день>.<номер>.csv и сжимается в
+.csv.gz: строки каждого часа - отдельный gzip-член, поэтому файл читается
+zcat целиком, а любой час распаковывается отдельно. Рядом пишется индекс
+.idx.json: диапазон времени, смещения членов и счетчики действий.
+Старые журналы могли писаться не в UTF-8 (кодировка системы по умолчанию):
+при сжатии байты сохраняются как есть, при чтении не-UTF-8 символы заменяются.
+Запрос за интервал открывает только подходящие сегменты и распаковывает
+только подходящие часы; счетчики по целиком покрытым часам берутся из индекса.
+"""
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime, time as dt_time
+from typing import Dict, Iterator, List, Optional, Union
+from app.services.audit_writer import AuditLogWriter, encode_rows, lock_file, unlock_file
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Байты не в UTF-8 переживают разбор CSV и записываются в сегмент без изменений
+_RAW = 'surrogateescape'
+
+_SEGMENT_RE = re.compile(r'\.(\d{4}-\d{2}-\d{2})\.(\d{3})\.(csv|csv\.gz|idx\.json)$')
+
+Moment = Union[str, date, datetime, None]
+
+
+def _base(log_file: str) -> str:
+    return os.path.splitext(log_file)[0]
+
+
+def segment_path(log_file: str, day: str, seq: int, kind: str = 'csv') -> str:
+    return f'{_base(log_file)}.{day}.{seq:03d}.{kind}'
+
+
+def _segments(log_file: str, kind: str) -> List[tuple]:
+    """(день, номер, путь) сегментов одного вида по порядку"""
+    found = []
+    for path in glob.glob(glob.escape(_base(log_file)) + '.*'):
+        match = _SEGMENT_RE.search(path)
+        if match and match.group(3) == kind and path[:match.start()] == _base(log_file):
+            found.append((match.group(1), int(match.group(2)), path))
+    return sorted(found)
+
+
+def write_atomic(path: str, data: bytes):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def file_identity(file) -> str:
+    """Идентификатор файла журнала: устройство, inode и отпечаток первой строки данных.
+
+    inode сжатого и удаленного сегмента может достаться новому файлу, поэтому
+    одного inode мало. Пока в файле нет полной строки данных, отпечаток пустой.
+    """
+    stat = os.fstat(file.fileno())
+    file.seek(0)
+    file.readline()
+    first = file.readline()
+    head = hashlib.sha1(first).hexdigest()[:16] if first.endswith(b'\n') else ''
+    return f'{stat.st_dev}:{stat.st_ino}:{head}'
+
+
+def _printable(value):
+    """Значение для JSON-индекса: байты не в UTF-8 заменяются"""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [_printable(item) for item in value]
+    return value.encode('utf-8', _RAW).decode('utf-8', 'replace')
+
+
+def compress_segment(csv_path: str) -> Optional[dict]:
+    """Сжимает закрытый сегмент по часам, пишет индекс и удаляет исходный CSV.
+
+    Возвращает индекс или None, если сегмент уже сжат другим процессом.
+    """
+    try:
+        source = open(csv_path, 'r+b')
+    except FileNotFoundError:
+        return None
+    with source:
+        lock_file(source)
+        try:
+            if not os.path.exists(csv_path):
+                return None
+            identity = file_identity(source)
+            source.seek(0)
+            raw = source.read()
+            reader = csv.reader(io.StringIO(raw.decode('utf-8', _RAW), newline=''))
+            header = next(reader, None)
+            hours = defaultdict(list)
+            for row in reader:
+                if row:
+                    hours[row[0][:13]].append(row)
+
+            members = []
+            blobs = []
+            offset = 0
+            for position, hour in enumerate(sorted(hours)):
+                rows = hours[hour]
+                payload = encode_rows(([header] if position == 0 and header else []) + rows, _RAW)
+                blob = gzip.compress(payload, mtime=0)
+                timestamps = [row[0] for row in rows]
+                members.append({
+                    'hour': hour,
+                    'offset': offset,
+                    'length': len(blob),
+                    'header': position == 0 and header is not None,
+                    'rows': len(rows),
+                    'start': min(timestamps),
+                    'end': max(timestamps),
+                    'actions': dict(Counter(_printable(row[2]) for row in rows if len(row) > 2)),
+                })
+                blobs.append(blob)
+                offset += len(blob)
+
+            gz_path = f'{csv_path}.gz'
+            index = {
+                'segment': os.path.basename(gz_path),
+                'header': _printable(header),
+                'rows': sum(member['rows'] for member in members),
+                'start': members[0]['start'] if members else None,
+                'end': members[-1]['end'] if members else None,
+                'actions': dict(sum((Counter(member['actions']) for member in members), Counter())),
+                'members': members,
+                # Исходный файл: по нему инкрементальные читатели узнают уже прочитанные байты
+                'source': identity,
+                'source_bytes': len(raw),
+            }
+            write_atomic(gz_path, b''.join(blobs))
+            write_atomic(csv_path[:-len('.csv')] + '.idx.json',
+                          json.dumps(index, ensure_ascii=False).encode('utf-8'))
+            os.remove(csv_path)
+            return index
+        finally:
+            unlock_file(source)
+
+
+class RotatingAuditLogWriter(AuditLogWriter):
+    """Фоновый писатель журнала с ротацией по дням и размеру и сжатием сегментов.
+
+    Ротация выполняется под блокировкой текущего файла; процесс, получивший
+    блокировку уже переименованного файла, замечает смену inode и открывает
+    новый. Сегменты, оставшиеся несжатыми после аварийной остановки, сжимаются
+    при создании писателя.
+    """
+
+    def __init__(self, path: str, header: List[str], max_bytes: int = 64 * 1024 * 1024, **kwargs):
+        self.max_bytes = max_bytes
+        super().__init__(path, header=header, **kwargs)
+        self.rotations = 0
+        self.compress_pending()
+
+    def compress_pending(self) -> int:
+        compressed = 0
+        for _day, _seq, csv_path in _segments(self.path, 'csv'):
+            if self._compress(csv_path):
+                compressed += 1
+        return compressed
+
+    @staticmethod
+    def _compress(csv_path: str) -> bool:
+        # Ошибка сжатия не должна останавливать запись: сегмент останется CSV
+        # и будет сжат при следующем запуске, а пока читается как есть
+        try:
+            return compress_segment(csv_path) is not None
+        except Exception:
+            logger.exception('Не удалось сжать сегмент журнала %s', csv_path)
+            return False
+
+    def _write_batch(self, rows: List[list]):
+        for day, group in itertools.groupby(rows, key=lambda row: str(row[0])[:10]):
+            group = list(group)
+            try:
+                self._append_day(day, group)
+            except OSError:
+                logger.exception('Не удалось записать %d строк в журнал %s', len(group), self.path)
+
+    def _append_day(self, day: str, rows: List[list]):
+        data = encode_rows(rows)
+        while True:
+            file = self._open_locked()
+            rotated = None
+            try:
+                first_day = self._active_first_day(file)
+                size = os.fstat(file.fileno()).st_size
+                too_big = self.max_bytes and size + len(data) > self.max_bytes
+                if first_day is not None and (day > first_day or too_big):
+                    rotated = self._rotate_locked(first_day)
+                else:
+                    file.seek(0, os.SEEK_END)
+                    file.write(data)
+                    file.flush()
+                    self._maybe_fsync(file)
+                    self.written += len(rows)
+            finally:
+                unlock_file(file)
+                file.close()
+            if rotated is None:
+                return
+            # Сжатие - после снятия блокировки: остальные процессы уже пишут в новый файл
+            self._compress(rotated)
+
+    def _open_locked(self):
+        while True:
+            self.ensure_header(self.path)
+            file = open(self.path, 'a+b')
+            lock_file(file)
+            opened = os.fstat(file.fileno())
+            try:
+                current = os.stat(self.path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+                return file
+            unlock_file(file)
+            file.close()
+
+    @staticmethod
+    def _active_first_day(file) -> Optional[str]:
+        """День первой строки текущего файла.
+
+        Не кешируется: inode сжатого и удаленного сегмента может достаться новому файлу.
+        """
+        file.seek(0)
+        file.readline()
+        first = file.readline()
+        if not first:
+            return None
+        return first[:10].decode('utf-8', 'replace')
+
+    def _rotate_locked(self, day: str) -> str:
+        seq = 0
+        while (os.path.exists(segment_path(self.path, day, seq))
+               or os.path.exists(segment_path(self.path, day, seq, 'csv.gz'))):
+            seq += 1
+        target = segment_path(self.path, day, seq)
+        os.rename(self.path, target)
+        self.rotations += 1
+        return target
+
+
+def _moment(value: Moment, end: bool = False) -> Optional[str]:
+    """Граница интервала как строка времени журнала; дата конца включает весь день"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, date):
+        value = value.isoformat()
+    if len(value) == 10:
+        parsed = datetime.strptime(value, '%Y-%m-%d')
+        return datetime.combine(parsed.date(), dt_time.max if end else dt_time.min).strftime(TIMESTAMP_FORMAT)
+    return datetime.strptime(value, TIMESTAMP_FORMAT).strftime(TIMESTAMP_FORMAT)
+
+
+def _overlaps(first: Optional[str], last: Optional[str], start: Optional[str], end: Optional[str]) -> bool:
+    if first is None:
+        return False
+    return (end is None or first <= end) and (start is None or last >= start)
+
+
+def _inside(timestamp: str, start: Optional[str], end: Optional[str]) -> bool:
+    return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+
+
+class AuthLogStore:
+    """Чтение журнала авторизации за интервал времени (границы включительно)"""
+
+    def __init__(self, log_file: str):
+        self.log_file = log_file
+
+    def indexes(self) -> List[dict]:
+        loaded = []
+        for day, seq, path in _segments(self.log_file, 'idx.json'):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    index = json.load(file)
+            except (OSError, ValueError):
+                continue
+            index['path'] = segment_path(self.log_file, day, seq, 'csv.gz')
+            loaded.append(index)
+        return loaded
+
+    def query(self, start: Moment = None, end: Moment = None,
+              action: Optional[str] = None, username: Optional[str] = None) -> Iterator[dict]:
+        """События за интервал в порядке сегментов; читаются только нужные часы"""
+        start, end = _moment(start), _moment(end, end=True)
+        for row in self._rows(start, end):
+            if action and row[2] != action:
+                continue
+            if username and row[1] != username:
+                continue
+            yield self._event(row)
+
+    def count_actions(self, start: Moment = None, end: Moment = None) -> Dict[str, int]:
+        """Число событий по действиям; часы, целиком попавшие в интервал, не распаковываются"""
+        start, end = _moment(start), _moment(end, end=True)
+        counts = Counter()
+        for index in self.indexes():
+            if not _overlaps(index['start'], index['end'], start, end):
+                continue
+            partial = []
+            for member in index['members']:
+                if not _overlaps(member['start'], member['end'], start, end):
+                    continue
+                if _inside(member['start'], start, end) and _inside(member['end'], start, end):
+                    counts.update(member['actions'])
+                else:
+                    partial.append(member)
+            for row in self._member_rows(index['path'], partial):
+                if _inside(row[0], start, end):
+                    counts[row[2]] += 1
+        for row in self._plain_rows(start, end):
+            counts[row[2]] += 1
+        return dict(counts)
+
+    def _rows(self, start, end) -> Iterator[list]:
+        for index in self.indexes():
+            if not _overlaps(index['start'], index['end'], start, end):
+                continue
+            members = [member for member in index['members']
+                       if _overlaps(member['start'], member['end'], start, end)]
+            for row in self._member_rows(index['path'], members):
+                if _inside(row[0], start, end):
+                    yield row
+        yield from self._plain_rows(start, end)
+
+    def segment_rows(self, index: dict) -> Iterator[list]:
+        """Все строки сжатого сегмента без заголовка"""
+        return self._member_rows(index['path'], index['members'])
+
+    def plain_paths(self, end: Optional[str] = None) -> List[str]:
+        """Текущий файл и сегменты, еще не сжатые после ротации"""
+        # Сегмент начинается с дня в имени, но старый журнал может охватывать несколько дней
+        paths = [path for day, _seq, path in _segments(self.log_file, 'csv')
+                 if end is None or day <= end]
+        paths.append(self.log_file)
+        return paths
+
+    def _member_rows(self, gz_path: str, members: List[dict]) -> Iterator[list]:
+        if not members:
+            return
+        with open(gz_path, 'rb') as file:
+            for member in members:
+                file.seek(member['offset'])
+                text = gzip.decompress(file.read(member['length'])).decode('utf-8', 'replace')
+                reader = csv.reader(io.StringIO(text, newline=''))
+                if member['header']:
+                    next(reader, None)
+                yield from (row for row in reader if len(row) > 2)
+
+    def _plain_rows(self, start, end) -> Iterator[list]:
+        for path in self.plain_paths(end):
+            try:
+                file = open(path, newline='', encoding='utf-8', errors='replace')
+            except FileNotFoundError:
+                continue
+            with file:
+                reader = csv.reader(file)
+                next(reader, None)
+                for row in reader:
+                    if len(row) > 2 and _inside(row[0], start, end):
+                        yield row
+
+    @staticmethod
+    def _event(row: list) -> dict:
+        row = row + [''] * (6 - len(row))
+        return {
+            'timestamp': row[0],
+            'username': row[1],
+            'action': row[2],
+            'ip_address': row[3] or None,
+            'user_agent': row[4] or None,
+            'session_duration': row[5] or None,
+        }
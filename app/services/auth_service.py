@@ -1,27 +1,46 @@
-import csv
-import os
 from datetime import datetime
+from itertools import islice
 from app.models import LoginLog, db
+from app.services.auth_log_store import AuthLogStore, RotatingAuditLogWriter
+
+AUTH_LOG_HEADER = ['timestamp', 'username', 'action', 'ip_address', 'user_agent', 'session_duration']
 
 class AuthService:
-    def __init__(self, log_file='auth_logs.csv'):
+    def __init__(self, log_file='auth_logs.csv', batch_size=100, flush_interval=1.0, fsync='batch',
+                 max_bytes=64 * 1024 * 1024):
         self.log_file = log_file
-        self._ensure_log_file()
+        # Создает файл с заголовком, если его нет; строки пишет фоновый поток,
+        # закрытые дни и переполненные файлы уходят в сжатые сегменты
+        self.writer = RotatingAuditLogWriter(
+            log_file, header=AUTH_LOG_HEADER, max_bytes=max_bytes,
+            batch_size=batch_size, flush_interval=flush_interval, fsync=fsync
+        )
+        self.store = AuthLogStore(log_file)
+        self.listeners = []
     
-    def _ensure_log_file(self):
-        """Создает файл логов если он не существует"""
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'username', 'action', 'ip_address', 'user_agent', 'session_duration'])
+    def add_listener(self, listener):
+        """Подписывает listener(action, username, ip_address) на события авторизации"""
+        self.listeners.append(listener)
     
     def log_auth_event(self, username, action, ip_address=None, user_agent=None, session_duration=None):
-        """Логирует события авторизации в CSV файл"""
+        """Ставит событие авторизации в очередь записи в CSV файл и передает его слушателям"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        with open(self.log_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, username, action, ip_address, user_agent, session_duration])
+        self.writer.write([timestamp, username, action, ip_address, user_agent, session_duration])
+        for listener in self.listeners:
+            listener(action, username, ip_address)
+    
+    def flush_log(self, timeout=None):
+        """Дожидается записи поставленных в очередь событий"""
+        return self.writer.flush(timeout)
+    
+    def get_auth_events(self, start=None, end=None, action=None, username=None, limit=None):
+        """События журнала за интервал (границы включительно, дата конца - весь день)"""
+        events = self.store.query(start, end, action=action, username=username)
+        return list(islice(events, limit) if limit else events)
+    
+    def count_auth_events(self, start=None, end=None):
+        """Число событий журнала по действиям за интервал"""
+        return self.store.count_actions(start, end)
     
     def create_login_log(self, user_id, ip_address=None, user_agent=None):
         """Создает запись о входе в БД"""
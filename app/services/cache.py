@@ -0,0 +1,123 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+from flask import g
+from sqlalchemy import select, update
+from app import db
+from app.models import TableVersionRow
+
+
+class TableVersion:
+    """Версия таблицы: меняется при каждой записи.
+
+    Версия входит в ключи кешей, поэтому после записи старые значения
+    просто перестают находиться и вытесняются по LRU. Хранится в строке
+    table_versions и меняется в транзакции записи, поэтому запись в любом
+    процессе сбрасывает кеши всех процессов. Читается с основной базы один
+    раз за запрос (значение запоминается в g).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def _current(self) -> Tuple[str, Optional[float]]:
+        versions = g.setdefault('table_versions', {})
+        if self.name not in versions:
+            # С реплики можно прочитать старую версию и закешировать под ней новые данные
+            row = db.session.execute(
+                select(TableVersionRow.version, TableVersionRow.bumped_at)
+                .where(TableVersionRow.name == self.name),
+                bind_arguments={'bind': db.engine}
+            ).first()
+            versions[self.name] = tuple(row) if row else ('', None)
+        return versions[self.name]
+
+    @property
+    def value(self) -> str:
+        return self._current()[0]
+
+    @property
+    def age(self) -> float:
+        """Секунды с последней записи (бесконечность, если записей не было)"""
+        bumped_at = self._current()[1]
+        if bumped_at is None:
+            return float('inf')
+        return time.time() - bumped_at
+
+    def bump(self) -> str:
+        """Меняет версию в текущей транзакции; вызывать последним перед commit записи.
+
+        UPDATE блокирует строку версии до commit, и другие писатели таблицы ждут
+        ее, поэтому блокировка должна держаться как можно меньше. Строка создается
+        вместе с таблицей table_versions (или миграцией), здесь - только UPDATE.
+
+        Версия случайная, а не счетчик: после пересоздания таблиц или отката
+        транзакции новая версия не совпадет с ключами уже закешированных значений.
+        """
+        version, bumped_at = uuid.uuid4().hex, time.time()
+        updated = db.session.execute(
+            update(TableVersionRow)
+            .where(TableVersionRow.name == self.name)
+            .values(version=version, bumped_at=bumped_at)
+        ).rowcount
+        if not updated:
+            raise RuntimeError(f'Нет строки версии таблицы {self.name} в table_versions: примените миграции')
+        g.setdefault('table_versions', {})[self.name] = (version, bumped_at)
+        return version
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кеш с ограничением времени жизни записей"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+
+# Версия таблицы employees; меняется EmployeeService и ImportService при каждой записи
+employees_version = TableVersion('employees')
@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import List, Mapping, Optional, Tuple
+from sqlalchemy import select
+from app.models import Employee, Position
+
+
+def _parse_int(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_date(value) -> Optional[date]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class EmployeeFilter:
+    """Неизменяемая спецификация фильтра списка сотрудников.
+
+    Разбирается один раз из параметров запроса или JSON и используется
+    сервисами поиска и аналитики. Хешируется, поэтому служит ключом кешей,
+    а условия WHERE для одинаковых фильтров строятся один раз.
+    """
+    search: str = ''
+    min_salary: Optional[int] = None
+    max_salary: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    position: Optional[str] = None
+
+    @classmethod
+    def from_args(cls, args: Mapping) -> Tuple['EmployeeFilter', List[str]]:
+        """Разбирает параметры запроса /employees.
+
+        Возвращает фильтр и список сообщений об исправленных ошибках ввода:
+        неверные даты отбрасываются, перепутанные границы меняются местами.
+        """
+        errors = []
+        min_salary = _parse_int(args.get('min_salary'))
+        max_salary = _parse_int(args.get('max_salary'))
+
+        start_date = _parse_date(args.get('start_date'))
+        if args.get('start_date') and start_date is None:
+            errors.append('Неверный формат начальной даты')
+        end_date = _parse_date(args.get('end_date'))
+        if args.get('end_date') and end_date is None:
+            errors.append('Неверный формат конечной даты')
+
+        # Валидация: начальная дата не может быть больше конечной
+        if start_date and end_date and start_date > end_date:
+            errors.append('Начальная дата не может быть больше конечной')
+            start_date, end_date = end_date, start_date
+
+        # Валидация: минимальная зарплата не может быть больше максимальной
+        if min_salary and max_salary and min_salary > max_salary:
+            errors.append('Минимальная зарплата не может быть больше максимальной')
+            min_salary, max_salary = max_salary, min_salary
+
+        spec = cls(
+            search=(args.get('search') or '').strip(),
+            min_salary=min_salary,
+            max_salary=max_salary,
+            start_date=start_date,
+            end_date=end_date,
+            position=args.get('position') or None
+        )
+        return spec, errors
+
+    @classmethod
+    def from_json(cls, data: Optional[Mapping]) -> 'EmployeeFilter':
+        """Разбирает фильтры из JSON (значения могут быть строками, неверные игнорируются)"""
+        data = data or {}
+        return cls(
+            search=(data.get('search') or '').strip(),
+            min_salary=_parse_int(data.get('min_salary')),
+            max_salary=_parse_int(data.get('max_salary')),
+            start_date=_parse_date(data.get('start_date')),
+            end_date=_parse_date(data.get('end_date')),
+            position=data.get('position') or None
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return self == EMPTY_FILTER
+
+    @property
+    def without_search(self) -> 'EmployeeFilter':
+        return EmployeeFilter(
+            min_salary=self.min_salary,
+            max_salary=self.max_salary,
+            start_date=self.start_date,
+            end_date=self.end_date,
+            position=self.position
+        )
+
+    def criteria(self) -> tuple:
+        """Условия WHERE по зарплате, дате приема и должности (без текстового поиска)"""
+        return _compile_criteria(self.without_search)
+
+    def apply(self, query_obj):
+        """Добавляет условия фильтра к Query или Select"""
+        criteria = self.criteria()
+        if criteria:
+            query_obj = query_obj.filter(*criteria)
+        return query_obj
+
+
+EMPTY_FILTER = EmployeeFilter()
+
+
+@lru_cache(maxsize=1024)
+def _compile_criteria(spec: EmployeeFilter) -> tuple:
+    # Значения передаются связанными параметрами, поэтому SQL одинаковой формы
+    # берется из кеша компиляции SQLAlchemy, а сами выражения - из этого кеша
+    criteria = []
+    if spec.min_salary is not None:
+        criteria.append(Employee.salary >= spec.min_salary)
+    if spec.max_salary is not None:
+        criteria.append(Employee.salary <= spec.max_salary)
+    if spec.start_date is not None:
+        criteria.append(Employee.hire_date >= spec.start_date)
+    if spec.end_date is not None:
+        criteria.append(Employee.hire_date <= spec.end_date)
+    if spec.position:
+        # Сравнение по целочисленному ключу справочника и индексу employees.position_id
+        criteria.append(Employee.position_id == (
+            select(Position.id).where(Position.name == spec.position).scalar_subquery()
+        ))
+    return tuple(criteria)
@@ -1,8 +1,20 @@
 from abc import ABC, abstractmethod
+from sqlalchemy import Integer, cast, delete, func, select, update
 from app.models import Employee
 from app import db
-from typing import List, Optional
+from app.services.name_index import employee_name_index
+from app.services.cache import employees_version
+from app.services.employee_filter import EmployeeFilter
+from app.services.hierarchy_service import HierarchyError, HierarchyService
+from app.services.search_backend import get_search_backend
+from typing import Iterable, List, Optional
 from datetime import date
+import math
+
+# Допустимое изменение зарплаты за одну массовую операцию, в процентах: снижение до нуля
+# и ниже запрещено, повышение ограничено, чтобы опечатка не умножила весь фонд
+MIN_RAISE_PERCENT = -100
+MAX_RAISE_PERCENT = 1000
 
 class IEmployeeService(ABC):
     @abstractmethod
@@ -24,8 +36,24 @@ class IEmployeeService(ABC):
     @abstractmethod
     def delete_employee(self, employee_id: int) -> bool:
         pass
+    
+    @abstractmethod
+    def raise_salary(self, spec: EmployeeFilter, percent: float) -> int:
+        pass
+    
+    @abstractmethod
+    def reassign_subordinates(self, from_id: int, to_id: Optional[int]) -> List[int]:
+        pass
+    
+    @abstractmethod
+    def delete_employees(self, employee_ids: Iterable[int]) -> List[int]:
+        pass
 
 class EmployeeService(IEmployeeService):
+    def __init__(self, hierarchy: Optional[HierarchyService] = None):
+        # Таблица замыкания иерархии обновляется в тех же транзакциях
+        self.hierarchy = hierarchy or HierarchyService()
+    
     def get_all_employees(self, page: int = 1, per_page: int = 20):
         return Employee.query.paginate(
             page=page, 
@@ -39,27 +67,166 @@ class EmployeeService(IEmployeeService):
     def update_employee(self, employee_id: int, **kwargs):
         employee = self.get_employee_by_id(employee_id)
         if employee:
+            new_boss_id = kwargs.get('boss_id')
+            if new_boss_id is not None and new_boss_id != employee.boss_id:
+                self.hierarchy.check_boss(employee.id, new_boss_id)
+            
+            old_boss_id = employee.boss_id
+            old_salary = employee.salary
             for key, value in kwargs.items():
                 if hasattr(employee, key) and value is not None:
                     setattr(employee, key, value)
+            if employee.salary != old_salary:
+                self.hierarchy.rollups.apply_salary_deltas({employee.id: employee.salary - old_salary})
+            if employee.boss_id != old_boss_id:
+                db.session.flush()
+                self.hierarchy.move_subtrees([employee.id], employee.boss_id)
+            employees_version.bump()
             db.session.commit()
+            employee_name_index.update(employee.id, employee.full_name, employee.position)
         return employee
     
     def create_employee(self, **kwargs):
         employee = Employee(**kwargs)
         db.session.add(employee)
+        db.session.flush()
+        self.hierarchy.add_nodes([employee.id])
+        employees_version.bump()
         db.session.commit()
+        employee_name_index.add(employee.id, employee.full_name, employee.position)
         return employee
     
     def delete_employee(self, employee_id: int):
-        employee = self.get_employee_by_id(employee_id)
-        if employee:
-            # Перед удалением обнуляем ссылки на этого сотрудника как руководителя
-            subordinates = Employee.query.filter_by(boss_id=employee_id).all()
-            for subordinate in subordinates:
-                subordinate.boss_id = None
-            
-            db.session.delete(employee)
-            db.session.commit()
-            return True
-        return False
\ No newline at end of file
+        return bool(self.delete_employees([employee_id]))
+    
+    def raise_salary(self, spec: EmployeeFilter, percent: float):
+        """Повышает зарплату на percent процентов всем сотрудникам под фильтром.
+        
+        Выполняется одним UPDATE; возвращает число измененных строк. Процент
+        должен быть конечным числом больше MIN_RAISE_PERCENT и не больше
+        MAX_RAISE_PERCENT, иначе ValueError.
+        """
+        if not math.isfinite(percent) or not MIN_RAISE_PERCENT < percent <= MAX_RAISE_PERCENT:
+            raise ValueError(f'Процент повышения должен быть больше {MIN_RAISE_PERCENT} и не больше {MAX_RAISE_PERCENT}')
+        factor = 1 + percent / 100
+        criteria = list(spec.criteria())
+        if spec.search:
+            matched = get_search_backend().apply(select(Employee.id), spec.search, ranked=False)
+            criteria.append(Employee.id.in_(matched.scalar_subquery()))
+        
+        # Прежние зарплаты нужны, чтобы перенести разницу в сводки руководителей.
+        # Строки берутся FOR UPDATE: иначе запись зарплаты из другой транзакции между
+        # чтением и UPDATE исказит разницу
+        locked = (
+            select(Employee.id, Employee.salary.label('old_salary'))
+            .where(*criteria)
+            .with_for_update()
+            .subquery('locked')
+        )
+        new_salary = cast(func.round(Employee.salary * factor), Integer)
+        dialect = db.session.get_bind().dialect
+        if dialect.name == 'postgresql':
+            # Блокировка, обновление и обе зарплаты - в одном UPDATE ... FROM ... RETURNING
+            # (SQLite не разрешает столбцы FROM в RETURNING)
+            rows = db.session.execute(
+                update(Employee)
+                .where(Employee.id == locked.c.id)
+                .values(salary=new_salary)
+                .returning(Employee.id, locked.c.old_salary, Employee.salary)
+                .execution_options(synchronize_session=False)
+            ).all()
+        else:
+            # Чтение под FOR UPDATE, затем UPDATE; SQLite FOR UPDATE не знает и сериализует
+            # запись блокировкой всей базы
+            old_salaries = dict(db.session.execute(select(locked.c.id, locked.c.old_salary)).all())
+            stmt = (
+                update(Employee)
+                .where(*criteria)
+                .values(salary=new_salary)
+                .execution_options(synchronize_session=False)
+            )
+            if dialect.update_returning:
+                new_salaries = db.session.execute(stmt.returning(Employee.id, Employee.salary)).all()
+            else:
+                db.session.execute(stmt)
+                new_salaries = db.session.execute(
+                    select(Employee.id, Employee.salary).where(Employee.id.in_(list(old_salaries)))
+                ).all()
+            rows = [(employee_id, old_salaries[employee_id], salary) for employee_id, salary in new_salaries]
+        
+        self.hierarchy.rollups.apply_salary_deltas({
+            employee_id: salary - old_salary for employee_id, old_salary, salary in rows
+        })
+        if rows:
+            employees_version.bump()
+        db.session.commit()
+        return len(rows)
+    
+    def reassign_subordinates(self, from_id: int, to_id: Optional[int]):
+        """Переводит всех прямых подчиненных from_id к руководителю to_id.
+        
+        to_id=None делает их сотрудниками без руководителя. Возвращает id
+        переведенных сотрудников.
+        """
+        if to_id is not None and self.get_employee_by_id(to_id) is None:
+            raise ValueError(f'Руководитель с id {to_id} не найден')
+        
+        # Сам новый руководитель может быть подчиненным from_id - его не трогаем
+        condition = Employee.boss_id == from_id
+        if to_id is not None:
+            condition &= Employee.id != to_id
+            children = db.session.execute(select(Employee.id).where(condition)).scalars().all()
+            if self.hierarchy.cyclic_roots(children, to_id):
+                raise HierarchyError('Новый руководитель находится в подчинении одного из переводимых сотрудников')
+        moved_ids = self._execute_returning_ids(
+            update(Employee).where(condition).values(boss_id=to_id), condition
+        )
+        self.hierarchy.move_subtrees(moved_ids, to_id)
+        if moved_ids:
+            employees_version.bump()
+        db.session.commit()
+        return moved_ids
+    
+    def delete_employees(self, employee_ids: Iterable[int]):
+        """Удаляет сотрудников по списку id одной транзакцией.
+        
+        Ссылки подчиненных на удаляемых руководителей обнуляются одним UPDATE.
+        Возвращает id действительно удаленных сотрудников.
+        """
+        employee_ids = sorted(set(employee_ids))
+        if not employee_ids:
+            return []
+        
+        db.session.execute(
+            update(Employee)
+            .where(Employee.boss_id.in_(employee_ids))
+            .values(boss_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        self.hierarchy.remove_nodes(employee_ids)
+        condition = Employee.id.in_(employee_ids)
+        deleted_ids = self._execute_returning_ids(delete(Employee).where(condition), condition)
+        if deleted_ids:
+            employees_version.bump()
+        db.session.commit()
+        
+        if deleted_ids:
+            for employee_id in deleted_ids:
+                employee_name_index.remove(employee_id)
+        return deleted_ids
+    
+    def _execute_returning_ids(self, stmt, condition) -> List[int]:
+        """Выполняет UPDATE/DELETE и возвращает id затронутых строк.
+        
+        Где СУБД поддерживает RETURNING, id приходят из того же запроса,
+        иначе выбираются заранее в той же транзакции.
+        """
+        dialect = db.session.get_bind().dialect
+        supported = dialect.delete_returning if stmt.is_delete else dialect.update_returning
+        stmt = stmt.execution_options(synchronize_session=False)
+        if supported:
+            return sorted(db.session.execute(stmt.returning(Employee.id)).scalars().all())
+        
+        ids = sorted(db.session.execute(select(Employee.id).where(condition)).scalars().all())
+        db.session.execute(stmt)
+        return ids
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from typing import Iterator, Optional
+from app import db
+from app.db_routing import replica_reads
+from app.services.employee_filter import EmployeeFilter
+from app.services.search_service import SearchService
+
+EXPORT_COLUMNS = ['id', 'full_name', 'position', 'hire_date', 'salary', 'boss_id', 'boss_name']
+
+# Сколько строк читается из курсора и сериализуется за один шаг
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _export_values(row) -> tuple:
+    employee_id, full_name, position, hire_date, salary, boss_id, boss_name = row
+    return employee_id, full_name, position, hire_date.isoformat(), salary, boss_id, boss_name
+
+
+class ExportService:
+    """Потоковая выгрузка отфильтрованного списка сотрудников.
+
+    Строки читаются порциями через yield_per (серверный курсор там, где он
+    поддерживается) и сразу отдаются клиенту, поэтому память не зависит от
+    объема выгрузки, а первые байты уходят до окончания чтения.
+    """
+
+    def __init__(self, search_service: Optional[SearchService] = None,
+                 chunk_size: int = EXPORT_CHUNK_SIZE):
+        self.search_service = search_service or SearchService()
+        self.chunk_size = chunk_size
+
+    @replica_reads
+    def iter_rows(self, spec: EmployeeFilter, sort_by: str = 'id', sort_order: str = 'asc'):
+        """Итератор по порциям строк (id, full_name, ..., boss_name)"""
+        stmt = self.search_service.rows_statement(spec, sort_by, sort_order)
+        result = db.session.execute(
+            stmt.execution_options(yield_per=self.chunk_size, stream_results=True)
+        )
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    def iter_csv(self, spec: EmployeeFilter, sort_by: str = 'id', sort_order: str = 'asc') -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+
+        for chunk in self.iter_rows(spec, sort_by, sort_order):
+            writer.writerows(_export_values(row) for row in chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def iter_jsonl(self, spec: EmployeeFilter, sort_by: str = 'id', sort_order: str = 'asc') -> Iterator[str]:
+        for chunk in self.iter_rows(spec, sort_by, sort_order):
+            yield ''.join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, _export_values(row))), ensure_ascii=False) + '\n'
+                for row in chunk
+            )
@@ -0,0 +1,280 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, exists, func, insert, literal, literal_column, or_, select
+from sqlalchemy.orm import aliased
+from app.models import Employee, EmployeeClosure
+from app import db
+from app.db_routing import replica_reads
+from app.services.rollup_service import RollupService
+from app.services.search_service import InvalidCursorError, KeysetPage
+import base64
+import json
+
+
+class HierarchyError(ValueError):
+    """Изменение создало бы цикл в иерархии сотрудников"""
+
+
+class IHierarchyService(ABC):
+    @abstractmethod
+    def get_subtree(self, employee_id: int, max_depth: Optional[int] = None) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def get_subtree_page(self, employee_id: int, max_depth: Optional[int] = None,
+                         cursor: Optional[str] = None, limit: int = 100) -> KeysetPage:
+        pass
+
+    @abstractmethod
+    def count_subtree(self, employee_id: int, max_depth: Optional[int] = None) -> int:
+        pass
+
+    @abstractmethod
+    def get_ancestors(self, employee_id: int) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def check_boss(self, employee_id: int, boss_id: Optional[int]):
+        pass
+
+
+class HierarchyService(IHierarchyService):
+    """Иерархия сотрудников на таблице замыкания employee_closure.
+
+    Поддерево и цепочка руководителей читаются одним запросом по индексу
+    независимо от глубины. Методы изменения не делают commit: их вызывает
+    EmployeeService внутри своей транзакции, до commit. Вместе с замыканием
+    обновляются сводки по поддеревьям (RollupService).
+    """
+
+    def __init__(self, rollups: Optional[RollupService] = None):
+        self.rollups = rollups or RollupService()
+
+    @staticmethod
+    def _subtree_criteria(employee_id: int, max_depth: Optional[int]) -> list:
+        criteria = [EmployeeClosure.ancestor_id == employee_id, EmployeeClosure.depth > 0]
+        if max_depth is not None:
+            criteria.append(EmployeeClosure.depth <= max_depth)
+        return criteria
+
+    @staticmethod
+    def _subtree_select():
+        return (
+            select(Employee.id, Employee.full_name, Employee.position,
+                   Employee.boss_id, EmployeeClosure.depth)
+            .join(EmployeeClosure, EmployeeClosure.descendant_id == Employee.id)
+            .order_by(EmployeeClosure.depth, Employee.full_name, Employee.id)
+        )
+
+    @replica_reads
+    def get_subtree(self, employee_id: int, max_depth: Optional[int] = None):
+        """Все подчиненные сотрудника на любой глубине (или до max_depth)"""
+        stmt = self._subtree_select().where(*self._subtree_criteria(employee_id, max_depth))
+        return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+    @replica_reads
+    def get_subtree_page(self, employee_id: int, max_depth: Optional[int] = None,
+                         cursor: Optional[str] = None, limit: int = 100) -> KeysetPage:
+        """Страница поддерева в порядке (глубина, ФИО, id) с курсором на следующую"""
+        stmt = self._subtree_select().where(*self._subtree_criteria(employee_id, max_depth))
+        if cursor:
+            depth, full_name, last_id = self.decode_cursor(cursor)
+            stmt = stmt.where(or_(
+                EmployeeClosure.depth > depth,
+                and_(EmployeeClosure.depth == depth, or_(
+                    Employee.full_name > full_name,
+                    and_(Employee.full_name == full_name, Employee.id > last_id)
+                ))
+            ))
+
+        # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+        rows = [dict(row._mapping) for row in db.session.execute(stmt.limit(limit + 1))]
+        items = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = self.encode_cursor(last['depth'], last['full_name'], last['id'])
+        return KeysetPage(items, next_cursor, limit)
+
+    @replica_reads
+    def count_subtree(self, employee_id: int, max_depth: Optional[int] = None) -> int:
+        """Число подчиненных сотрудника - COUNT по таблице замыкания"""
+        return db.session.execute(
+            select(func.count()).select_from(EmployeeClosure)
+            .where(*self._subtree_criteria(employee_id, max_depth))
+        ).scalar()
+
+    @staticmethod
+    def encode_cursor(depth: int, full_name: str, employee_id: int) -> str:
+        """Кодирует позицию в поддереве (глубина, ФИО, id) в непрозрачный токен"""
+        payload = json.dumps([depth, full_name, employee_id], ensure_ascii=False)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[int, str, int]:
+        """Декодирует токен курсора поддерева в (глубина, ФИО, id)"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            depth, full_name, employee_id = json.loads(
+                base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+            )
+        except (ValueError, TypeError, UnicodeError) as e:
+            raise InvalidCursorError('Некорректный курсор пагинации') from e
+        # bool - подкласс int, но в курсоре это подделка
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in (depth, employee_id)) \
+                or not isinstance(full_name, str):
+            raise InvalidCursorError('Некорректный курсор пагинации')
+        return depth, full_name, employee_id
+
+    @replica_reads
+    def get_ancestors(self, employee_id: int):
+        """Цепочка руководителей от непосредственного до верхнего"""
+        stmt = (
+            select(Employee.id, Employee.full_name, Employee.position, EmployeeClosure.depth)
+            .join(EmployeeClosure, EmployeeClosure.ancestor_id == Employee.id)
+            .where(EmployeeClosure.descendant_id == employee_id, EmployeeClosure.depth > 0)
+            .order_by(EmployeeClosure.depth)
+        )
+        return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+    def is_in_subtree(self, employee_id: int, root_id: int) -> bool:
+        """Находится ли employee_id в поддереве root_id (включая сам root_id)"""
+        return db.session.execute(
+            select(EmployeeClosure.depth)
+            .where(EmployeeClosure.ancestor_id == root_id, EmployeeClosure.descendant_id == employee_id)
+        ).first() is not None
+
+    def cyclic_roots(self, root_ids: Iterable[int], boss_id: int) -> List[int]:
+        """Те из root_ids, перенос которых под boss_id создал бы цикл.
+
+        Цикл возникает, если новый руководитель - сам сотрудник или его подчиненный
+        на любой глубине; проверка - одно чтение по первичному ключу замыкания.
+        """
+        return db.session.execute(
+            select(EmployeeClosure.ancestor_id)
+            .where(EmployeeClosure.descendant_id == boss_id,
+                   EmployeeClosure.ancestor_id.in_(list(root_ids)))
+        ).scalars().all()
+
+    def check_boss(self, employee_id: int, boss_id: Optional[int]):
+        """Проверяет, что boss_id можно назначить руководителем employee_id"""
+        if boss_id is None:
+            return
+        if boss_id == employee_id or self.is_in_subtree(boss_id, employee_id):
+            raise HierarchyError('Нельзя назначить руководителем самого сотрудника или его подчиненного')
+
+    def add_nodes(self, employee_ids: Iterable[int]):
+        """Добавляет в замыкание новых сотрудников (у них еще нет подчиненных)"""
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return
+        db.session.execute(insert(EmployeeClosure), [
+            {'ancestor_id': employee_id, 'descendant_id': employee_id, 'depth': 0}
+            for employee_id in employee_ids
+        ])
+        # Предки руководителя становятся предками нового сотрудника
+        db.session.execute(insert(EmployeeClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(EmployeeClosure.ancestor_id, Employee.id, EmployeeClosure.depth + 1)
+            .select_from(Employee)
+            .join(EmployeeClosure, EmployeeClosure.descendant_id == Employee.boss_id)
+            .where(Employee.id.in_(employee_ids))
+        ))
+        self.rollups.insert_nodes(employee_ids)
+
+    def move_subtrees(self, root_ids: Iterable[int], new_boss_id: Optional[int]):
+        """Переносит поддеревья с корнями root_ids под нового руководителя.
+
+        Корни не должны быть вложены друг в друга (например, подчиненные
+        одного руководителя).
+        """
+        root_ids = list(root_ids)
+        if not root_ids:
+            return
+        subtree = select(EmployeeClosure.descendant_id).where(EmployeeClosure.ancestor_id.in_(root_ids))
+        self.rollups.detach(root_ids)
+
+        # Обрываем связи поддеревьев с прежними руководителями
+        db.session.execute(
+            delete(EmployeeClosure)
+            .where(EmployeeClosure.descendant_id.in_(subtree.scalar_subquery()))
+            .where(EmployeeClosure.ancestor_id.not_in(subtree.scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        )
+        if new_boss_id is not None:
+            self._link_subtrees(root_ids, new_boss_id)
+        self.rollups.attach(root_ids)
+
+    def _link_subtrees(self, root_ids: List[int], new_boss_id: int):
+        # Каждый предок нового руководителя (и он сам) становится предком всего поддерева
+        up = aliased(EmployeeClosure)
+        down = aliased(EmployeeClosure)
+        db.session.execute(insert(EmployeeClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(up.ancestor_id, down.descendant_id, up.depth + down.depth + 1)
+            .select_from(up)
+            .join(down, down.ancestor_id.in_(root_ids))
+            .where(up.descendant_id == new_boss_id)
+        ))
+
+    def remove_nodes(self, employee_ids: Iterable[int]):
+        """Удаляет сотрудников из замыкания; их подчиненные становятся верхним уровнем.
+
+        Удаляется каждая пара, путь между которыми проходит через удаляемого
+        сотрудника, включая пары с ним самим.
+        """
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return
+        orphans = self.rollups.remove_nodes(employee_ids)
+
+        up = aliased(EmployeeClosure)
+        down = aliased(EmployeeClosure)
+        through_removed = (
+            select(literal(1))
+            .select_from(up)
+            .join(down, down.ancestor_id == up.descendant_id)
+            .where(
+                up.descendant_id.in_(employee_ids),
+                up.ancestor_id == EmployeeClosure.ancestor_id,
+                down.descendant_id == EmployeeClosure.descendant_id
+            )
+        )
+        db.session.execute(
+            delete(EmployeeClosure)
+            .where(exists(through_removed))
+            .execution_options(synchronize_session=False)
+        )
+        self.rollups.refresh_depths(orphans)
+
+    def rebuild(self) -> int:
+        """Пересчитывает замыкание целиком по boss_id одним рекурсивным запросом, затем сводки"""
+        db.session.execute(delete(EmployeeClosure).execution_options(synchronize_session=False))
+
+        # Глубина ограничена числом сотрудников, чтобы цикл в данных не зациклил запрос
+        limit = db.session.execute(select(func.count(Employee.id))).scalar()
+        tree = (
+            select(Employee.id.label('ancestor_id'), Employee.id.label('descendant_id'),
+                   literal_column('0').label('depth'))
+            .cte('tree', recursive=True)
+        )
+        tree = tree.union_all(
+            select(tree.c.ancestor_id, Employee.id, tree.c.depth + 1)
+            .select_from(tree)
+            .join(Employee, Employee.boss_id == tree.c.descendant_id)
+            .where(tree.c.depth < limit)
+        )
+        db.session.execute(insert(EmployeeClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(tree.c.ancestor_id, tree.c.descendant_id, func.min(tree.c.depth))
+            .group_by(tree.c.ancestor_id, tree.c.descendant_id)
+        ))
+        db.session.commit()
+        self.rollups.rebuild()
+        return db.session.execute(select(func.count()).select_from(EmployeeClosure)).scalar()
+
+    def ensure_built(self):
+        """Строит замыкание, если таблица пуста, а сотрудники уже есть"""
+        has_closure = db.session.execute(select(EmployeeClosure.ancestor_id).limit(1)).first()
+        if has_closure is None and db.session.execute(select(Employee.id).limit(1)).first():
+            self.rebuild()
@@ -0,0 +1,227 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+import pandas as pd
+from sqlalchemy import insert, select, update
+from app import db
+from app.models import Employee
+from app.services.cache import employees_version
+from app.services.hierarchy_service import HierarchyService
+from app.services.position_service import PositionService
+from app.services.name_index import employee_name_index
+
+REQUIRED_COLUMNS = ['full_name', 'position', 'hire_date', 'salary']
+OPTIONAL_COLUMNS = ['boss_id', 'ref', 'boss_ref']
+
+# Сколько строк CSV читается, проверяется и вставляется за одну транзакцию
+IMPORT_CHUNK_SIZE = 5000
+# Верхняя граница колонки salary (Integer): большее значение PostgreSQL отвергнет
+# при вставке, когда предыдущие порции уже закоммичены
+MAX_SALARY = 2 ** 31 - 1
+
+
+class ImportFormatError(ValueError):
+    """Файл импорта не удалось прочитать или в нем нет обязательных колонок"""
+
+
+class ImportReport:
+    """Итог импорта: число добавленных сотрудников, ошибки отклоненных строк
+    и предупреждения по строкам, добавленным с оговорками"""
+
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.errors: Dict[int, List[str]] = defaultdict(list)
+        self.warnings: Dict[int, List[str]] = defaultdict(list)
+
+    def add_error(self, line: int, message: str):
+        self.errors[line].append(message)
+
+    def add_warning(self, line: int, message: str):
+        self.warnings[line].append(message)
+
+    @property
+    def rejected(self) -> int:
+        return self.total - self.imported
+
+    def to_dict(self) -> dict:
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'errors': [
+                {'line': line, 'errors': messages}
+                for line, messages in sorted(self.errors.items())
+            ],
+            'warnings': [
+                {'line': line, 'warnings': messages}
+                for line, messages in sorted(self.warnings.items())
+            ]
+        }
+
+
+class ImportService:
+    """Массовая загрузка сотрудников из CSV.
+
+    Файл читается порциями через pandas, каждая порция проверяется целиком
+    (векторные маски вместо проверки строк по одной) и вставляется одним
+    executemany в своей транзакции. Руководитель задается либо boss_id уже
+    существующего сотрудника, либо boss_ref - значением колонки ref другой
+    строки того же файла; такие ссылки разрешаются после вставки всех строк.
+    """
+
+    def __init__(self, chunk_size: int = IMPORT_CHUNK_SIZE, strict_positions: bool = False,
+                 hierarchy: Optional[HierarchyService] = None):
+        self.chunk_size = chunk_size
+        self.hierarchy = hierarchy or HierarchyService()
+        self.positions = PositionService()
+        # В строгом режиме допускаются только должности, уже известные в базе
+        self.strict_positions = strict_positions
+
+    def import_csv(self, source) -> ImportReport:
+        """Импортирует сотрудников из пути к файлу или файлового объекта"""
+        report = ImportReport()
+        ref_ids: Dict[str, int] = {}
+        pending_refs: Dict[int, tuple] = {}
+        known_positions = set(self.positions.get_names()) if self.strict_positions else None
+
+        try:
+            reader = pd.read_csv(
+                source, dtype=str, keep_default_na=False,
+                skipinitialspace=True, chunksize=self.chunk_size
+            )
+            for frame in reader:
+                self._import_chunk(frame, report, ref_ids, pending_refs, known_positions)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            raise ImportFormatError(f'Не удалось прочитать CSV: {e}') from e
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self._resolve_refs(report, ref_ids, pending_refs)
+
+        if report.imported and employee_name_index.is_built:
+            employee_name_index.rebuild()
+        return report
+
+    def _import_chunk(self, frame: pd.DataFrame, report: ImportReport, ref_ids: Dict[str, int],
+                      pending_refs: Dict[int, tuple], known_positions: Optional[set]):
+        missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+        if missing:
+            raise ImportFormatError(f'В файле нет обязательных колонок: {", ".join(missing)}')
+        for column in OPTIONAL_COLUMNS:
+            if column not in frame.columns:
+                frame[column] = ''
+
+        frame = frame.apply(lambda column: column.str.strip())
+        # Номер строки в файле: индекс pandas сквозной между порциями, плюс заголовок
+        lines = frame.index + 2
+        report.total += len(frame)
+
+        hire_date = pd.to_datetime(frame['hire_date'], format='%Y-%m-%d', errors='coerce')
+        salary = pd.to_numeric(frame['salary'], errors='coerce')
+        boss_id = pd.to_numeric(frame['boss_id'], errors='coerce')
+        has_boss_id = frame['boss_id'] != ''
+        has_ref = frame['ref'] != ''
+        has_boss_ref = frame['boss_ref'] != ''
+
+        existing_bosses = self._existing_ids(boss_id[has_boss_id].dropna())
+
+        checks = [
+            (frame['full_name'] == '', 'Не указано ФИО'),
+            (frame['full_name'].str.len() > 100, 'ФИО длиннее 100 символов'),
+            (frame['position'] == '', 'Не указана должность'),
+            (frame['position'].str.len() > 50, 'Должность длиннее 50 символов'),
+            (hire_date.isna(), 'Неверная дата приема (ожидается ГГГГ-ММ-ДД)'),
+            (salary.isna() | (salary <= 0) | (salary % 1 != 0),
+             'Зарплата должна быть положительным целым числом'),
+            (salary > MAX_SALARY, f'Зарплата больше {MAX_SALARY}'),
+            (has_boss_id & ~boss_id.isin(existing_bosses), 'Руководитель с указанным boss_id не найден'),
+            (has_boss_id & has_boss_ref, 'Укажите либо boss_id, либо boss_ref'),
+            (has_ref & (frame['ref'].duplicated() | frame['ref'].isin(ref_ids)),
+             'Значение ref повторяется в файле'),
+        ]
+        if known_positions is not None:
+            checks.append((
+                (frame['position'] != '') & ~frame['position'].isin(known_positions),
+                'Неизвестная должность'
+            ))
+
+        invalid = pd.Series(False, index=frame.index)
+        for mask, message in checks:
+            invalid |= mask
+            for line in lines[mask.to_numpy()]:
+                report.add_error(int(line), message)
+
+        valid = ~invalid
+        if not valid.any():
+            return
+
+        position_ids = self.positions.ids_for(frame['position'][valid])
+        records = [
+            {
+                'full_name': full_name,
+                'position': position,
+                'position_id': position_ids[position],
+                'hire_date': hired.date(),
+                'salary': int(amount),
+                'boss_id': int(boss) if pd.notna(boss) else None
+            }
+            for full_name, position, hired, amount, boss in zip(
+                frame['full_name'][valid], frame['position'][valid],
+                hire_date[valid], salary[valid], boss_id[valid]
+            )
+        ]
+
+        new_ids = db.session.execute(
+            insert(Employee).returning(Employee.id, sort_by_parameter_order=True),
+            records
+        ).scalars().all()
+        self.hierarchy.add_nodes(new_ids)
+        if new_ids:
+            employees_version.bump()
+        db.session.commit()
+        report.imported += len(new_ids)
+
+        for employee_id, line, ref, boss_ref in zip(
+                new_ids, lines[valid.to_numpy()], frame['ref'][valid], frame['boss_ref'][valid]):
+            if ref:
+                ref_ids[ref] = employee_id
+            if boss_ref:
+                pending_refs[employee_id] = (int(line), boss_ref)
+
+    def _existing_ids(self, ids: Iterable[float]) -> List[int]:
+        ids = sorted({int(value) for value in ids if value % 1 == 0})
+        if not ids:
+            return []
+        return db.session.execute(
+            select(Employee.id).where(Employee.id.in_(ids))
+        ).scalars().all()
+
+    def _resolve_refs(self, report: ImportReport, ref_ids: Dict[str, int], pending_refs: Dict[int, tuple]):
+        # Ссылки boss_ref разрешаются в конце: руководитель может стоять в файле
+        # ниже подчиненного или в другой порции
+        subordinates = defaultdict(list)
+        lines = {}
+        for employee_id, (line, boss_ref) in pending_refs.items():
+            boss_id = ref_ids.get(boss_ref)
+            if boss_id is None:
+                report.add_warning(line, f'Руководитель "{boss_ref}" не импортирован, сотрудник добавлен без руководителя')
+            else:
+                subordinates[boss_id].append(employee_id)
+                lines[employee_id] = line
+
+        updates = []
+        for boss_id, employee_ids in subordinates.items():
+            # Ссылки по кругу (A -> B -> A) отсекаются по таблице замыкания перед каждым переносом
+            cyclic = set(self.hierarchy.cyclic_roots(employee_ids, boss_id))
+            for employee_id in cyclic:
+                report.add_warning(lines[employee_id], 'Ссылки на руководителей образуют цикл, сотрудник добавлен без руководителя')
+            employee_ids = [employee_id for employee_id in employee_ids if employee_id not in cyclic]
+            self.hierarchy.move_subtrees(employee_ids, boss_id)
+            updates.extend({'id': employee_id, 'boss_id': boss_id} for employee_id in employee_ids)
+
+        if updates:
+            db.session.execute(update(Employee), updates)
+            employees_version.bump()
+            db.session.commit()
@@ -0,0 +1,170 @@
+"""Ограничение неудачных попыток входа скользящим окном по IP и по имени пользователя.
+
+Попытки считаются по событиям FAILED_LOGIN журнала авторизации. Если за
+последние window секунд с адреса или для имени было limit неудачных
+попыток, вход отклоняется до запроса пользователя и проверки пароля,
+поэтому перебор не тратит время bcrypt. Успешный вход сбрасывает счетчик
+имени пользователя, счетчик адреса истекает сам.
+
+Счетчики хранятся в памяти процесса или, для нескольких процессов на одной
+машине, в общем файле SQLite (LOGIN_THROTTLE_DB). Адрес клиента - request.remote_addr:
+за обратным прокси его дает ProxyFix (TRUSTED_PROXY_COUNT), иначе все клиенты
+делят один счетчик адреса прокси.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryThrottleBackend:
+    """Последние limit попыток каждого ключа; давно не использованные ключи вытесняются"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key: str, now: float, limit: int, window: float):
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None or attempts.maxlen != limit:
+                attempts = self._attempts[key] = deque(attempts or (), maxlen=limit)
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+
+    def retry_after(self, key: str, now: float, limit: int, window: float) -> float:
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if not attempts:
+                return 0.0
+            if attempts[-1] <= now - window:
+                del self._attempts[key]
+                return 0.0
+            if len(attempts) < limit:
+                return 0.0
+            # Самая старая из limit последних попыток: пока она в окне, лимит исчерпан
+            return max(0.0, attempts[-limit] + window - now)
+
+    def clear(self, key: str):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+
+class SqliteThrottleBackend:
+    """Попытки в общем файле SQLite: одни счетчики для всех процессов машины"""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._added = 0
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS login_attempts (key TEXT NOT NULL, at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_login_attempts_key_at ON login_attempts (key, at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение на поток; после fork - новое
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, key: str, now: float, limit: int, window: float):
+        connection = self._connection()
+        connection.execute('INSERT INTO login_attempts (key, at) VALUES (?, ?)', (key, now))
+        self._added += 1
+        if self._added % self.PRUNE_EVERY == 0:
+            connection.execute('DELETE FROM login_attempts WHERE at <= ?', (now - window,))
+
+    def retry_after(self, key: str, now: float, limit: int, window: float) -> float:
+        row = self._connection().execute(
+            'SELECT at FROM login_attempts WHERE key = ? AND at > ? ORDER BY at DESC LIMIT 1 OFFSET ?',
+            (key, now - window, limit - 1)
+        ).fetchone()
+        return max(0.0, row[0] + window - now) if row else 0.0
+
+    def clear(self, key: str):
+        self._connection().execute('DELETE FROM login_attempts WHERE key = ?', (key,))
+
+
+def throttle_backend(path: Optional[str] = None):
+    """Общий SQLite-файл, если задан путь, иначе счетчики в памяти процесса"""
+    return SqliteThrottleBackend(path) if path else MemoryThrottleBackend()
+
+
+class LoginThrottle:
+    def __init__(self, ip_limit: int = 20, user_limit: int = 5, window: float = 300.0, backend=None):
+        self.limits = {'ip': ip_limit, 'user': user_limit}
+        self.window = window
+        self.backend = backend or MemoryThrottleBackend()
+        self.rejected = {'ip': 0, 'user': 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(ip_address: Optional[str], username: Optional[str]) -> dict:
+        return {
+            'ip': f'ip:{ip_address}' if ip_address else None,
+            'user': f'user:{username.strip().lower()}' if username else None,
+        }
+
+    def check(self, ip_address: Optional[str], username: Optional[str]) -> float:
+        """Сколько секунд ждать до следующей попытки; 0 - вход разрешен"""
+        now = time.time()
+        for scope, key in self._keys(ip_address, username).items():
+            limit = self.limits[scope]
+            if not key or limit <= 0:
+                continue
+            try:
+                wait = self.backend.retry_after(key, now, limit, self.window)
+            except sqlite3.Error:
+                # Недоступное хранилище не должно закрывать вход всем
+                logger.exception('Не удалось проверить ограничение входа')
+                return 0.0
+            if wait > 0:
+                with self._lock:
+                    self.rejected[scope] += 1
+                return wait
+        return 0.0
+
+    def record_failure(self, ip_address: Optional[str], username: Optional[str]):
+        now = time.time()
+        for scope, key in self._keys(ip_address, username).items():
+            limit = self.limits[scope]
+            if not key or limit <= 0:
+                continue
+            try:
+                self.backend.add(key, now, limit, self.window)
+            except sqlite3.Error:
+                logger.exception('Не удалось учесть неудачную попытку входа')
+
+    def reset(self, username: str):
+        key = self._keys(None, username)['user']
+        if key:
+            try:
+                self.backend.clear(key)
+            except sqlite3.Error:
+                logger.exception('Не удалось сбросить счетчик попыток входа')
+
+    def record_event(self, action: str, username: Optional[str], ip_address: Optional[str]):
+        """Слушатель событий журнала авторизации"""
+        if action == 'FAILED_LOGIN':
+            self.record_failure(ip_address, username)
+        elif action == 'LOGIN':
+            self.reset(username)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rejected = dict(self.rejected)
+        return {'limits': dict(self.limits), 'window': self.window, 'rejected': rejected}
@@ -0,0 +1,149 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
+from sqlalchemy import select
+from app.models import Employee
+from app import db
+from app.services.cache import employees_version
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(full_name: str) -> List[str]:
+    """Разбивает ФИО на токены (фамилия, имя, отчество) в нижнем регистре"""
+    return _TOKEN_RE.findall((full_name or '').lower().replace('ё', 'е'))
+
+
+class EmployeeNameIndex:
+    """Префиксный индекс по ФИО сотрудников в памяти процесса.
+
+    Хранит отсортированный список пар (токен, id): все токены с заданным
+    префиксом лежат в нем подряд и находятся двоичным поиском. Индекс строится
+    из базы и дальше поддерживается инкрементально из EmployeeService.
+
+    Записи других процессов сюда не попадают, поэтому вместе с индексом
+    хранится версия таблицы employees на момент построения: если при поиске
+    текущая версия другая, индекс строится заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Tuple[str, str]] = {}
+        self._tokens: List[Tuple[str, int]] = []
+        self._built = False
+        self._version = None
+
+    @property
+    def is_built(self) -> bool:
+        return self._built
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self, rows=None):
+        """Строит индекс заново из строк (id, full_name, position) или из базы.
+
+        Индекс из переданных строк не сверяется с версией таблицы.
+        """
+        version = None
+        if rows is None:
+            # Версия читается до строк: запись между ними вызовет лишнее перестроение, а не пропуск
+            version = employees_version.value
+            rows = db.session.execute(
+                select(Employee.id, Employee.full_name, Employee.position)
+                .execution_options(yield_per=10000)
+            )
+
+        entries = {}
+        tokens = []
+        for employee_id, full_name, position in rows:
+            entries[employee_id] = (full_name, position)
+            tokens.extend((token, employee_id) for token in set(tokenize(full_name)))
+        tokens.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._tokens = tokens
+            self._built = True
+            self._version = version
+
+    def _is_stale(self) -> bool:
+        return not self._built or (self._version is not None and self._version != employees_version.value)
+
+    def ensure_built(self):
+        """Строит индекс, если он еще не построен или отстал от таблицы employees"""
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self.rebuild()
+
+    def add(self, employee_id: int, full_name: str, position: str):
+        """Добавляет сотрудника в индекс (если индекс уже построен)"""
+        with self._lock:
+            if not self._built:
+                return
+            if employee_id in self._entries:
+                self._remove_tokens(employee_id)
+            self._entries[employee_id] = (full_name, position)
+            for token in set(tokenize(full_name)):
+                insort(self._tokens, (token, employee_id))
+
+    def update(self, employee_id: int, full_name: str, position: str):
+        self.add(employee_id, full_name, position)
+
+    def remove(self, employee_id: int):
+        with self._lock:
+            if not self._built or employee_id not in self._entries:
+                return
+            self._remove_tokens(employee_id)
+            del self._entries[employee_id]
+
+    def _remove_tokens(self, employee_id: int):
+        full_name, _ = self._entries[employee_id]
+        for token in set(tokenize(full_name)):
+            pos = bisect_left(self._tokens, (token, employee_id))
+            if pos < len(self._tokens) and self._tokens[pos] == (token, employee_id):
+                del self._tokens[pos]
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """Ищет сотрудников, у которых каждый токен запроса - префикс одного из токенов ФИО"""
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        self.ensure_built()
+        # Перебираем диапазон самого длинного (самого избирательного) токена,
+        # остальные проверяем по токенам найденного сотрудника
+        lead = max(query_tokens, key=len)
+        rest = list(query_tokens)
+        rest.remove(lead)
+
+        results = []
+        seen = set()
+        with self._lock:
+            pos = bisect_left(self._tokens, (lead,))
+            while pos < len(self._tokens) and len(results) < limit:
+                token, employee_id = self._tokens[pos]
+                if not token.startswith(lead):
+                    break
+                pos += 1
+                if employee_id in seen:
+                    continue
+                seen.add(employee_id)
+
+                full_name, position = self._entries[employee_id]
+                if rest:
+                    name_tokens = tokenize(full_name)
+                    if not all(any(t.startswith(q) for t in name_tokens) for q in rest):
+                        continue
+                results.append({
+                    'id': employee_id,
+                    'full_name': full_name,
+                    'position': position
+                })
+        return results
+
+
+# Индекс процесса, общий для всех запросов
+employee_name_index = EmployeeNameIndex()
@@ -0,0 +1,95 @@
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, insert, inspect, select, text, update
+from app.models import Employee, Position, insert_positions
+from app.services.cache import LRUCache, employees_version
+from app import db
+from app.db_routing import replica_reads
+
+# Список должностей для форм и /api/positions; ключ - версия таблицы employees
+position_list_cache = LRUCache(maxsize=8, ttl=60)
+
+
+class PositionService:
+    """Справочник должностей.
+
+    Список для выпадающих меню читается из кеша процесса и сбрасывается при
+    любой записи в employees (через версию таблицы). Группировки по должности
+    выполняются по целочисленному position_id.
+    """
+
+    def __init__(self, cache: Optional[LRUCache] = None):
+        self.cache = cache if cache is not None else position_list_cache
+
+    def get_names(self) -> List[str]:
+        key = employees_version.value
+        names = self.cache.get(key)
+        if names is None:
+            names = Employee.get_unique_positions()
+            self.cache.set(key, names)
+        return list(names)
+
+    def ids_for(self, names: Iterable[str]) -> Dict[str, int]:
+        """id должностей по названиям; недостающие добавляются в справочник одним INSERT"""
+        names = set(names)
+        if not names:
+            return {}
+        ids = dict(db.session.execute(
+            select(Position.name, Position.id).where(Position.name.in_(names))
+        ).all())
+        missing = sorted(names - ids.keys())
+        if missing:
+            insert_positions(db.session.connection(), missing)
+            ids.update(db.session.execute(
+                select(Position.name, Position.id).where(Position.name.in_(missing))
+            ).all())
+        return ids
+
+    @replica_reads
+    def headcount_by_position(self, spec=None) -> List[dict]:
+        """Численность и средняя зарплата по должностям (группировка по position_id)"""
+        stmt = (
+            select(Employee.position_id,
+                   func.count(Employee.id).label('headcount'),
+                   func.avg(Employee.salary).label('avg_salary'))
+            .group_by(Employee.position_id)
+        )
+        if spec is not None:
+            stmt = spec.apply(stmt)
+        grouped = stmt.subquery()
+        rows = db.session.execute(
+            select(Position.name, grouped.c.headcount, grouped.c.avg_salary)
+            .join(grouped, grouped.c.position_id == Position.id)
+            .order_by(grouped.c.headcount.desc(), Position.name)
+        )
+        return [
+            {'position': name, 'headcount': headcount, 'avg_salary': round(float(avg_salary), 2)}
+            for name, headcount, avg_salary in rows
+        ]
+
+
+def migrate_positions(connection) -> int:
+    """Переводит существующую базу на справочник должностей.
+
+    Создает таблицу positions и колонку employees.position_id, если их нет,
+    и заполняет их по текстовой колонке. Повторный запуск безопасен;
+    возвращает число заполненных сотрудников. Индекс по position_id
+    создает миграция индексов (app/migrations.py).
+    """
+    Position.__table__.create(connection, checkfirst=True)
+
+    columns = {column['name'] for column in inspect(connection).get_columns('employees')}
+    if 'position_id' not in columns:
+        connection.execute(text(
+            'ALTER TABLE employees ADD COLUMN position_id INTEGER REFERENCES positions (id)'
+        ))
+    connection.execute(insert(Position).from_select(
+        ['name'],
+        select(Employee.position).distinct()
+        .where(Employee.position.is_not(None), Employee.position.not_in(select(Position.name)))
+    ))
+    result = connection.execute(
+        update(Employee)
+        .where(Employee.position_id.is_(None))
+        .values(position_id=select(Position.id).where(Position.name == Employee.position).scalar_subquery())
+    )
+    return result.rowcount
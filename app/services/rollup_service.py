@@ -0,0 +1,224 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, delete, exists, func, insert, literal_column, select, update
+from sqlalchemy.orm import aliased
+from app.models import Employee, EmployeeClosure, EmployeeRollup
+from app import db
+from app.db_routing import replica_reads
+
+# Размер пачки строк при записи пересчитанных сводок
+ROLLUP_WRITE_BATCH = 10000
+
+
+class RollupService:
+    """Сводки по поддеревьям: численность, фонд зарплаты и уровень сотрудника.
+
+    Сводки меняются приращениями только вдоль затронутых цепочек руководителей,
+    которые берутся из таблицы замыкания. Методы не делают commit и вызываются
+    HierarchyService и EmployeeService внутри их транзакций.
+    """
+
+    @replica_reads
+    def get_rollup(self, employee_id: int) -> Optional[dict]:
+        rollup = db.session.get(EmployeeRollup, employee_id)
+        return rollup.to_dict() if rollup else None
+
+    def insert_nodes(self, employee_ids: List[int]):
+        """Заводит сводки новых сотрудников без подчиненных и прибавляет их к руководителям.
+
+        Вызывается после того, как сотрудники добавлены в замыкание.
+        """
+        ancestors = (
+            select(func.count())
+            .where(EmployeeClosure.descendant_id == Employee.id, EmployeeClosure.depth > 0)
+            .scalar_subquery()
+        )
+        db.session.execute(insert(EmployeeRollup).from_select(
+            ['employee_id', 'headcount', 'salary_total', 'depth'],
+            select(Employee.id, literal_column('1'), Employee.salary, ancestors).where(Employee.id.in_(employee_ids))
+        ))
+        self._shift_ancestors(employee_ids, 1)
+
+    def detach(self, root_ids: List[int]):
+        """Вычитает поддеревья root_ids из сводок их текущих руководителей (до переноса)"""
+        self._shift_ancestors(root_ids, -1)
+
+    def attach(self, root_ids: List[int]):
+        """Прибавляет поддеревья root_ids к новым руководителям и пересчитывает уровни (после переноса)"""
+        self._shift_ancestors(root_ids, 1)
+        self._refresh_depths(root_ids)
+
+    def remove_nodes(self, employee_ids: List[int]) -> List[int]:
+        """Вычитает удаляемых сотрудников из сводок руководителей и удаляет их сводки.
+
+        Вызывается до изменения замыкания; возвращает оставшихся подчиненных,
+        чьи уровни нужно пересчитать через refresh_depths после него.
+        """
+        orphans = db.session.execute(
+            select(EmployeeClosure.descendant_id.distinct())
+            .where(EmployeeClosure.ancestor_id.in_(employee_ids),
+                   EmployeeClosure.descendant_id.not_in(employee_ids))
+        ).scalars().all()
+
+        self._shift_ancestors(employee_ids, -1)
+        db.session.execute(
+            delete(EmployeeRollup)
+            .where(EmployeeRollup.employee_id.in_(employee_ids))
+            .execution_options(synchronize_session=False)
+        )
+        return orphans
+
+    def apply_salary_deltas(self, deltas: Dict[int, int]):
+        """Переносит изменения зарплат {id: разница} на сотрудников и всех их руководителей"""
+        deltas = {employee_id: delta for employee_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        totals = defaultdict(int)
+        rows = db.session.execute(
+            select(EmployeeClosure.ancestor_id, EmployeeClosure.descendant_id)
+            .where(EmployeeClosure.descendant_id.in_(list(deltas)))
+        )
+        for ancestor_id, descendant_id in rows:
+            totals[ancestor_id] += deltas[descendant_id]
+
+        rollups = EmployeeRollup.__table__
+        db.session.execute(
+            update(rollups)
+            .where(rollups.c.employee_id == bindparam('ancestor_id'))
+            .values(salary_total=rollups.c.salary_total + bindparam('delta')),
+            [{'ancestor_id': ancestor_id, 'delta': delta} for ancestor_id, delta in totals.items()]
+        )
+
+    def refresh_depths(self, employee_ids: Iterable[int]):
+        """Пересчитывает уровень сотрудников по числу их руководителей в замыкании"""
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return
+        ancestors = (
+            select(func.count())
+            .where(EmployeeClosure.descendant_id == EmployeeRollup.employee_id, EmployeeClosure.depth > 0)
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(EmployeeRollup)
+            .where(EmployeeRollup.employee_id.in_(employee_ids))
+            .values(depth=ancestors)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _refresh_depths(self, root_ids: List[int]):
+        subtree = select(EmployeeClosure.descendant_id).where(EmployeeClosure.ancestor_id.in_(root_ids))
+        self.refresh_depths(db.session.execute(subtree).scalars().all())
+
+    def _shift_ancestors(self, node_ids: List[int], sign: int):
+        """Прибавляет (sign=1) или вычитает (sign=-1) сводки node_ids у их руководителей.
+
+        Каждому руководителю учитываются только ближайшие к нему узлы из node_ids:
+        поддерево вложенного узла уже входит в сводку узла выше.
+        """
+        if not node_ids:
+            return
+        closure = aliased(EmployeeClosure)
+        node = aliased(EmployeeRollup)
+        upper = aliased(EmployeeClosure)
+        lower = aliased(EmployeeClosure)
+        # Между руководителем и узлом нет другого узла из node_ids
+        nested = (
+            select(upper.ancestor_id)
+            .join(lower, lower.ancestor_id == upper.descendant_id)
+            .where(
+                upper.ancestor_id == closure.ancestor_id,
+                lower.descendant_id == closure.descendant_id,
+                upper.descendant_id.in_(node_ids),
+                upper.depth > 0,
+                lower.depth > 0
+            )
+        )
+
+        def node_sum(column):
+            return (
+                select(func.coalesce(func.sum(column), 0))
+                .select_from(closure)
+                .join(node, node.employee_id == closure.descendant_id)
+                .where(
+                    closure.ancestor_id == EmployeeRollup.employee_id,
+                    closure.depth > 0,
+                    closure.descendant_id.in_(node_ids),
+                    ~exists(nested)
+                )
+                .scalar_subquery()
+            )
+
+        ancestors = (
+            select(EmployeeClosure.ancestor_id)
+            .where(EmployeeClosure.descendant_id.in_(node_ids), EmployeeClosure.depth > 0)
+        )
+        db.session.execute(
+            update(EmployeeRollup)
+            .where(
+                EmployeeRollup.employee_id.in_(ancestors.scalar_subquery()),
+                EmployeeRollup.employee_id.not_in(node_ids)
+            )
+            .values(
+                headcount=EmployeeRollup.headcount + sign * node_sum(node.headcount),
+                salary_total=EmployeeRollup.salary_total + sign * node_sum(node.salary_total)
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def rebuild(self, batch_size: int = ROLLUP_WRITE_BATCH) -> int:
+        """Пересчитывает все сводки за один проход в памяти, O(n) по числу сотрудников.
+
+        Сотрудники упорядочиваются обходом в ширину от верхнего уровня, после чего
+        численность и фонд зарплаты суммируются снизу вверх в обратном порядке.
+        """
+        ids = []
+        bosses = []
+        headcount = []
+        salary_total = []
+        for employee_id, boss_id, salary in db.session.execute(
+                select(Employee.id, Employee.boss_id, Employee.salary).execution_options(yield_per=batch_size)):
+            ids.append(employee_id)
+            bosses.append(boss_id)
+            headcount.append(1)
+            salary_total.append(salary)
+
+        position = {employee_id: index for index, employee_id in enumerate(ids)}
+        parent = [position.get(boss_id, -1) if boss_id is not None else -1 for boss_id in bosses]
+        children = [[] for _ in ids]
+        order = []
+        for index, boss_index in enumerate(parent):
+            if boss_index < 0:
+                order.append(index)
+            else:
+                children[boss_index].append(index)
+
+        depth = [0] * len(ids)
+        for index in order:
+            for child in children[index]:
+                depth[child] = depth[index] + 1
+                order.append(child)
+
+        # Узлы вне обхода (цикл в boss_id) остаются со сводкой только по себе
+        for index in reversed(order):
+            boss_index = parent[index]
+            if boss_index >= 0:
+                headcount[boss_index] += headcount[index]
+                salary_total[boss_index] += salary_total[index]
+
+        db.session.execute(delete(EmployeeRollup).execution_options(synchronize_session=False))
+        rows = []
+        for index, employee_id in enumerate(ids):
+            rows.append({
+                'employee_id': employee_id,
+                'headcount': headcount[index],
+                'salary_total': salary_total[index],
+                'depth': depth[index]
+            })
+            if len(rows) >= batch_size:
+                db.session.execute(insert(EmployeeRollup), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(EmployeeRollup), rows)
+        db.session.commit()
+        return len(ids)
@@ -0,0 +1,204 @@
+from abc import ABC, abstractmethod
+from app.models import Employee
+from app import db
+from typing import Optional
+from sqlalchemy import event, func, literal_column, or_, select, table, column, text
+
+# Полнотекстовый индекс SQLite: внешняя FTS5-таблица над employees,
+# синхронизируемая триггерами. Токенизатор trigram сохраняет семантику
+# поиска подстроки, как у ilike('%q%').
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5("
+    "full_name, position, content='employees', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS employees_fts_ai AFTER INSERT ON employees BEGIN "
+    "INSERT INTO employees_fts(rowid, full_name, position) "
+    "VALUES (new.id, new.full_name, new.position); END",
+    "CREATE TRIGGER IF NOT EXISTS employees_fts_ad AFTER DELETE ON employees BEGIN "
+    "INSERT INTO employees_fts(employees_fts, rowid, full_name, position) "
+    "VALUES ('delete', old.id, old.full_name, old.position); END",
+    "CREATE TRIGGER IF NOT EXISTS employees_fts_au AFTER UPDATE OF full_name, position ON employees BEGIN "
+    "INSERT INTO employees_fts(employees_fts, rowid, full_name, position) "
+    "VALUES ('delete', old.id, old.full_name, old.position); "
+    "INSERT INTO employees_fts(rowid, full_name, position) "
+    "VALUES (new.id, new.full_name, new.position); END",
+    "INSERT INTO employees_fts(employees_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP_DDL = [
+    "DROP TABLE IF EXISTS employees_fts",
+]
+
+# Триграммные GIN-индексы PostgreSQL ускоряют ILIKE '%q%' и similarity()
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_employees_full_name_trgm "
+    "ON employees USING gin (full_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_employees_position_trgm "
+    "ON employees USING gin (position gin_trgm_ops)",
+]
+
+# Минимальная длина запроса для триграммного индекса
+MIN_TRIGRAM_QUERY = 3
+
+employees_fts = table('employees_fts', column('rowid'), column('rank'))
+
+
+def _sqlite_fts_supported(connection) -> bool:
+    try:
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')"
+        )
+        connection.exec_driver_sql("DROP TABLE temp.fts_probe")
+        return True
+    except Exception:
+        return False
+
+
+def _postgres_trgm_available(connection) -> bool:
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).first() is not None
+
+
+def _create_search_index(target, connection, **kw):
+    install_search_index(connection)
+
+
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_DROP_DDL:
+            connection.exec_driver_sql(statement)
+
+
+# Индекс создается вместе с таблицей employees (db.create_all)
+event.listen(Employee.__table__, 'after_create', _create_search_index)
+event.listen(Employee.__table__, 'before_drop', _drop_search_index)
+
+
+def _install_postgres_trgm(connection) -> bool:
+    # pg_available_extensions не говорит о правах: у роли без CREATE EXTENSION
+    # DDL падает, и без точки сохранения вместе с ним откатился бы db.create_all()
+    savepoint = connection.begin_nested()
+    try:
+        for statement in POSTGRES_TRGM_DDL:
+            connection.exec_driver_sql(statement)
+    except Exception:
+        savepoint.rollback()
+        return False
+    savepoint.commit()
+    return True
+
+
+def install_search_index(connection) -> bool:
+    """Создает поисковый индекс для текущей СУБД. Возвращает True при успехе.
+
+    Если индекс создать нельзя (нет FTS5 или прав на pg_trgm), он пропускается
+    и поиск идет через IlikeSearchBackend.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite' and _sqlite_fts_supported(connection):
+        for statement in SQLITE_FTS_DDL:
+            connection.exec_driver_sql(statement)
+        return True
+    if dialect == 'postgresql' and _postgres_trgm_available(connection):
+        return _install_postgres_trgm(connection)
+    return False
+
+
+class ISearchBackend(ABC):
+    name = None
+
+    @abstractmethod
+    def apply(self, query_obj, query: str, ranked: bool = True):
+        """Добавляет к запросу фильтр по тексту и, если ranked, сортировку по релевантности"""
+        pass
+
+
+class IlikeSearchBackend(ISearchBackend):
+    """Поиск подстроки через ilike - работает везде, но без индекса"""
+    name = 'ilike'
+
+    def apply(self, query_obj, query: str, ranked: bool = True):
+        return query_obj.filter(or_(
+            Employee.full_name.ilike(f'%{query}%'),
+            Employee.position.ilike(f'%{query}%')
+        ))
+
+
+class SqliteFtsSearchBackend(ISearchBackend):
+    """Поиск через FTS5-таблицу employees_fts с ранжированием bm25 (rank)"""
+    name = 'sqlite_fts5'
+
+    def __init__(self, fallback: Optional[ISearchBackend] = None):
+        self.fallback = fallback or IlikeSearchBackend()
+
+    def apply(self, query_obj, query: str, ranked: bool = True):
+        if len(query.strip()) < MIN_TRIGRAM_QUERY:
+            return self.fallback.apply(query_obj, query, ranked)
+
+        # Запрос передается как фраза, чтобы операторы FTS5 не интерпретировались.
+        # Совпадения выбираются в подзапросе: ранг bm25 нельзя вычислять в одном
+        # SELECT с оконными функциями (COUNT(*) OVER () при подсчете страниц)
+        phrase = '"' + query.replace('"', '""') + '"'
+        matches = select(
+            employees_fts.c.rowid, employees_fts.c.rank
+        ).where(literal_column('employees_fts').op('MATCH')(phrase)).subquery('fts_matches')
+        query_obj = query_obj.join(matches, matches.c.rowid == Employee.id)
+
+        if ranked:
+            query_obj = query_obj.order_by(matches.c.rank, Employee.id)
+        return query_obj
+
+
+class PostgresTrigramSearchBackend(ISearchBackend):
+    """ilike по триграммным GIN-индексам с ранжированием similarity()"""
+    name = 'postgres_trgm'
+
+    def __init__(self, fallback: Optional[ISearchBackend] = None):
+        self.fallback = fallback or IlikeSearchBackend()
+
+    def apply(self, query_obj, query: str, ranked: bool = True):
+        query_obj = self.fallback.apply(query_obj, query, ranked)
+        if ranked:
+            relevance = func.greatest(
+                func.similarity(Employee.full_name, query),
+                func.similarity(Employee.position, query)
+            )
+            query_obj = query_obj.order_by(relevance.desc(), Employee.id)
+        return query_obj
+
+
+_backends = {}
+
+
+def _detect_backend(connection) -> ISearchBackend:
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        installed = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employees_fts'"
+        )).first()
+        if installed:
+            return SqliteFtsSearchBackend()
+    elif dialect == 'postgresql':
+        installed = connection.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_employees_full_name_trgm'"
+        )).first()
+        if installed:
+            return PostgresTrigramSearchBackend()
+    return IlikeSearchBackend()
+
+
+def get_search_backend() -> ISearchBackend:
+    """Возвращает бэкенд поиска для текущей базы (определяется один раз на engine)"""
+    engine = db.engine
+    backend = _backends.get(engine)
+    if backend is None:
+        with engine.connect() as connection:
+            backend = _detect_backend(connection)
+        _backends[engine] = backend
+    return backend
+
+
+def reset_search_backend():
+    """Сбрасывает кеш выбранных бэкендов (например, после install_search_index)"""
+    _backends.clear()
@@ -1,8 +1,128 @@
 from abc import ABC, abstractmethod
 from app.models import Employee
+from app import db
+from app.services.search_backend import ISearchBackend, get_search_backend
+from app.services.cache import LRUCache, employees_version
+from app.services.employee_filter import EmployeeFilter
+from app.db_routing import reads_from_replica, replica_reads
+from flask import current_app
+from flask_sqlalchemy.pagination import SelectPagination
 from typing import List, Tuple, Optional
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, select, func, text
+from sqlalchemy.orm import aliased
 from datetime import datetime, date
+from functools import lru_cache
+import base64
+import json
+
+# Столбцы, по которым разрешена сортировка в списке сотрудников
+SORTABLE_COLUMNS = ('id', 'full_name', 'position', 'hire_date', 'salary')
+
+# Общее количество сотрудников по сигнатуре фильтра; ключ включает версию таблицы
+employee_count_cache = LRUCache(maxsize=1024, ttl=60)
+
+# Готовые страницы списка сотрудников по полной сигнатуре запроса
+employee_page_cache = LRUCache(maxsize=512, ttl=60)
+
+
+class EmployeeRow:
+    """Строка списка сотрудников только для чтения.
+
+    В отличие от экземпляров Employee не отслеживается сессией и не имеет
+    ленивых связей: имя руководителя приходит в том же запросе.
+    """
+    __slots__ = ('boss_id', 'boss_name', 'full_name', 'hire_date', 'id', 'position', 'salary')
+
+    def __init__(self, id, full_name, position, hire_date, salary, boss_id, boss_name):
+        self.id = id
+        self.full_name = full_name
+        self.position = position
+        self.hire_date = hire_date
+        self.salary = salary
+        self.boss_id = boss_id
+        self.boss_name = boss_name
+
+    def __repr__(self):
+        return f'<EmployeeRow {self.full_name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'full_name': self.full_name,
+            'position': self.position,
+            'hire_date': self.hire_date.isoformat(),
+            'salary': self.salary,
+            'boss_name': self.boss_name,
+            'boss_id': self.boss_id
+        }
+
+
+class EmployeeRowPagination(SelectPagination):
+    """Постраничная выборка проекции сотрудников в объекты EmployeeRow.
+
+    Если общее количество известно заранее (аргумент total), отдельный
+    COUNT(*) не выполняется. Иначе оно берется из COUNT(*) OVER () в той же
+    выборке, что и страница; отдельный запрос нужен только для пустой страницы.
+    Страница из кеша передается готовой (аргумент items) без обращения к базе.
+    """
+
+    def _query_items(self) -> List[EmployeeRow]:
+        if 'items' in self._query_args:
+            self._window_total = None
+            return self._query_args['items']
+
+        stmt = self._query_args['select']
+        window = self._query_args.get('total') is None
+        if window:
+            stmt = stmt.add_columns(func.count().over().label('total_count'))
+        stmt = stmt.limit(self.per_page).offset(self._query_offset)
+        rows = self._query_args['session'].execute(stmt).all()
+
+        self._window_total = None
+        if window:
+            if rows:
+                self._window_total = rows[0][-1]
+            rows = [row[:-1] for row in rows]
+        return [EmployeeRow(*row) for row in rows]
+
+    def _query_count(self) -> int:
+        if self._query_args.get('total') is not None:
+            return self._query_args['total']
+        if self._window_total is not None:
+            return self._window_total
+        return super()._query_count()
+
+
+def _is_int(value) -> bool:
+    # bool - подкласс int, но в курсоре это подделка
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Допустимый тип значения курсора для каждого столбца сортировки (hire_date - ISO-дата)
+_CURSOR_VALUE_CHECKS = {
+    'id': _is_int,
+    'salary': _is_int,
+    'full_name': lambda value: isinstance(value, str),
+    'position': lambda value: isinstance(value, str),
+}
+
+
+class InvalidCursorError(ValueError):
+    """Курсор пагинации поврежден или не соответствует сортировке"""
+
+
+class KeysetPage:
+    """Страница результатов при курсорной (keyset) пагинации"""
+
+    def __init__(self, items, next_cursor: Optional[str], per_page: int):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
 
 class ISearchService(ABC):
     @abstractmethod
@@ -21,35 +141,60 @@ class ISearchService(ABC):
                            end_date: Optional[date] = None) -> List[Employee]:
         pass
 
+    @abstractmethod
+    def list_employee_rows(self, query: str, sort_by: str, sort_order: str, page: int, per_page: int,
+                           min_salary: Optional[int] = None,
+                           max_salary: Optional[int] = None,
+                           start_date: Optional[date] = None,
+                           end_date: Optional[date] = None,
+                           spec: Optional[EmployeeFilter] = None) -> EmployeeRowPagination:
+        pass
+
+    @abstractmethod
+    def get_sorted_employees_keyset(self, sort_by: str, sort_order: str,
+                                    cursor: Optional[str], per_page: int,
+                                    min_salary: Optional[int] = None,
+                                    max_salary: Optional[int] = None,
+                                    start_date: Optional[date] = None,
+                                    end_date: Optional[date] = None,
+                                    spec: Optional[EmployeeFilter] = None) -> KeysetPage:
+        pass
+
+    @abstractmethod
+    def search_employees_keyset(self, query: str, cursor: Optional[str], per_page: int,
+                                min_salary: Optional[int] = None,
+                                max_salary: Optional[int] = None,
+                                start_date: Optional[date] = None,
+                                end_date: Optional[date] = None,
+                                spec: Optional[EmployeeFilter] = None) -> KeysetPage:
+        pass
+
 class SearchService(ISearchService):
+    def __init__(self, backend: Optional[ISearchBackend] = None,
+                 count_cache: Optional[LRUCache] = None,
+                 page_cache: Optional[LRUCache] = None):
+        # Бэкенд поиска по тексту; по умолчанию выбирается по СУБД
+        self._backend = backend
+        self.count_cache = count_cache if count_cache is not None else employee_count_cache
+        self.page_cache = page_cache if page_cache is not None else employee_page_cache
+
+    @property
+    def backend(self) -> ISearchBackend:
+        return self._backend or get_search_backend()
+
+    @replica_reads
     def search_employees(self, query: str, page: int = 1, per_page: int = 20, 
                         min_salary: Optional[int] = None, 
                         max_salary: Optional[int] = None,
                         start_date: Optional[date] = None,
                         end_date: Optional[date] = None):
         
-        # Создаем базовый запрос
-        query_obj = Employee.query
-        
-        # Добавляем поисковый фильтр только если есть query
-        if query:
-            search_filter = or_(
-                Employee.full_name.ilike(f'%{query}%'),
-                Employee.position.ilike(f'%{query}%')
-            )
-            query_obj = query_obj.filter(search_filter)
-        
-        # Добавляем фильтр по зарплате
-        if min_salary is not None:
-            query_obj = query_obj.filter(Employee.salary >= min_salary)
-        if max_salary is not None:
-            query_obj = query_obj.filter(Employee.salary <= max_salary)
-        
-        # Добавляем фильтр по дате приема
-        if start_date is not None:
-            query_obj = query_obj.filter(Employee.hire_date >= start_date)
-        if end_date is not None:
-            query_obj = query_obj.filter(Employee.hire_date <= end_date)
+        # Создаем базовый запрос (при поиске результаты упорядочены по релевантности)
+        query_obj = self._apply_search(Employee.query, query)
+        query_obj = EmployeeFilter(
+            min_salary=min_salary, max_salary=max_salary,
+            start_date=start_date, end_date=end_date
+        ).apply(query_obj)
         
         return query_obj.paginate(
             page=page, 
@@ -57,6 +202,7 @@ class SearchService(ISearchService):
             error_out=False
         )
     
+    @replica_reads
     def get_sorted_employees(self, sort_by: str, sort_order: str, page: int = 1, per_page: int = 20, 
                            min_salary: Optional[int] = None, 
                            max_salary: Optional[int] = None,
@@ -67,22 +213,298 @@ class SearchService(ISearchService):
             sort_column = sort_column.desc()
         
         # Создаем базовый запрос
-        query = Employee.query
-        
-        # Добавляем фильтр по зарплате
-        if min_salary is not None:
-            query = query.filter(Employee.salary >= min_salary)
-        if max_salary is not None:
-            query = query.filter(Employee.salary <= max_salary)
-        
-        # Добавляем фильтр по дате приема
-        if start_date is not None:
-            query = query.filter(Employee.hire_date >= start_date)
-        if end_date is not None:
-            query = query.filter(Employee.hire_date <= end_date)
+        query = EmployeeFilter(
+            min_salary=min_salary, max_salary=max_salary,
+            start_date=start_date, end_date=end_date
+        ).apply(Employee.query)
         
         return query.order_by(sort_column).paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
-        )
\ No newline at end of file
+        )
+
+    @replica_reads
+    def list_employee_rows(self, query: str = '', sort_by: str = 'id', sort_order: str = 'asc',
+                           page: int = 1, per_page: int = 20,
+                           min_salary: Optional[int] = None,
+                           max_salary: Optional[int] = None,
+                           start_date: Optional[date] = None,
+                           end_date: Optional[date] = None,
+                           spec: Optional[EmployeeFilter] = None):
+        """Список сотрудников для отображения одной выборкой.
+
+        Выбираются только отображаемые столбцы и имя руководителя через
+        self-join, поэтому страница не порождает дополнительных запросов
+        к Employee.boss. При поиске результаты упорядочены по релевантности,
+        иначе - по sort_by. Готовые страницы кешируются до следующей записи
+        в таблицу employees. Фильтр передается готовым spec либо отдельными
+        аргументами.
+        """
+        spec = self._spec(spec, query, min_salary, max_salary, start_date, end_date)
+        query = spec.search
+        if query or sort_by not in SORTABLE_COLUMNS:
+            sort_by = 'id'
+        if query or sort_order != 'desc':
+            sort_order = 'asc'
+
+        version = employees_version.value
+        page_key = (version, spec, sort_by, sort_order, page, per_page)
+        cached = self.page_cache.get(page_key)
+        if cached is not None:
+            _ids, rows, total = cached
+            return EmployeeRowPagination(
+                page=page,
+                per_page=per_page,
+                error_out=False,
+                items=list(rows),
+                total=total
+            )
+
+        if query:
+            stmt = self._apply_search(_filtered_rows_select(spec.without_search), query)
+        else:
+            stmt = _filtered_rows_select(spec, sort_by, sort_order)
+
+        # Общее количество: из кеша по сигнатуре фильтра, оценка планировщика
+        # для списка без фильтров или оконный COUNT в запросе страницы
+        cache_key = (version, spec)
+        total = self.count_cache.get(cache_key)
+        if total is None and spec.is_empty and self._count_mode() == 'estimated':
+            total = self._estimated_employee_count()
+
+        pagination = EmployeeRowPagination(
+            select=stmt,
+            session=db.session(),
+            page=page,
+            per_page=per_page,
+            error_out=False,
+            total=total
+        )
+        # Реплика может еще не получить недавнюю запись: такую страницу не кешируем
+        if reads_from_replica() and employees_version.age < current_app.config['REPLICA_PIN_SECONDS']:
+            return pagination
+        self.count_cache.set(cache_key, pagination.total)
+        self.page_cache.set(page_key, (
+            tuple(row.id for row in pagination.items),
+            tuple(pagination.items),
+            pagination.total
+        ))
+        return pagination
+
+    def rows_statement(self, spec: EmployeeFilter, sort_by: str = 'id', sort_order: str = 'asc'):
+        """Select проекции сотрудников по фильтру без пагинации (при поиске - по id)"""
+        if spec.search:
+            return self._apply_search(
+                _filtered_rows_select(spec.without_search, 'id'), spec.search, ranked=False
+            )
+        if sort_by not in SORTABLE_COLUMNS:
+            sort_by = 'id'
+        return _filtered_rows_select(spec, sort_by, 'desc' if sort_order == 'desc' else 'asc')
+
+    @replica_reads
+    def lookup_bosses(self, query: str = '', page: int = 1, per_page: int = 20,
+                      exclude_id: Optional[int] = None) -> Tuple[List[dict], bool]:
+        """Страница кандидатов в руководители для выбора в форме.
+
+        Читаются только id, ФИО и должность одной страницы (плюс одна строка,
+        чтобы узнать о следующей). Возвращает элементы и признак has_next.
+        """
+        stmt = select(Employee.id, Employee.full_name, Employee.position)
+        stmt = self._apply_search(stmt, (query or '').strip(), ranked=False)
+        if exclude_id is not None:
+            stmt = stmt.where(Employee.id != exclude_id)
+        stmt = (
+            stmt.order_by(Employee.full_name, Employee.id)
+            .limit(per_page + 1)
+            .offset((page - 1) * per_page)
+        )
+
+        rows = db.session.execute(stmt).all()
+        items = [
+            {'id': row.id, 'full_name': row.full_name, 'position': row.position}
+            for row in rows[:per_page]
+        ]
+        return items, len(rows) > per_page
+
+    def cache_stats(self) -> dict:
+        """Счетчики попаданий кешей списка сотрудников"""
+        return {
+            'employee_pages': self.page_cache.stats(),
+            'employee_counts': self.count_cache.stats()
+        }
+
+    @staticmethod
+    def _spec(spec: Optional[EmployeeFilter], query: str = '',
+              min_salary: Optional[int] = None,
+              max_salary: Optional[int] = None,
+              start_date: Optional[date] = None,
+              end_date: Optional[date] = None) -> EmployeeFilter:
+        if spec is not None:
+            return spec
+        return EmployeeFilter(
+            search=(query or '').strip(),
+            min_salary=min_salary,
+            max_salary=max_salary,
+            start_date=start_date,
+            end_date=end_date
+        )
+
+    @staticmethod
+    def _count_mode() -> str:
+        return current_app.config.get('EMPLOYEE_COUNT_MODE', 'exact')
+
+    @staticmethod
+    def _estimated_employee_count() -> Optional[int]:
+        """Оценка числа строк employees по статистике планировщика (None, если ее нет)"""
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            estimate = db.session.execute(text(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = 'employees'"
+            )).scalar()
+            # reltuples = -1, пока таблица не анализировалась
+            return int(estimate) if estimate is not None and estimate >= 0 else None
+        if dialect == 'sqlite':
+            has_stats = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )).first()
+            if has_stats:
+                stat = db.session.execute(text(
+                    "SELECT stat FROM sqlite_stat1 WHERE tbl = 'employees' LIMIT 1"
+                )).scalar()
+                if stat:
+                    return int(stat.split()[0])
+        return None
+
+    @replica_reads
+    def get_sorted_employees_keyset(self, sort_by: str, sort_order: str,
+                                    cursor: Optional[str] = None, per_page: int = 20,
+                                    min_salary: Optional[int] = None,
+                                    max_salary: Optional[int] = None,
+                                    start_date: Optional[date] = None,
+                                    end_date: Optional[date] = None,
+                                    spec: Optional[EmployeeFilter] = None):
+        """Сортированный список с пагинацией по курсору вместо OFFSET/LIMIT.
+
+        Курсор кодирует (значение столбца сортировки, id) последней строки
+        страницы, поэтому следующая страница читается по индексу с того же
+        места, без пропуска предыдущих строк и без отдельного COUNT(*).
+        """
+        if sort_by not in SORTABLE_COLUMNS:
+            sort_by = 'id'
+        descending = sort_order == 'desc'
+
+        spec = self._spec(spec, '', min_salary, max_salary, start_date, end_date)
+        stmt = _filtered_rows_select(spec.without_search)
+        return self._keyset_page(stmt, sort_by, descending, cursor, per_page)
+
+    @replica_reads
+    def search_employees_keyset(self, query: str, cursor: Optional[str] = None,
+                                per_page: int = 20,
+                                min_salary: Optional[int] = None,
+                                max_salary: Optional[int] = None,
+                                start_date: Optional[date] = None,
+                                end_date: Optional[date] = None,
+                                spec: Optional[EmployeeFilter] = None):
+        """Поиск с пагинацией по курсору (результаты упорядочены по id)"""
+        spec = self._spec(spec, query, min_salary, max_salary, start_date, end_date)
+        stmt = self._apply_search(_filtered_rows_select(spec.without_search), spec.search, ranked=False)
+        return self._keyset_page(stmt, 'id', False, cursor, per_page)
+
+    def _apply_search(self, query_obj, query: str, ranked: bool = True):
+        """Добавляет поисковый фильтр только если есть query"""
+        if query:
+            query_obj = self.backend.apply(query_obj, query, ranked=ranked)
+        return query_obj
+
+    def _keyset_page(self, stmt, sort_by: str, descending: bool,
+                     cursor: Optional[str], per_page: int) -> KeysetPage:
+        column = getattr(Employee, sort_by)
+
+        if cursor:
+            last_value, last_id = self.decode_cursor(cursor, sort_by)
+            if sort_by == 'id':
+                seek = Employee.id < last_id if descending else Employee.id > last_id
+            elif descending:
+                seek = or_(column < last_value, and_(column == last_value, Employee.id < last_id))
+            else:
+                seek = or_(column > last_value, and_(column == last_value, Employee.id > last_id))
+            stmt = stmt.filter(seek)
+
+        if descending:
+            order = [column.desc(), Employee.id.desc()]
+        else:
+            order = [column.asc(), Employee.id.asc()]
+        if sort_by == 'id':
+            order = order[:1]
+
+        # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+        rows = db.session.execute(stmt.order_by(*order).limit(per_page + 1))
+        rows = [EmployeeRow(*row) for row in rows]
+        items = rows[:per_page]
+
+        next_cursor = None
+        if len(rows) > per_page:
+            last = items[-1]
+            next_cursor = self.encode_cursor(sort_by, getattr(last, sort_by), last.id)
+        return KeysetPage(items, next_cursor, per_page)
+
+    @staticmethod
+    def encode_cursor(sort_by: str, value, employee_id: int) -> str:
+        """Кодирует позицию (столбец, значение, id) в непрозрачный токен"""
+        if isinstance(value, date):
+            value = value.isoformat()
+        payload = json.dumps([sort_by, value, employee_id], ensure_ascii=False)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str, sort_by: str) -> Tuple[object, int]:
+        """Декодирует токен курсора в (значение столбца сортировки, id)"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            cursor_sort_by, value, employee_id = json.loads(
+                base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+            )
+            if cursor_sort_by != sort_by or not _is_int(employee_id):
+                raise InvalidCursorError('Курсор не соответствует сортировке')
+            if sort_by == 'hire_date':
+                value = date.fromisoformat(value)
+            elif not _CURSOR_VALUE_CHECKS[sort_by](value):
+                raise InvalidCursorError('Курсор не соответствует сортировке')
+        except InvalidCursorError:
+            raise
+        except (ValueError, TypeError, UnicodeError) as e:
+            raise InvalidCursorError('Некорректный курсор пагинации') from e
+        return value, employee_id
+
+
+def _rows_select():
+    """Проекция отображаемых столбцов с именем руководителя"""
+    boss = aliased(Employee)
+    return select(
+        Employee.id,
+        Employee.full_name,
+        Employee.position,
+        Employee.hire_date,
+        Employee.salary,
+        Employee.boss_id,
+        boss.full_name.label('boss_name')
+    ).outerjoin(boss, Employee.boss_id == boss.id)
+
+
+@lru_cache(maxsize=512)
+def _filtered_rows_select(spec: EmployeeFilter, sort_by: Optional[str] = None,
+                          sort_order: str = 'asc'):
+    """Проекция с условиями фильтра и сортировкой (без текстового поиска).
+
+    Select неизменяем, поэтому для одинаковых фильтров и сортировки один и тот
+    же объект переиспользуется между запросами вместо повторного построения.
+    """
+    stmt = spec.apply(_rows_select())
+    if sort_by:
+        sort_column = getattr(Employee, sort_by)
+        if sort_order == 'desc':
+            stmt = stmt.order_by(sort_column.desc(), Employee.id.desc())
+        else:
+            stmt = stmt.order_by(sort_column.asc(), Employee.id.asc())
+    return stmt
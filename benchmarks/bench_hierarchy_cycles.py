@@ -0,0 +1,115 @@
+"""Бенчмарк проверки цикла при смене руководителя на глубоких цепочках.
+
+Сравниваются: проход вверх по boss_id из Python (запрос на уровень),
+рекурсивный CTE (один запрос, O(глубины)) и чтение из таблицы замыкания
+(один поиск по первичному ключу).
+
+Запуск: python benchmarks/bench_hierarchy_cycles.py [100 1000 10000]
+База - временный файл SQLite; DATABASE_URL не используется, чтобы не пересоздать
+рабочую базу. Другую пустую базу можно указать в BENCH_DATABASE_URL. Замыкание
+цепочки глубины n содержит n*(n+1)/2 строк, поэтому для 10000 его построение
+занимает заметное время и место на диске.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+# Бенчмарк удаляет все таблицы: рабочая база из DATABASE_URL/.env и реплики не используются
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or f'sqlite:///{_db_path}'
+os.environ['DATABASE_REPLICA_URLS'] = ''
+
+from sqlalchemy import literal_column, select  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Employee  # noqa: E402
+from app.services.hierarchy_service import HierarchyError, HierarchyService  # noqa: E402
+
+REPEATS = 1000
+
+
+def fill_chain(depth):
+    """Цепочка 1 <- 2 <- ... <- depth: у каждого сотрудника руководитель - предыдущий"""
+    db.drop_all()
+    db.create_all()
+    rows = [{
+        'id': i,
+        'full_name': f'Сотрудник {i}',
+        'position': 'Инженер',
+        'hire_date': date(2020, 1, 1),
+        'salary': 100000,
+        'boss_id': i - 1 if i > 1 else None
+    } for i in range(1, depth + 1)]
+    for start in range(0, depth, 50000):
+        db.session.execute(Employee.__table__.insert(), rows[start:start + 50000])
+    db.session.commit()
+
+
+def python_walk(employee_id, boss_id):
+    # Прежний способ: подъем по boss_id с запросом на каждый уровень
+    current = db.session.get(Employee, boss_id)
+    while current is not None:
+        if current.id == employee_id:
+            return True
+        current = db.session.get(Employee, current.boss_id) if current.boss_id else None
+    return False
+
+
+def cte_walk(employee_id, boss_id):
+    chain = select(Employee.id, Employee.boss_id).where(Employee.id == boss_id).cte('chain', recursive=True)
+    chain = chain.union_all(
+        select(Employee.id, Employee.boss_id).join(chain, Employee.id == chain.c.boss_id)
+    )
+    return db.session.execute(
+        select(literal_column('1')).select_from(chain).where(chain.c.id == employee_id)
+    ).first() is not None
+
+
+def closure_check(hierarchy, employee_id, boss_id):
+    try:
+        hierarchy.check_boss(employee_id, boss_id)
+    except HierarchyError:
+        return True
+    return False
+
+
+def measure(func, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        assert func()
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def run(depth):
+    fill_chain(depth)
+    hierarchy = HierarchyService()
+
+    started = time.perf_counter()
+    hierarchy.rebuild()
+    build_time = time.perf_counter() - started
+
+    # Худший случай: верхнего сотрудника пытаются подчинить самому нижнему
+    db.session.expire_all()
+    walk_us = measure(lambda: python_walk(1, depth), 3)
+    cte_us = measure(lambda: cte_walk(1, depth), 20)
+    closure_us = measure(lambda: closure_check(hierarchy, 1, depth), REPEATS)
+
+    print(f'{depth:>6} | python walk {walk_us / 1000:>9.1f} ms | cte {cte_us / 1000:>7.2f} ms | '
+          f'closure {closure_us:>6.1f} us | closure build {build_time:>6.1f} s')
+
+
+def main():
+    depths = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    app = create_app()
+    with app.app_context():
+        for depth in depths:
+            run(depth)
+    os.close(_db_fd)
+    os.unlink(_db_path)
+
+
+if __name__ == '__main__':
+    main()
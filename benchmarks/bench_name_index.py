@@ -0,0 +1,90 @@
+"""Бенчмарк автодополнения: ilike-запрос к базе против индекса в памяти.
+
+Запуск: python benchmarks/bench_name_index.py [10000 100000 1000000]
+База - временный файл SQLite; DATABASE_URL не используется, чтобы не пересоздать
+рабочую базу. Другую пустую базу можно указать в BENCH_DATABASE_URL.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+# Бенчмарк удаляет все таблицы: рабочая база из DATABASE_URL/.env и реплики не используются
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or f'sqlite:///{_db_path}'
+os.environ['DATABASE_REPLICA_URLS'] = ''
+
+from app import create_app, db  # noqa: E402
+from app.models import Employee  # noqa: E402
+from app.services.name_index import EmployeeNameIndex  # noqa: E402
+
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+            'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев']
+NAMES = ['Иван', 'Петр', 'Сергей', 'Алексей', 'Дмитрий', 'Андрей', 'Михаил', 'Николай']
+PATRONYMICS = ['Иванович', 'Петрович', 'Сергеевич', 'Алексеевич', 'Дмитриевич', 'Андреевич']
+QUERIES = ['Иван', 'Смир', 'Серг', 'Кузнецов12', 'Волков Андр', 'Мих']
+REPEATS = 200
+
+
+def fill(size):
+    db.drop_all()
+    db.create_all()
+    rows = [{
+        'full_name': f'{random.choice(SURNAMES)}{i % 1000} {random.choice(NAMES)} {random.choice(PATRONYMICS)}',
+        'position': 'Инженер',
+        'hire_date': date(2020, 1, 1),
+        'salary': 100000,
+        'boss_id': None
+    } for i in range(size)]
+    for start in range(0, size, 50000):
+        db.session.execute(Employee.__table__.insert(), rows[start:start + 50000])
+    db.session.commit()
+
+
+def measure(func):
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        for query in QUERIES:
+            func(query)
+    return (time.perf_counter() - started) / (REPEATS * len(QUERIES)) * 1e6
+
+
+def run(size):
+    fill(size)
+
+    def db_query(query):
+        Employee.query.filter(Employee.full_name.ilike(f'%{query}%')).limit(10).all()
+
+    index = EmployeeNameIndex()
+    started = time.perf_counter()
+    index.rebuild()
+    build_time = time.perf_counter() - started
+
+    db_us = measure(db_query)
+    index_us = measure(lambda query: index.search(query, limit=10))
+
+    started = time.perf_counter()
+    for i in range(1000):
+        index.add(size + i + 1, f'Новый{i} Сотрудник Тестович', 'Инженер')
+    insert_us = (time.perf_counter() - started) / 1000 * 1e6
+
+    print(f'{size:>9} | ilike {db_us:>10.1f} us | index {index_us:>8.1f} us | '
+          f'build {build_time:>6.2f} s | add {insert_us:>7.1f} us')
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    app = create_app()
+    with app.app_context():
+        for size in sizes:
+            run(size)
+    os.close(_db_fd)
+    os.unlink(_db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Бенчмарк пропускной способности /login при разном числе одновременных входов.
+
+Сравниваются: ограниченный пул хеширования (BCRYPT_WORKERS потоков и
+BCRYPT_MAX_QUEUE в очереди, лишние входы сразу получают 503) и пул без
+ограничения, где каждый поток запроса считает свой хеш, как при вызове
+bcrypt прямо в обработчике.
+
+Запуск: python benchmarks/bench_password_hasher.py [1 4 16 64]
+Стоимость - BCRYPT_ROUNDS или подбор под BCRYPT_TARGET_MS; длительность
+замера на уровень - BENCH_SECONDS (по умолчанию 3). База - временный файл
+SQLite (DATABASE_URL не используется, чтобы не пересоздать рабочую базу; другую
+пустую базу можно указать в BENCH_DATABASE_URL), журнал авторизации - во временном каталоге.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+# Бенчмарк удаляет все таблицы: рабочая база из DATABASE_URL/.env и реплики не используются
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or f'sqlite:///{_db_path}'
+os.environ['DATABASE_REPLICA_URLS'] = ''
+os.chdir(tempfile.mkdtemp())
+
+from app import create_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+from app.password_hasher import password_hasher  # noqa: E402
+
+SECONDS = float(os.getenv('BENCH_SECONDS', '3'))
+CREDENTIALS = {'username': 'bench', 'password': 'bench-password'}
+
+
+def run_level(app, concurrency):
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + SECONDS
+
+    def worker():
+        while time.perf_counter() < deadline:
+            client = app.test_client()
+            started = time.perf_counter()
+            response = client.post('/login', data=CREDENTIALS)
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses.append(response.status_code)
+                if response.status_code == 302:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0.0
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+    return len(latencies) / duration, p50, p95, statuses.count(503)
+
+
+def main():
+    levels = [int(arg) for arg in sys.argv[1:]] or [1, 4, 16, 64]
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    workers, max_queue = password_hasher.workers, password_hasher.max_queue
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username=CREDENTIALS['username'], email='bench@example.com')
+        user.set_password(CREDENTIALS['password'])
+        db.session.add(user)
+        db.session.commit()
+    rounds = password_hasher.rounds
+    print(f'rounds {rounds}, пул {workers} потоков, очередь {max_queue}')
+
+    for concurrency in levels:
+        for mode, pool_workers, queue in (('пул', workers, max_queue), ('без ограничения', concurrency, 0)):
+            password_hasher.configure(rounds=rounds, workers=pool_workers, max_queue=queue)
+            throughput, p50, p95, busy = run_level(app, concurrency)
+            print(f'{concurrency:>4} | {mode:<15} | {throughput:>7.1f} входов/с | '
+                  f'p50 {p50:>7.1f} ms | p95 {p95:>7.1f} ms | 503: {busy}')
+    password_hasher.shutdown()
+    os.close(_db_fd)
+    os.unlink(_db_path)
+
+
+if __name__ == '__main__':
+    main()
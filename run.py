@@ -1,5 +1,12 @@
+import click
 from app import create_app, db
 from app.models import User
+from app.services.search_backend import install_search_index, reset_search_backend
+from app.services.name_index import employee_name_index
+from app.services.import_service import ImportService, ImportFormatError, IMPORT_CHUNK_SIZE
+from app.services.hierarchy_service import HierarchyService
+from app.services.rollup_service import RollupService
+from app.migrations import MIGRATIONS, applied_versions, run_migrations
 
 app = create_app()
 
@@ -15,10 +22,73 @@ def create_admin():
         print("Администратор создан: admin / admin123")
 
 
+@app.cli.command("install-search-index")
+def install_search_index_command():
+    """Создание поискового индекса (FTS5 / pg_trgm) для существующей базы"""
+    with db.engine.begin() as connection:
+        installed = install_search_index(connection)
+    reset_search_backend()
+    if installed:
+        print("Поисковый индекс создан")
+    else:
+        print("Поисковый индекс не поддерживается СУБД, используется ilike")
+
+
+@app.cli.command("db-upgrade")
+def db_upgrade_command():
+    """Применение недостающих миграций схемы (app/migrations.py)"""
+    applied = run_migrations(db.engine)
+    if applied:
+        print(f"Применены миграции: {', '.join(str(version) for version in applied)}")
+    else:
+        print("Схема в актуальном состоянии")
+
+
+@app.cli.command("db-status")
+def db_status_command():
+    """Список миграций и отметка о применении"""
+    with db.engine.begin() as connection:
+        done = set(applied_versions(connection))
+    for migration in MIGRATIONS:
+        mark = "x" if migration.version in done else " "
+        print(f"[{mark}] {migration.version:>3} {migration.description}")
+
+
+@app.cli.command("import-employees")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=IMPORT_CHUNK_SIZE, show_default=True, help="Строк в одной транзакции")
+@click.option("--strict-positions", is_flag=True, help="Принимать только должности, уже известные в базе")
+def import_employees_command(path, chunk_size, strict_positions):
+    """Массовый импорт сотрудников из CSV (full_name, position, hire_date, salary, boss_id/ref/boss_ref)"""
+    try:
+        report = ImportService(chunk_size=chunk_size, strict_positions=strict_positions).import_csv(path)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+
+    print(f"Импортировано: {report.imported} из {report.total}")
+    for entry in report.to_dict()["errors"]:
+        print(f"  строка {entry['line']}: {'; '.join(entry['errors'])}")
+
+
+@app.cli.command("rebuild-hierarchy")
+def rebuild_hierarchy_command():
+    """Пересчет таблицы замыкания иерархии и сводок по поддеревьям по boss_id"""
+    rows = HierarchyService().rebuild()
+    print(f"Иерархия пересчитана: {rows} связей")
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Пересчет сводок по поддеревьям (численность, фонд зарплаты, уровень)"""
+    count = RollupService().rebuild()
+    print(f"Сводки пересчитаны: {count} сотрудников")
+
+
 if __name__ == "__main__":
     with app.app_context():
-        # Создаем таблицы
+        # Создаем таблицы и применяем миграции к базе, созданной раньше
         db.create_all()
+        run_migrations(db.engine)
         
         # Создаем администратора если нет пользователей
         if User.query.count() == 0:
@@ -27,5 +97,11 @@ if __name__ == "__main__":
             db.session.add(admin)
             db.session.commit()
             print("Администратор по умолчанию создан: admin / admin123")
+        
+        # Заполняем таблицу иерархии для базы, созданной до ее появления
+        HierarchyService().ensure_built()
+        
+        # Строим индекс автодополнения по ФИО
+        employee_name_index.rebuild()
     
     app.run(debug=True, host="0.0.0.0", port=5000)  # noqa: S104
@@ -2,9 +2,11 @@ import sys
 import os
 import uuid
 import pytest
+import shutil
 import tempfile
 import warnings
 
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta
 from unittest.mock import Mock, patch
 
@@ -31,6 +33,11 @@ except ImportError:
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.join(project_root, '..'))
 
+# Журнал авторизации приложения - во временном каталоге, а не в корне репозитория:
+# Config читает AUTH_LOG_FILE при импорте, поэтому до импорта приложения
+auth_log_dir = tempfile.mkdtemp()
+os.environ['AUTH_LOG_FILE'] = os.path.join(auth_log_dir, 'auth_logs.csv')
+
 try:
     from app import create_app, db
     from app.models import User, Employee, LoginLog
@@ -38,6 +45,9 @@ try:
     from app.services.employee_service import EmployeeService
     from app.services.search_service import SearchService
     from app.services.analytics_service import AnalyticsService
+    from app.services.cache import employees_version
+    from app.services.hierarchy_service import HierarchyService
+    from app.query_stats import count_queries
 except ImportError as e:
     print(f"Import error: {e}")
     print(f"Current sys.path: {sys.path}")
@@ -49,8 +59,9 @@ def app():
     # Создаем временный файл для базы данных
     db_fd, db_path = tempfile.mkstemp()
     
-    app = create_app()
-    app.config.update({
+    # Engine создается в init_app, поэтому адрес базы передается в фабрику:
+    # после create_app() его замена уже не действует
+    app = create_app({
         'TESTING': True,
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
         'WTF_CSRF_ENABLED': False,
@@ -65,6 +76,10 @@ def app():
     # Очистка после тестов
     os.close(db_fd)
     os.unlink(db_path)
+    # Журнал дописывается фоновым потоком: сначала дожидаемся его, потом удаляем каталог
+    from app.routes import auth_service as app_auth_service
+    app_auth_service.writer.close()
+    shutil.rmtree(auth_log_dir, ignore_errors=True)
 
 @pytest.fixture
 def client(app):
@@ -134,7 +149,11 @@ def init_database(app):
         for emp in employees:
             db.session.add(emp)
         
+        # База пересоздана в обход EmployeeService - сбрасываем зависящие от нее кеши
+        # и строим таблицу иерархии
+        employees_version.bump()
         db.session.commit()
+        HierarchyService().rebuild()
         
     yield db
     
@@ -142,9 +161,9 @@ def init_database(app):
         db.session.remove()
 
 @pytest.fixture
-def auth_service():
+def auth_service(tmp_path):
     """Сервис аутентификации"""
-    return AuthService(log_file='test_auth_logs.csv')
+    return AuthService(log_file=str(tmp_path / 'test_auth_logs.csv'))
 
 @pytest.fixture
 def employee_service():
@@ -195,6 +214,24 @@ def authenticated_client(client, app):
         db.session.commit()
 
 
+@pytest.fixture
+def query_budget():
+    """Проверка бюджета SQL-запросов блока кода.
+
+    with query_budget(5): client.get('/employees') - ошибка, если выполнено
+    больше 5 запросов; в сообщении перечислены формы запросов с повторами.
+    """
+    @contextmanager
+    def budget(max_queries):
+        with count_queries() as stats:
+            yield stats
+        shapes = '\n'.join(f'{count}x {shape}' for shape, count in stats.shapes.most_common())
+        assert stats.count <= max_queries, (
+            f'Выполнено {stats.count} запросов при бюджете {max_queries}:\n{shapes}'
+        )
+    return budget
+
+
 def cleanup_users(app):
     """Автоматически очищает тестовых пользователей после каждого теста"""
     yield
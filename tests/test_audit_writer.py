@@ -0,0 +1,144 @@
+import csv
+import multiprocessing
+import os
+import time
+import pytest
+from app.services.audit_writer import AuditLogWriter
+from app.services.auth_service import AUTH_LOG_HEADER, AuthService
+
+HEADER = ['timestamp', 'username', 'action']
+
+
+def _read_rows(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return list(csv.reader(file))
+
+
+def _wait_for_rows(path, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if len(_read_rows(path)) >= count:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _write_from_process(path, worker, rows):
+    writer = AuditLogWriter(path, header=HEADER, batch_size=7, flush_interval=0.01, fsync='never')
+    # Длинные строки больше PIPE_BUF: без блокировки записи процессов перемешались бы
+    payload = 'x' * 5000
+    for index in range(rows):
+        writer.write([f'{worker}-{index}', payload, 'LOGIN'])
+    writer.close()
+
+
+class TestAuditLogWriter:
+    def test_header_created_once(self, tmp_path):
+        """Тест создания файла с заголовком только при его отсутствии"""
+        path = str(tmp_path / 'auth.csv')
+        AuditLogWriter(path, header=HEADER)
+        AuditLogWriter(path, header=HEADER)
+
+        assert _read_rows(path) == [HEADER]
+
+    def test_flush_on_batch_size(self, tmp_path):
+        """Тест записи пачки при достижении batch_size"""
+        path = str(tmp_path / 'auth.csv')
+        writer = AuditLogWriter(path, header=HEADER, batch_size=3, flush_interval=60)
+        for index in range(3):
+            writer.write(['2024-01-01 00:00:00', f'user{index}', 'LOGIN'])
+
+        assert _wait_for_rows(path, 4)
+        writer.close()
+
+    def test_flush_on_interval(self, tmp_path):
+        """Тест записи неполной пачки по истечении flush_interval"""
+        path = str(tmp_path / 'auth.csv')
+        writer = AuditLogWriter(path, header=HEADER, batch_size=100, flush_interval=0.05)
+        writer.write(['2024-01-01 00:00:00', 'user', 'LOGIN'])
+
+        assert _wait_for_rows(path, 2)
+        writer.close()
+
+    def test_explicit_flush(self, tmp_path):
+        """Тест ожидания записи поставленных строк"""
+        path = str(tmp_path / 'auth.csv')
+        writer = AuditLogWriter(path, header=HEADER, batch_size=100, flush_interval=60)
+        writer.write(['2024-01-01 00:00:00', 'user', 'LOGIN'])
+
+        assert writer.flush(timeout=2)
+        assert _read_rows(path)[1] == ['2024-01-01 00:00:00', 'user', 'LOGIN']
+        writer.close()
+
+    def test_close_drains_queue(self, tmp_path):
+        """Тест дописывания очереди при закрытии"""
+        path = str(tmp_path / 'auth.csv')
+        writer = AuditLogWriter(path, header=HEADER, batch_size=1000, flush_interval=60)
+        for index in range(50):
+            writer.write(['2024-01-01 00:00:00', f'user{index}', 'LOGIN'])
+
+        writer.close()
+
+        assert len(_read_rows(path)) == 51
+        assert writer.written == 50
+        with pytest.raises(RuntimeError):
+            writer.write(['2024-01-01 00:00:00', 'user', 'LOGIN'])
+
+    def test_full_queue_drops_row(self, tmp_path):
+        """Тест отказа от строки вместо ожидания при переполненной очереди"""
+        writer = AuditLogWriter(str(tmp_path / 'auth.csv'), max_queue=1)
+        writer._ensure_thread = lambda: None
+        writer.write(['a'])
+        writer.write(['b'])
+
+        assert writer.dropped == 1
+
+    @pytest.mark.parametrize('policy, expected', [('batch', 2), ('never', 0)])
+    def test_fsync_policy(self, tmp_path, monkeypatch, policy, expected):
+        """Тест вызова fsync в зависимости от политики"""
+        calls = []
+        monkeypatch.setattr(os, 'fsync', lambda fd: calls.append(fd))
+        writer = AuditLogWriter(str(tmp_path / 'auth.csv'), batch_size=1, fsync=policy)
+        writer.write(['a'])
+        writer.flush(timeout=2)
+        writer.write(['b'])
+        writer.close()
+
+        assert len(calls) == expected
+
+    def test_unknown_fsync_policy(self, tmp_path):
+        """Тест ошибки для неизвестной политики fsync"""
+        with pytest.raises(ValueError):
+            AuditLogWriter(str(tmp_path / 'auth.csv'), fsync='sometimes')
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='нужен fork')
+    def test_processes_do_not_interleave(self, tmp_path):
+        """Тест целостности строк при одновременной записи из нескольких процессов"""
+        path = str(tmp_path / 'auth.csv')
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_write_from_process, args=(path, worker, 100))
+                     for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        rows = _read_rows(path)
+        assert rows[0] == HEADER
+        assert len(rows) == 401
+        assert all(len(row) == 3 and row[1] == 'x' * 5000 for row in rows[1:])
+        assert len({row[0] for row in rows[1:]}) == 400
+
+
+class TestAuthServiceLog:
+    def test_event_written_in_background(self, tmp_path):
+        """Тест записи события авторизации фоновым потоком"""
+        path = str(tmp_path / 'auth.csv')
+        service = AuthService(log_file=path, flush_interval=60)
+        service.log_auth_event('testuser', 'LOGIN', ip_address='127.0.0.1', user_agent='Test Agent')
+
+        assert service.flush_log(timeout=2)
+        rows = _read_rows(path)
+        assert rows[0] == AUTH_LOG_HEADER
+        assert rows[1][1:5] == ['testuser', 'LOGIN', '127.0.0.1', 'Test Agent']
+        service.writer.close()
@@ -0,0 +1,161 @@
+import os
+import pytest
+import app.routes as routes
+from app.services.auth_activity_service import AuthActivityService
+from app.services.auth_log_store import RotatingAuditLogWriter
+from app.services.auth_service import AUTH_LOG_HEADER
+
+EVENTS = [
+    ['2024-03-01 09:00:00', 'ivanov', 'FAILED_LOGIN', '10.0.0.1', 'Agent', ''],
+    ['2024-03-01 09:01:00', 'ivanov', 'FAILED_LOGIN', '10.0.0.2', 'Agent', ''],
+    ['2024-03-01 09:02:00', 'ivanov', 'LOGIN', '10.0.0.2', 'Agent', ''],
+    ['2024-03-01 09:10:00', 'ivanov', 'ADD_EMPLOYEE', '10.0.0.2', 'Agent', ''],
+    ['2024-03-01 10:00:00', 'petrov', 'FAILED_LOGIN', '10.0.0.1', 'Agent', ''],
+    ['2024-03-01 10:05:00', 'petrov', 'LOGIN', '10.0.0.3', 'Agent', ''],
+    ['2024-03-01 10:06:00', 'petrov', 'DELETE_EMPLOYEE', '10.0.0.3', 'Agent', ''],
+]
+
+NEXT_DAY = [
+    ['2024-03-02 08:00:00', 'petrov', 'LOGIN', '10.0.0.3', 'Agent', ''],
+    ['2024-03-02 08:30:00', 'petrov', 'UPDATE_EMPLOYEE', '10.0.0.3', 'Agent', ''],
+]
+
+
+@pytest.fixture
+def log_writer(tmp_path):
+    writer = RotatingAuditLogWriter(str(tmp_path / 'auth_logs.csv'), header=AUTH_LOG_HEADER,
+                                    batch_size=1000, flush_interval=60, fsync='never')
+    yield writer
+    writer.close()
+
+
+def _write(writer, rows):
+    for row in rows:
+        writer.write(row)
+    assert writer.flush(timeout=5)
+
+
+class TestAuthActivityService:
+    def test_report(self, log_writer):
+        """Тест отчета: неудачные входы, входы по часам, изменения по операторам"""
+        _write(log_writer, EVENTS)
+        service = AuthActivityService(log_writer.path)
+        service.refresh()
+
+        report = service.report()
+
+        assert report['failed_logins']['total'] == 3
+        assert report['failed_logins']['by_user'] == [
+            {'username': 'ivanov', 'count': 2}, {'username': 'petrov', 'count': 1}
+        ]
+        assert report['failed_logins']['by_ip'][0] == {'ip_address': '10.0.0.1', 'count': 2}
+        assert report['logins_per_hour'] == {'2024-03-01 09': 1, '2024-03-01 10': 1}
+        assert report['mutations'] == {'ivanov': {'ADD_EMPLOYEE': 1}, 'petrov': {'DELETE_EMPLOYEE': 1}}
+
+    def test_refresh_reads_only_appended_rows(self, log_writer):
+        """Тест повторного обновления: читаются только дописанные строки"""
+        _write(log_writer, EVENTS[:4])
+        service = AuthActivityService(log_writer.path)
+        assert service.refresh()['rows'] == 4
+        size = os.path.getsize(log_writer.path)
+
+        _write(log_writer, EVENTS[4:])
+        stats = service.refresh()
+
+        assert stats['rows'] == 3
+        assert stats['bytes'] == os.path.getsize(log_writer.path) - size
+        assert service.refresh()['rows'] == 0
+        assert service.report()['failed_logins']['total'] == 3
+
+    def test_incomplete_line_waits(self, log_writer):
+        """Тест недописанной строки: она учитывается после завершения"""
+        _write(log_writer, EVENTS[:1])
+        with open(log_writer.path, 'ab') as file:
+            file.write(b'2024-03-01 09:01:00,ivanov,FAILED_')
+        service = AuthActivityService(log_writer.path)
+
+        assert service.refresh()['rows'] == 1
+        with open(log_writer.path, 'ab') as file:
+            file.write(b'LOGIN,10.0.0.2,Agent,\r\n')
+        assert service.refresh()['rows'] == 1
+        assert service.report()['failed_logins']['total'] == 2
+
+    def test_checkpoint_persisted(self, log_writer):
+        """Тест продолжения с сохраненной контрольной точки новым экземпляром"""
+        _write(log_writer, EVENTS[:4])
+        AuthActivityService(log_writer.path).refresh()
+        _write(log_writer, EVENTS[4:])
+
+        service = AuthActivityService(log_writer.path)
+
+        assert service.refresh()['rows'] == 3
+        assert service.report()['failed_logins']['total'] == 3
+
+    def test_rotated_segment_not_reread(self, log_writer):
+        """Тест ротации прочитанного файла: счетчики переносятся без распаковки сегмента"""
+        _write(log_writer, EVENTS)
+        service = AuthActivityService(log_writer.path)
+        service.refresh()
+
+        _write(log_writer, NEXT_DAY)
+        stats = service.refresh()
+
+        assert log_writer.rotations == 1
+        assert stats == {'rows': 2, 'bytes': stats['bytes'], 'segments': 1}
+        report = service.report()
+        assert report['failed_logins']['total'] == 3
+        assert report['logins_per_hour'] == {'2024-03-01 09': 1, '2024-03-01 10': 1, '2024-03-02 08': 1}
+
+    def test_rotated_segment_with_unread_rows(self, log_writer):
+        """Тест ротации файла с непрочитанным хвостом: сегмент пересчитывается без двойного учета"""
+        _write(log_writer, EVENTS[:4])
+        service = AuthActivityService(log_writer.path)
+        service.refresh()
+
+        _write(log_writer, EVENTS[4:])
+        _write(log_writer, NEXT_DAY)
+        service.refresh()
+
+        report = service.report()
+        assert report['failed_logins']['total'] == 3
+        assert report['mutations'] == {
+            'ivanov': {'ADD_EMPLOYEE': 1},
+            'petrov': {'DELETE_EMPLOYEE': 1, 'UPDATE_EMPLOYEE': 1},
+        }
+
+    def test_report_date_range(self, log_writer):
+        """Тест отчета за интервал дней"""
+        _write(log_writer, EVENTS)
+        _write(log_writer, NEXT_DAY)
+        service = AuthActivityService(log_writer.path)
+        service.refresh()
+
+        report = service.report('2024-03-02', '2024-03-02')
+
+        assert report['failed_logins']['total'] == 0
+        assert report['logins_per_hour'] == {'2024-03-02 08': 1}
+        assert report['mutations'] == {'petrov': {'UPDATE_EMPLOYEE': 1}}
+        with pytest.raises(ValueError):
+            service.report('01.03.2024')
+
+
+class TestAuthActivityRoute:
+    def test_activity_endpoint(self, authenticated_client, log_writer, monkeypatch):
+        """Тест API отчета по журналу авторизации"""
+        _write(log_writer, EVENTS)
+        monkeypatch.setattr(routes, 'auth_activity_service', AuthActivityService(log_writer.path))
+
+        response = authenticated_client.get('/api/auth-log/activity?start=2024-03-01&top=1')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['failed_logins']['by_user'] == [{'username': 'ivanov', 'count': 2}]
+        assert data['refreshed']['rows'] == 7
+
+    def test_activity_invalid_date(self, authenticated_client, log_writer, monkeypatch):
+        """Тест ошибки формата даты"""
+        monkeypatch.setattr(routes, 'auth_activity_service', AuthActivityService(log_writer.path))
+
+        response = authenticated_client.get('/api/auth-log/activity?end=завтра')
+
+        assert response.status_code == 400
@@ -0,0 +1,243 @@
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import pytest
+import app.routes as routes
+from app.services import auth_log_store
+from app.services.auth_log_store import AuthLogStore, RotatingAuditLogWriter, segment_path
+from app.services.auth_service import AUTH_LOG_HEADER, AuthService
+
+
+def _row(timestamp, action='LOGIN', username='testuser'):
+    return [timestamp, username, action, '127.0.0.1', 'Test Agent', '']
+
+
+def _day_rows(day, hours=(9, 10, 11), per_hour=3):
+    return [
+        _row(f'{day} {hour:02d}:{minute:02d}:00', 'LOGIN' if minute % 2 == 0 else 'LOGOUT')
+        for hour in hours for minute in range(per_hour)
+    ]
+
+
+def _writer(path, **kwargs):
+    options = {'batch_size': 1000, 'flush_interval': 60, 'fsync': 'never'}
+    options.update(kwargs)
+    return RotatingAuditLogWriter(path, header=AUTH_LOG_HEADER, **options)
+
+
+def _write(writer, rows):
+    for row in rows:
+        writer.write(row)
+    assert writer.flush(timeout=5)
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return list(csv.reader(file))
+
+
+def _write_two_days(path, worker):
+    writer = _writer(path, batch_size=5, flush_interval=0.01)
+    for row in _day_rows('2024-03-01', per_hour=10):
+        writer.write(row[:1] + [f'worker{worker}'] + row[2:])
+    writer.flush(timeout=5)
+    for row in _day_rows('2024-03-02', per_hour=10):
+        writer.write(row[:1] + [f'worker{worker}'] + row[2:])
+    writer.close()
+
+
+@pytest.fixture
+def decompress_calls(monkeypatch):
+    """Счетчик распакованных gzip-членов"""
+    calls = []
+    original = gzip.decompress
+
+    def counting(data):
+        calls.append(len(data))
+        return original(data)
+
+    monkeypatch.setattr(auth_log_store.gzip, 'decompress', counting)
+    return calls
+
+
+class TestRotation:
+    def test_rotate_on_new_day(self, tmp_path):
+        """Тест ротации при первой строке следующего дня"""
+        path = str(tmp_path / 'auth_logs.csv')
+        writer = _writer(path)
+        _write(writer, _day_rows('2024-03-01'))
+        _write(writer, _day_rows('2024-03-02', hours=(8,)))
+        writer.close()
+
+        gz_path = segment_path(path, '2024-03-01', 0, 'csv.gz')
+        assert os.path.exists(gz_path)
+        assert not os.path.exists(segment_path(path, '2024-03-01', 0))
+        # Сжатый сегмент - обычный многочленный gzip с заголовком
+        rows = list(csv.reader(io.StringIO(gzip.decompress(open(gz_path, 'rb').read()).decode('utf-8'))))
+        assert rows[0] == AUTH_LOG_HEADER
+        assert len(rows) == 10
+        active = _read_csv(path)
+        assert active[0] == AUTH_LOG_HEADER
+        assert [row[0][:10] for row in active[1:]] == ['2024-03-02'] * 3
+
+    def test_index_members_per_hour(self, tmp_path):
+        """Тест индекса: член gzip на каждый час со смещениями и счетчиками"""
+        path = str(tmp_path / 'auth_logs.csv')
+        writer = _writer(path)
+        _write(writer, _day_rows('2024-03-01'))
+        _write(writer, _day_rows('2024-03-02', hours=(8,)))
+        writer.close()
+
+        with open(segment_path(path, '2024-03-01', 0, 'idx.json'), encoding='utf-8') as file:
+            index = json.load(file)
+        assert index['rows'] == 9
+        assert index['start'] == '2024-03-01 09:00:00'
+        assert index['end'] == '2024-03-01 11:02:00'
+        assert index['actions'] == {'LOGIN': 6, 'LOGOUT': 3}
+        assert [member['hour'] for member in index['members']] == ['2024-03-01 09', '2024-03-01 10', '2024-03-01 11']
+
+        member = index['members'][1]
+        with open(segment_path(path, '2024-03-01', 0, 'csv.gz'), 'rb') as file:
+            file.seek(member['offset'])
+            text = gzip.decompress(file.read(member['length'])).decode('utf-8')
+        assert [row[0] for row in csv.reader(io.StringIO(text))] == [
+            '2024-03-01 10:00:00', '2024-03-01 10:01:00', '2024-03-01 10:02:00'
+        ]
+
+    def test_rotate_on_size(self, tmp_path):
+        """Тест ротации по размеру файла в пределах одного дня"""
+        path = str(tmp_path / 'auth_logs.csv')
+        writer = _writer(path, batch_size=1, max_bytes=250)
+        _write(writer, _day_rows('2024-03-01'))
+        writer.close()
+
+        store = AuthLogStore(path)
+        assert len(store.indexes()) >= 2
+        assert os.path.exists(segment_path(path, '2024-03-01', 1, 'csv.gz'))
+        assert len(list(store.query())) == 9
+
+    def test_pending_segment_compressed_on_start(self, tmp_path):
+        """Тест сжатия сегмента, оставшегося несжатым после остановки"""
+        path = str(tmp_path / 'auth_logs.csv')
+        pending = segment_path(path, '2024-02-28', 0)
+        with open(pending, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows([AUTH_LOG_HEADER] + _day_rows('2024-02-28'))
+
+        _writer(path).close()
+
+        assert not os.path.exists(pending)
+        assert os.path.exists(segment_path(path, '2024-02-28', 0, 'csv.gz'))
+
+    def test_legacy_segment_not_utf8(self, tmp_path):
+        """Тест сжатия старого журнала за несколько дней в кодировке системы"""
+        path = str(tmp_path / 'auth_logs.csv')
+        pending = segment_path(path, '2024-02-27', 0)
+        rows = [AUTH_LOG_HEADER, _row('2024-02-27 10:00:00', username='иванов'), _row('2024-02-28 11:00:00')]
+        with open(pending, 'w', newline='', encoding='cp1251') as file:
+            csv.writer(file).writerows(rows)
+
+        _writer(path).close()
+
+        store = AuthLogStore(path)
+        assert store.indexes()[0]['rows'] == 2
+        assert [event['timestamp'] for event in store.query('2024-02-28')] == ['2024-02-28 11:00:00']
+        gz_path = segment_path(path, '2024-02-27', 0, 'csv.gz')
+        assert 'иванов'.encode('cp1251') in gzip.decompress(open(gz_path, 'rb').read())
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='нужен fork')
+    def test_concurrent_rotation(self, tmp_path):
+        """Тест ротации при записи из нескольких процессов: строки не теряются и не дублируются"""
+        path = str(tmp_path / 'auth_logs.csv')
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_write_two_days, args=(path, worker)) for worker in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        events = list(AuthLogStore(path).query())
+        keys = [(event['timestamp'], event['username']) for event in events]
+        assert len(keys) == 3 * 2 * 30
+        assert len(set(keys)) == len(keys)
+        assert {event['timestamp'][:10] for event in AuthLogStore(path).query('2024-03-01', '2024-03-01')} == {
+            '2024-03-01'
+        }
+
+
+class TestAuthLogStore:
+    @pytest.fixture
+    def store_path(self, tmp_path):
+        path = str(tmp_path / 'auth_logs.csv')
+        writer = _writer(path)
+        _write(writer, _day_rows('2024-03-01'))
+        _write(writer, _day_rows('2024-03-02'))
+        _write(writer, _day_rows('2024-03-03', hours=(12,)))
+        writer.close()
+        return path
+
+    def test_query_window_reads_only_matching_hours(self, store_path, decompress_calls):
+        """Тест распаковки только часов, попадающих в интервал"""
+        events = list(AuthLogStore(store_path).query('2024-03-02 10:00:00', '2024-03-02 10:59:59'))
+
+        assert [event['timestamp'] for event in events] == [
+            '2024-03-02 10:00:00', '2024-03-02 10:01:00', '2024-03-02 10:02:00'
+        ]
+        assert len(decompress_calls) == 1
+
+    def test_query_whole_day_and_filters(self, store_path):
+        """Тест запроса за день с фильтрами по действию и пользователю"""
+        store = AuthLogStore(store_path)
+
+        assert len(list(store.query('2024-03-01', '2024-03-01'))) == 9
+        assert len(list(store.query('2024-03-01', '2024-03-02', action='LOGOUT'))) == 6
+        assert list(store.query(username='nobody')) == []
+
+    def test_query_includes_active_file(self, store_path):
+        """Тест чтения текущего, еще не ротированного файла"""
+        events = list(AuthLogStore(store_path).query('2024-03-03'))
+
+        assert len(events) == 3
+        assert events[0]['ip_address'] == '127.0.0.1'
+
+    def test_counts_from_index(self, store_path, decompress_calls):
+        """Тест счетчиков за целые часы по индексу без распаковки"""
+        counts = AuthLogStore(store_path).count_actions('2024-03-01', '2024-03-02')
+
+        assert counts == {'LOGIN': 12, 'LOGOUT': 6}
+        assert decompress_calls == []
+
+    def test_counts_partial_hour(self, store_path):
+        """Тест счетчиков при интервале, захватывающем часть часа"""
+        counts = AuthLogStore(store_path).count_actions('2024-03-01 09:01:00', '2024-03-01 09:59:59')
+
+        assert counts == {'LOGOUT': 1, 'LOGIN': 1}
+
+    def test_invalid_moment(self, store_path):
+        """Тест ошибки для неверной границы интервала"""
+        with pytest.raises(ValueError):
+            list(AuthLogStore(store_path).query('вчера'))
+
+
+class TestAuthLogRoute:
+    def test_auth_log_endpoint(self, authenticated_client, tmp_path, monkeypatch):
+        """Тест API событий журнала авторизации за интервал"""
+        service = AuthService(log_file=str(tmp_path / 'auth_logs.csv'))
+        _write(service.writer, _day_rows('2024-03-01'))
+        monkeypatch.setattr(routes, 'auth_service', service)
+
+        response = authenticated_client.get('/api/auth-log?start=2024-03-01&end=2024-03-01&action=LOGIN')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['events']) == 6
+        assert data['counts'] == {'LOGIN': 6, 'LOGOUT': 3}
+        service.writer.close()
+
+    def test_auth_log_invalid_date(self, authenticated_client):
+        """Тест ошибки формата даты"""
+        response = authenticated_client.get('/api/auth-log?start=01.03.2024')
+
+        assert response.status_code == 400
@@ -0,0 +1,118 @@
+import os
+import time
+import pytest
+import tempfile
+from datetime import date
+from flask import g, session as flask_session
+from app import create_app, db
+from app.db_routing import PIN_SESSION_KEY, pin_after_write, reads_from_replica
+from app.models import Employee
+from app.services.cache import LRUCache
+from app.services.employee_service import EmployeeService
+from app.services.export_service import ExportService
+from app.services.search_service import SearchService
+
+
+def _add_employee(connection, full_name):
+    connection.execute(Employee.__table__.insert().values(
+        full_name=full_name, position='Разработчик', hire_date=date(2020, 1, 1), salary=100000
+    ))
+
+
+@pytest.fixture(scope='class')
+def replica_app():
+    """Приложение с основной базой и репликой в двух файлах SQLite.
+
+    Данные в файлах различаются, поэтому по результату видно, откуда шло чтение.
+    """
+    primary_fd, primary_path = tempfile.mkstemp()
+    replica_fd, replica_path = tempfile.mkstemp()
+    replica_url = f'sqlite:///{replica_path}'
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary_path}',
+        'SQLALCHEMY_BINDS': {'replica_0': replica_url},
+        'DATABASE_REPLICA_URLS': [replica_url],
+        'SECRET_KEY': 'test-secret-key'
+    })
+    with app.app_context():
+        db.create_all()
+        replica = db.engines['replica_0']
+        db.metadata.create_all(replica)
+        with db.engine.begin() as connection:
+            _add_employee(connection, 'Основная База')
+        with replica.begin() as connection:
+            _add_employee(connection, 'Реплика База')
+
+    yield app
+
+    # Метаданные bind-ов общие для всех приложений с этим db
+    db.metadatas.pop('replica_0', None)
+    for fd, path in ((primary_fd, primary_path), (replica_fd, replica_path)):
+        os.close(fd)
+        os.unlink(path)
+
+
+def _listed_names():
+    service = SearchService(count_cache=LRUCache(), page_cache=LRUCache())
+    return [row.full_name for row in service.list_employee_rows().items]
+
+
+class TestReplicaRouting:
+    def test_read_only_method_uses_replica(self, replica_app):
+        """Тест чтения списка сотрудников с реплики"""
+        with replica_app.test_request_context():
+            assert _listed_names() == ['Реплика База']
+
+    def test_other_reads_use_primary(self, replica_app):
+        """Тест чтения вне @replica_reads с основной базы"""
+        with replica_app.test_request_context():
+            assert [e.full_name for e in Employee.query.all()] == ['Основная База']
+            assert not reads_from_replica()
+
+    def test_generator_reads_replica_while_iterating(self, replica_app):
+        """Тест потоковой выгрузки с реплики"""
+        with replica_app.test_request_context():
+            chunks = list(ExportService().iter_rows(SearchService()._spec(None)))
+
+            assert [row.full_name for chunk in chunks for row in chunk] == ['Реплика База']
+
+    def test_read_after_write_uses_primary(self, replica_app):
+        """Тест чтения после записи в том же запросе с основной базы"""
+        with replica_app.test_request_context():
+            employee = EmployeeService().create_employee(
+                full_name='Новый Сотрудник', position='Тестировщик',
+                hire_date=date(2022, 1, 1), salary=90000, boss_id=None
+            )
+
+            try:
+                assert 'Новый Сотрудник' in _listed_names()
+                assert g.db_wrote
+            finally:
+                EmployeeService().delete_employee(employee.id)
+
+    def test_pin_after_write_survives_redirect(self, replica_app):
+        """Тест закрепления клиента за основной базой после записи"""
+        with replica_app.test_request_context():
+            g.db_wrote = True
+            pin_after_write(replica_app.response_class())
+            pinned_until = flask_session[PIN_SESSION_KEY]
+
+        assert pinned_until > time.time()
+        with replica_app.test_request_context():
+            flask_session[PIN_SESSION_KEY] = pinned_until
+            assert _listed_names() == ['Основная База']
+
+    def test_expired_pin_reads_replica(self, replica_app):
+        """Тест возврата к реплике после истечения закрепления"""
+        with replica_app.test_request_context():
+            flask_session[PIN_SESSION_KEY] = time.time() - 1
+            assert _listed_names() == ['Реплика База']
+
+
+class TestWithoutReplicas:
+    def test_reads_primary(self, app, init_database):
+        """Тест работы без настроенных реплик"""
+        with app.test_request_context():
+            assert not reads_from_replica()
+            assert len(_listed_names()) == Employee.query.count()
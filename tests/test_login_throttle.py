@@ -0,0 +1,134 @@
+import sqlite3
+import pytest
+import app.routes as routes
+from app import create_app
+from app.models import User
+from app.query_stats import count_queries
+from app.services import login_throttle as throttle_module
+from app.services.login_throttle import LoginThrottle, MemoryThrottleBackend, SqliteThrottleBackend
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttle_module.time, 'time', clock)
+    return clock
+
+
+class TestLoginThrottle:
+    def test_sliding_window(self, clock):
+        """Тест скользящего окна: лимит снимается, когда старейшая попытка выходит из окна"""
+        throttle = LoginThrottle(ip_limit=0, user_limit=3, window=60)
+        for moment in (1000, 1030, 1050):
+            clock.now = moment
+            throttle.record_failure('10.0.0.1', 'ivanov')
+
+        clock.now = 1055
+        assert throttle.check('10.0.0.1', 'ivanov') == pytest.approx(5)
+        clock.now = 1061
+        assert throttle.check('10.0.0.1', 'ivanov') == 0
+        assert throttle.stats()['rejected'] == {'ip': 0, 'user': 1}
+
+    def test_ip_limit_across_usernames(self, clock):
+        """Тест лимита адреса при переборе разных имен"""
+        throttle = LoginThrottle(ip_limit=3, user_limit=5, window=60)
+        for index in range(3):
+            throttle.record_failure('10.0.0.1', f'user{index}')
+
+        assert throttle.check('10.0.0.1', 'someone') > 0
+        assert throttle.check('10.0.0.2', 'someone') == 0
+
+    def test_events_feed_counters(self, clock):
+        """Тест учета FAILED_LOGIN и сброса счетчика имени при успешном входе"""
+        throttle = LoginThrottle(ip_limit=0, user_limit=2, window=60)
+        throttle.record_event('FAILED_LOGIN', 'Ivanov', '10.0.0.1')
+        throttle.record_event('LOGOUT', 'ivanov', '10.0.0.1')
+        throttle.record_event('FAILED_LOGIN', 'ivanov ', '10.0.0.1')
+        assert throttle.check('10.0.0.1', 'IVANOV') > 0
+
+        throttle.record_event('LOGIN', 'ivanov', '10.0.0.1')
+
+        assert throttle.check('10.0.0.1', 'ivanov') == 0
+
+    def test_memory_backend_evicts_keys(self):
+        """Тест вытеснения давно не использованных ключей"""
+        backend = MemoryThrottleBackend(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            backend.add(key, 1000, 1, 60)
+
+        assert backend.retry_after('a', 1001, 1, 60) == 0
+        assert backend.retry_after('c', 1001, 1, 60) == pytest.approx(59)
+
+    def test_sqlite_backend_shared(self, tmp_path, clock):
+        """Тест общих счетчиков двух процессов через файл SQLite"""
+        path = str(tmp_path / 'throttle.db')
+        first = LoginThrottle(ip_limit=0, user_limit=2, window=60, backend=SqliteThrottleBackend(path))
+        second = LoginThrottle(ip_limit=0, user_limit=2, window=60, backend=SqliteThrottleBackend(path))
+        first.record_failure('10.0.0.1', 'ivanov')
+        second.record_failure('10.0.0.2', 'ivanov')
+
+        assert first.check('10.0.0.3', 'ivanov') == pytest.approx(60)
+        clock.now += 61
+        assert second.check('10.0.0.3', 'ivanov') == 0
+
+    def test_backend_error_fails_open(self, clock):
+        """Тест разрешения входа при недоступном хранилище счетчиков"""
+        class BrokenBackend(MemoryThrottleBackend):
+            def retry_after(self, *args):
+                raise sqlite3.OperationalError('database is locked')
+
+        throttle = LoginThrottle(user_limit=1, backend=BrokenBackend())
+        throttle.record_failure('10.0.0.1', 'ivanov')
+
+        assert throttle.check('10.0.0.1', 'ivanov') == 0
+
+
+class TestLoginThrottleRoute:
+    def test_login_rejected_before_password_check(self, client, init_database, monkeypatch):
+        """Тест отказа в 429 без запроса пользователя и bcrypt после лимита неудачных входов"""
+        throttle = LoginThrottle(ip_limit=0, user_limit=2, window=60)
+        monkeypatch.setattr(routes, 'login_throttle', throttle)
+        monkeypatch.setattr(routes.auth_service, 'listeners', [throttle.record_event])
+        for _ in range(2):
+            response = client.post('/login', data={'username': 'testuser', 'password': 'wrong'})
+            assert response.status_code == 200
+
+        def fail(*args, **kwargs):
+            raise AssertionError('Пароль не должен проверяться')
+
+        monkeypatch.setattr(User, 'check_password', fail)
+        with count_queries() as stats:
+            response = client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) > 0
+        assert stats.count == 0
+
+    def test_client_address_behind_proxy(self, app, init_database, monkeypatch):
+        """Тест счетчика по адресу клиента из X-Forwarded-For при TRUSTED_PROXY_COUNT"""
+        proxied = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+            'WTF_CSRF_ENABLED': False,
+            'SECRET_KEY': 'test-secret-key',
+            'TRUSTED_PROXY_COUNT': 1
+        })
+        throttle = LoginThrottle(ip_limit=1, user_limit=0, window=60)
+        monkeypatch.setattr(routes, 'login_throttle', throttle)
+        throttle.record_failure('203.0.113.5', None)
+        credentials = {'username': 'testuser', 'password': 'testpassword'}
+
+        client = proxied.test_client()
+        blocked = client.post('/login', data=credentials, headers={'X-Forwarded-For': '203.0.113.5'})
+        allowed = client.post('/login', data=credentials, headers={'X-Forwarded-For': '198.51.100.7'})
+
+        assert blocked.status_code == 429
+        assert allowed.status_code == 302
\ No newline at end of file
@@ -0,0 +1,150 @@
+import json
+import multiprocessing
+import os
+import threading
+import pytest
+from app.metrics import MetricsRegistry, render_text
+
+# pid, которого заведомо нет среди процессов
+DEAD_PID = 2 ** 22 + 12345
+
+
+def _worker_process(directory, amount):
+    registry = MetricsRegistry()
+    registry.configure(directory)
+    requests = registry.counter('requests_total', 'Запросы', ('endpoint',))
+    latency = registry.histogram('latency_seconds', 'Время', ('endpoint',), buckets=(0.1, 1.0))
+    for _ in range(amount):
+        requests.inc(endpoint='main.employees')
+        latency.observe(0.05, endpoint='main.employees')
+    registry.flush()
+
+
+class TestMetricsRegistry:
+    def test_render_counter_and_gauge(self):
+        """Тест текстового формата счетчика и gauge"""
+        registry = MetricsRegistry()
+        requests = registry.counter('requests_total', 'Запросы', ('endpoint', 'status'))
+        in_flight = registry.gauge('in_flight', 'В обработке')
+        requests.inc(endpoint='main.login', status=200)
+        requests.inc(2, endpoint='main.login', status=200)
+        in_flight.set(3)
+
+        text = registry.render()
+
+        assert '# TYPE requests_total counter' in text
+        assert 'requests_total{endpoint="main.login",status="200"} 3' in text
+        assert 'in_flight 3' in text
+
+    def test_render_histogram(self):
+        """Тест накопительных корзин гистограммы"""
+        registry = MetricsRegistry()
+        latency = registry.histogram('latency_seconds', 'Время', ('endpoint',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            latency.observe(value, endpoint='main.employees')
+
+        text = registry.render()
+
+        assert 'latency_seconds_bucket{endpoint="main.employees",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{endpoint="main.employees",le="1"} 2' in text
+        assert 'latency_seconds_bucket{endpoint="main.employees",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{endpoint="main.employees"} 3' in text
+        assert 'latency_seconds_sum{endpoint="main.employees"} 5.55' in text
+
+    def test_label_escaping(self):
+        """Тест экранирования значений меток"""
+        text = render_text({'m': {
+            'kind': 'gauge', 'help': 'm', 'labels': ['path'], 'buckets': None,
+            'values': [[['a"b\\c'], 1]]
+        }})
+
+        assert 'm{path="a\\"b\\\\c"} 1' in text
+
+    def test_thread_safety(self):
+        """Тест счетчика при одновременной записи из потоков"""
+        registry = MetricsRegistry()
+        requests = registry.counter('requests_total', 'Запросы')
+
+        def work():
+            for _ in range(1000):
+                requests.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert 'requests_total 8000' in registry.render()
+
+
+class TestMultiProcessStore:
+    def test_snapshots_summed(self, tmp_path):
+        """Тест сложения снимков процессов; gauge завершенных процессов не учитываются"""
+        registry = MetricsRegistry()
+        registry.configure(str(tmp_path))
+        requests = registry.counter('requests_total', 'Запросы')
+        in_flight = registry.gauge('in_flight', 'В обработке')
+        requests.inc(2)
+        in_flight.set(1)
+        dead = {
+            'requests_total': {'kind': 'counter', 'help': 'Запросы', 'labels': [], 'buckets': None,
+                               'values': [[[], 5]]},
+            'in_flight': {'kind': 'gauge', 'help': 'В обработке', 'labels': [], 'buckets': None,
+                          'values': [[[], 4]]},
+        }
+        (tmp_path / f'metrics_{DEAD_PID}.json').write_text(json.dumps(dead), encoding='utf-8')
+
+        text = registry.render()
+
+        assert 'requests_total 7' in text
+        assert 'in_flight 1' in text
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='нужен fork')
+    def test_worker_processes(self, tmp_path):
+        """Тест сбора метрик нескольких процессов через каталог снимков"""
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_worker_process, args=(str(tmp_path), amount))
+                     for amount in (3, 4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        registry = MetricsRegistry()
+        registry.configure(str(tmp_path))
+        registry.counter('requests_total', 'Запросы', ('endpoint',))
+        text = registry.render()
+
+        assert 'requests_total{endpoint="main.employees"} 7' in text
+        assert 'latency_seconds_count{endpoint="main.employees"} 7' in text
+        assert len(os.listdir(tmp_path)) == 3
+
+
+class TestMetricsRoute:
+    def test_metrics_endpoint(self, client, authenticated_client, init_database):
+        """Тест экспозиции метрик запросов, базы и кешей"""
+        authenticated_client.get('/employees')
+        client.get('/login')
+
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.get_data(as_text=True)
+        assert 'http_requests_total{endpoint="main.employees",method="GET",status="200"}' in text
+        assert 'http_request_duration_seconds_bucket{endpoint="main.login",le="+Inf"}' in text
+        assert 'db_queries_total{endpoint="main.employees"}' in text
+        assert 'cache_hit_ratio{cache="employee_pages"}' in text
+
+    def test_metrics_token(self, app, client):
+        """Тест доступа к метрикам по токену"""
+        app.config['METRICS_TOKEN'] = 'secret'
+        try:
+            denied = client.get('/metrics')
+            allowed = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        finally:
+            app.config['METRICS_TOKEN'] = ''
+
+        assert denied.status_code == 401
+        assert allowed.status_code == 200
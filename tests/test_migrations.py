@@ -0,0 +1,137 @@
+import pytest
+from datetime import date
+from sqlalchemy import create_engine, inspect, select, text
+from app import db
+from app.migrations import MIGRATIONS, run_migrations
+from app.models import Employee, LoginLog
+from app.services.employee_filter import EmployeeFilter
+from app.services.search_service import _filtered_rows_select
+
+# Схема до справочника должностей и индексов
+LEGACY_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE,
+        password_hash VARCHAR(120) NOT NULL, email VARCHAR(120) NOT NULL UNIQUE,
+        created_at DATETIME, is_active BOOLEAN)''',
+    '''CREATE TABLE login_logs (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id),
+        login_time DATETIME, logout_time DATETIME, session_duration INTEGER,
+        ip_address VARCHAR(45), user_agent TEXT)''',
+    '''CREATE TABLE employees (
+        id INTEGER PRIMARY KEY, full_name VARCHAR(100) NOT NULL,
+        position VARCHAR(50) NOT NULL, hire_date DATE NOT NULL,
+        salary INTEGER NOT NULL, boss_id INTEGER REFERENCES employees (id))''',
+    "INSERT INTO employees VALUES (1, 'Иван Иванов', 'Разработчик', '2020-01-15', 100000, NULL)",
+    "INSERT INTO employees VALUES (2, 'Петр Петров', 'Менеджер', '2021-05-20', 150000, 1)",
+]
+
+
+def query_plan(statement):
+    """Текст плана выполнения запроса в текущей базе.
+
+    В PostgreSQL последовательное сканирование запрещается на время
+    транзакции: на маленькой тестовой таблице оно дешевле любого индекса,
+    а проверяется только то, что подходящий индекс планировщику доступен.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect)
+    params = {
+        name: value.isoformat() if isinstance(value, date) else value
+        for name, value in compiled.params.items()
+    }
+    if dialect.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+        return '\n'.join(row[-1] for row in rows)
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    rows = connection.exec_driver_sql(f'EXPLAIN {compiled}', params).all()
+    return '\n'.join(row[0] for row in rows)
+
+
+class TestMigrations:
+    def test_upgrade_legacy_database(self):
+        """Тест перевода старой схемы на текущую версию"""
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+
+        applied = run_migrations(engine)
+
+        assert applied == [migration.version for migration in MIGRATIONS]
+        inspector = inspect(engine)
+        employee_indexes = {index['name'] for index in inspector.get_indexes('employees')}
+        assert {index.name for index in Employee.__table__.indexes} <= employee_indexes
+        assert 'ix_login_logs_user_time' in {index['name'] for index in inspector.get_indexes('login_logs')}
+        assert {'positions', 'employee_closure', 'employee_rollups', 'table_versions'} <= set(inspector.get_table_names())
+        with engine.connect() as connection:
+            assert connection.execute(
+                text('SELECT COUNT(*) FROM employees WHERE position_id IS NULL')
+            ).scalar() == 0
+            # Строка версии создается заранее, запись в employees ее только обновляет
+            assert connection.execute(text('SELECT name FROM table_versions')).scalars().all() == ['employees']
+
+    def test_rerun_is_noop(self):
+        """Тест повторного запуска: примененные миграции пропускаются"""
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+
+        run_migrations(engine)
+
+        assert run_migrations(engine) == []
+
+    def test_upgrade_database_created_from_models(self, app):
+        """Тест миграций на базе, созданной db.create_all()"""
+        engine = create_engine('sqlite://')
+        db.metadata.create_all(engine)
+
+        assert run_migrations(engine) == [migration.version for migration in MIGRATIONS]
+        with engine.connect() as connection:
+            assert connection.execute(text('SELECT COUNT(*) FROM table_versions')).scalar() == 1
+
+
+class TestIndexUsage:
+    """Запросы сервисов по фильтрам и журналу входов используют индексы"""
+
+    @pytest.mark.parametrize('spec, index_name', [
+        (EmployeeFilter(min_salary=90000, max_salary=120000), 'ix_employees_salary_id'),
+        (EmployeeFilter(start_date=date(2021, 1, 1), end_date=date(2021, 12, 31)), 'ix_employees_hire_date_id'),
+        (EmployeeFilter(position='Разработчик'), 'ix_employees_position_salary'),
+    ])
+    def test_filter_uses_index(self, app, init_database, spec, index_name):
+        """Тест использования индекса фильтрами списка сотрудников"""
+        with app.app_context():
+            plan = query_plan(_filtered_rows_select(spec))
+
+            assert index_name in plan
+
+    @pytest.mark.parametrize('sort_by', ['salary', 'hire_date', 'full_name', 'position'])
+    def test_sorted_page_uses_index(self, app, init_database, sort_by):
+        """Тест чтения страницы, отсортированной по столбцу, по индексу (столбец, id)"""
+        with app.app_context():
+            plan = query_plan(_filtered_rows_select(EmployeeFilter(), sort_by, 'desc').limit(20))
+
+            assert f'ix_employees_{"position_name" if sort_by == "position" else sort_by}_id' in plan
+
+    def test_subordinates_use_index(self, app, init_database):
+        """Тест поиска подчиненных по индексу boss_id"""
+        with app.app_context():
+            plan = query_plan(select(Employee.id).where(Employee.boss_id == 1))
+
+            assert 'ix_employees_boss_id' in plan
+
+    def test_user_logs_use_index(self, app, init_database):
+        """Тест чтения журнала пользователя без отдельной сортировки"""
+        with app.app_context():
+            plan = query_plan(
+                select(LoginLog).where(LoginLog.user_id == 1).order_by(LoginLog.login_time.desc())
+            )
+
+            assert 'ix_login_logs_user_time' in plan
+            assert 'TEMP B-TREE' not in plan
+            assert 'Sort' not in plan
@@ -0,0 +1,174 @@
+import threading
+import bcrypt
+import pytest
+from app import db
+from app.models import User
+from app.password_hasher import (
+    MIN_ROUNDS, HasherBusyError, PasswordHasher, calibrate_rounds, hash_rounds, init_password_hasher,
+    password_hasher
+)
+
+
+@pytest.fixture
+def configured_hasher(app):
+    """Глобальный хешер с настройками теста; после теста - настройки приложения"""
+    yield password_hasher
+    init_password_hasher(app)
+
+
+def _occupy(hasher):
+    """Занимает единственный поток пула до release.set()"""
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=hasher._run, args=(block,))
+    thread.start()
+    assert started.wait(5)
+    return release, thread
+
+
+class TestPasswordHasher:
+    def test_hash_and_verify(self):
+        """Тест хеширования с заданной стоимостью и проверки пароля"""
+        hasher = PasswordHasher(rounds=4, workers=2)
+
+        hashed = hasher.hash('secret')
+
+        assert hash_rounds(hashed) == 4
+        assert hasher.verify('secret', hashed)
+        assert not hasher.verify('wrong', hashed)
+        hasher.shutdown()
+
+    def test_needs_rehash(self):
+        """Тест признака устаревшей стоимости хеша"""
+        hasher = PasswordHasher(rounds=5)
+        old = bcrypt.hashpw(b'secret', bcrypt.gensalt(4)).decode('utf-8')
+        current = bcrypt.hashpw(b'secret', bcrypt.gensalt(5)).decode('utf-8')
+
+        assert hasher.needs_rehash(old)
+        assert not hasher.needs_rehash(current)
+        assert hash_rounds('not a hash') is None
+
+    def test_calibrate_rounds(self):
+        """Тест подбора стоимости: недостижимо малая цель - нижняя граница, большая - верхняя"""
+        assert calibrate_rounds(0.001, min_rounds=4, max_rounds=6) == 4
+        assert calibrate_rounds(10 ** 6, min_rounds=4, max_rounds=6) == 6
+
+    def test_calibration_floor_is_bcrypt_default(self):
+        """Тест нижней границы подбора: не дешевле стоимости bcrypt.gensalt() по умолчанию"""
+        assert calibrate_rounds(0.001) == hash_rounds(bcrypt.gensalt().decode('ascii'))
+
+    def test_calibration_runs_in_background(self, monkeypatch):
+        """Тест подбора стоимости в фоне: до его конца хеширование идет с MIN_ROUNDS"""
+        release = threading.Event()
+        
+        def slow_calibration(target_ms):
+            release.wait(5)
+            return MIN_ROUNDS + 1
+        
+        monkeypatch.setattr('app.password_hasher.calibrate_rounds', slow_calibration)
+        hasher = PasswordHasher(target_ms=123.456, workers=1)
+        try:
+            assert hasher.rounds == MIN_ROUNDS
+        finally:
+            release.set()
+        hasher._calibration.join(5)
+        
+        assert hasher.rounds == MIN_ROUNDS + 1
+        assert PasswordHasher(target_ms=123.456).rounds == MIN_ROUNDS + 1
+        hasher.shutdown()
+    
+    def test_hash_never_cheaper_than_min_rounds(self):
+        """Тест сохранения стоимости пересчитываемого хеша"""
+        hasher = PasswordHasher(rounds=4)
+
+        assert hash_rounds(hasher.hash('secret', min_rounds=5)) == 5
+        hasher.shutdown()
+
+    def test_busy_when_queue_full(self):
+        """Тест немедленного отказа при занятом пуле и заполненной очереди"""
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+        release, thread = _occupy(hasher)
+        try:
+            with pytest.raises(HasherBusyError):
+                hasher.hash('secret')
+            assert hasher.stats()['rejected'] == 1
+            assert hasher.stats()['in_flight'] == 1
+        finally:
+            release.set()
+            thread.join()
+
+        assert hasher.verify('secret', hasher.hash('secret'))
+        hasher.shutdown()
+
+    def test_parallel_operations(self):
+        """Тест одновременных проверок из нескольких потоков запросов"""
+        hasher = PasswordHasher(rounds=4, workers=2, max_queue=8)
+        hashed = hasher.hash('secret')
+        results = []
+
+        def check():
+            results.append(hasher.verify('secret', hashed))
+
+        threads = [threading.Thread(target=check) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [True] * 10
+        hasher.shutdown()
+
+
+class TestPasswordRoutes:
+    def _create_user(self, app, rounds):
+        with app.app_context():
+            user = User(username='rehashuser', email='rehash@example.com')
+            user.password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(rounds)).decode('utf-8')
+            db.session.add(user)
+            db.session.commit()
+
+    def test_rehash_on_login(self, app, client, init_database, configured_hasher):
+        """Тест пересчета хеша с устаревшей стоимостью при успешном входе"""
+        self._create_user(app, 4)
+        configured_hasher.configure(rounds=5)
+
+        response = client.post('/login', data={'username': 'rehashuser', 'password': 'password123'})
+
+        assert response.status_code == 302
+        with app.app_context():
+            user = User.query.filter_by(username='rehashuser').first()
+            assert hash_rounds(user.password_hash) == 5
+            assert user.check_password('password123')
+
+    def test_login_when_rehash_busy(self, app, client, init_database, configured_hasher, monkeypatch):
+        """Тест входа с верным паролем, когда на пересчет хеша нет места в пуле"""
+        self._create_user(app, 4)
+        configured_hasher.configure(rounds=5)
+        
+        def busy(*args, **kwargs):
+            raise HasherBusyError('busy')
+        
+        monkeypatch.setattr(configured_hasher, 'hash', busy)
+        response = client.post('/login', data={'username': 'rehashuser', 'password': 'password123'})
+        
+        assert response.status_code == 302
+        with app.app_context():
+            assert hash_rounds(User.query.filter_by(username='rehashuser').first().password_hash) == 4
+    
+    def test_login_busy(self, app, client, init_database, configured_hasher):
+        """Тест ответа 503 при переполненной очереди хеширования"""
+        self._create_user(app, 4)
+        configured_hasher.configure(rounds=4, workers=1, max_queue=0)
+        release, thread = _occupy(configured_hasher)
+        try:
+            response = client.post('/login', data={'username': 'rehashuser', 'password': 'password123'})
+        finally:
+            release.set()
+            thread.join()
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,120 @@
+import os
+import pytest
+import tempfile
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from config import DB_POOL_PROFILES, engine_options
+from app.pool_stats import InstrumentedQueuePool, PoolStats, instrumented_engine_options
+
+
+@pytest.fixture
+def small_pool():
+    """Engine с пулом на одно соединение без переполнения"""
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(
+        f'sqlite:///{db_path}', poolclass=InstrumentedQueuePool,
+        pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    stats = PoolStats(engine).attach()
+
+    yield engine, stats
+
+    engine.dispose()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+class TestEngineOptions:
+    def test_profile_values(self, monkeypatch):
+        """Тест настроек пула из профиля"""
+        monkeypatch.delenv('DB_POOL_SIZE', raising=False)
+        options = engine_options('postgresql://localhost/employees_db', 'web')
+
+        assert options == DB_POOL_PROFILES['web']
+
+    def test_env_overrides_profile(self, monkeypatch):
+        """Тест переопределения профиля переменными окружения"""
+        monkeypatch.setenv('DB_POOL_SIZE', '3')
+        monkeypatch.setenv('DB_POOL_PRE_PING', 'false')
+        options = engine_options('postgresql://localhost/employees_db', 'default')
+
+        assert options['pool_size'] == 3
+        assert options['pool_pre_ping'] is False
+        assert options['max_overflow'] == DB_POOL_PROFILES['default']['max_overflow']
+
+    @pytest.mark.parametrize('url', ['sqlite://', 'sqlite:///:memory:'])
+    def test_sqlite_memory_without_pool_options(self, url):
+        """Тест отсутствия настроек пула для SQLite в памяти"""
+        assert engine_options(url, 'web') == {}
+
+    def test_unknown_profile(self):
+        """Тест ошибки для неизвестного профиля"""
+        with pytest.raises(ValueError):
+            engine_options('postgresql://localhost/employees_db', 'huge')
+
+    def test_instrumented_pool_class(self):
+        """Тест подстановки замеряющего пула только для QueuePool-настроек"""
+        assert instrumented_engine_options({'pool_size': 5})['poolclass'] is InstrumentedQueuePool
+        assert 'poolclass' not in instrumented_engine_options({})
+
+
+class TestPoolStats:
+    def test_checkout_and_hold(self, small_pool):
+        """Тест учета выдачи и возврата соединения"""
+        engine, stats = small_pool
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            busy = stats.to_dict()
+
+        idle = stats.to_dict()
+        assert busy['checked_out'] == 1
+        assert busy['saturation'] == 1.0
+        assert idle['checked_out'] == 0
+        assert idle['checkouts'] == 1
+        assert idle['checkout_wait_ms']['max'] is not None
+        assert idle['hold_ms']['max'] is not None
+        assert idle['connections']['opened'] == 1
+
+    def test_timeout_when_pool_exhausted(self, small_pool):
+        """Тест учета ожидания сверх pool_timeout"""
+        engine, stats = small_pool
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+
+        result = stats.to_dict()
+        assert result['timeouts'] == 1
+        assert result['peak_checked_out'] == 1
+        assert result['checkout_wait_ms']['max'] >= 50
+
+    def test_connection_lifetime_after_dispose(self, small_pool):
+        """Тест времени жизни соединений и сохранения счетчиков после dispose"""
+        engine, stats = small_pool
+        with engine.connect():
+            pass
+        engine.dispose()
+        with engine.connect():
+            pass
+
+        result = stats.to_dict()
+        assert result['connections']['closed'] == 1
+        assert result['connections']['avg_lifetime_s'] is not None
+        assert result['checkouts'] == 2
+        assert stats.waits_recorded == 2
+
+
+class TestPoolStatsRoute:
+    def test_pool_stats_endpoint(self, authenticated_client):
+        """Тест API состояния пулов"""
+        response = authenticated_client.get('/api/db/pool-stats')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 'default' in data
+        assert 'checkout_wait_ms' in data['default']
+
+    def test_pool_stats_requires_login(self, client):
+        """Тест доступа к API состояния пулов без входа"""
+        response = client.get('/api/db/pool-stats')
+
+        assert response.status_code == 302
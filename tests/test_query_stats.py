@@ -0,0 +1,124 @@
+import logging
+import pytest
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import Employee, LoginLog, User
+from app.query_stats import QueryStats, count_queries, statement_shape
+
+
+@pytest.fixture
+def many_employees(app, init_database):
+    """Тридцать дополнительных сотрудников с руководителями и журнал входов"""
+    with app.app_context():
+        bosses = [employee.id for employee in Employee.query.all()]
+        db.session.add_all([
+            Employee(
+                full_name=f'Сотрудник {index:02d}',
+                position='Разработчик',
+                hire_date=date(2022, 1, 1),
+                salary=80000 + index,
+                boss_id=bosses[index % len(bosses)]
+            ) for index in range(30)
+        ])
+        user = User.query.first()
+        db.session.add_all([
+            LoginLog(user_id=user.id, login_time=datetime(2024, 1, 1) + timedelta(hours=index))
+            for index in range(10)
+        ])
+        db.session.commit()
+
+
+class TestStatementShape:
+    def test_whitespace_normalized(self):
+        """Тест нормализации пробелов"""
+        assert statement_shape('SELECT  id\n  FROM employees') == 'SELECT id FROM employees'
+
+    @pytest.mark.parametrize('statement', [
+        'SELECT id FROM employees WHERE id IN (?, ?, ?)',
+        'SELECT id FROM employees WHERE id IN (%(id_1_1)s, %(id_1_2)s)',
+        'SELECT id FROM employees WHERE id IN (%s, %s, %s, %s)',
+    ])
+    def test_in_lists_collapsed(self, statement):
+        """Тест сворачивания списков IN разной длины"""
+        assert statement_shape(statement) == 'SELECT id FROM employees WHERE id IN (?)'
+
+    def test_repeated_shapes(self):
+        """Тест поиска повторяющихся форм запросов"""
+        stats = QueryStats()
+        for _ in range(6):
+            stats.record('SELECT * FROM employees WHERE id = ?', 0.001)
+        stats.record('SELECT * FROM users', 0.001)
+
+        assert stats.count == 7
+        assert stats.repeated(5) == [('SELECT * FROM employees WHERE id = ?', 6)]
+        assert stats.repeated(10) == []
+
+
+class TestQueryCounting:
+    def test_count_queries(self, app, init_database):
+        """Тест подсчета запросов внутри блока"""
+        with app.app_context():
+            with count_queries() as stats:
+                Employee.query.all()
+                User.query.all()
+
+            assert stats.count == 2
+            assert stats.total_time > 0
+
+    def test_lazy_loading_detected(self, app, many_employees):
+        """Тест обнаружения N+1 при ленивой загрузке подчиненных в цикле"""
+        with app.app_context():
+            db.session.expire_all()
+            with count_queries() as stats:
+                [len(employee.subordinates) for employee in Employee.query.all()]
+
+            assert stats.repeated(5)
+
+    def test_debug_headers(self, app, authenticated_client, init_database):
+        """Тест заголовков со статистикой запросов в режиме отладки"""
+        app.debug = True
+        try:
+            response = authenticated_client.get('/employees')
+        finally:
+            app.debug = False
+
+        assert int(response.headers['X-Query-Count']) >= 1
+        assert 'X-Query-Time-Ms' in response.headers
+
+    def test_no_headers_without_debug(self, authenticated_client, init_database):
+        """Тест отсутствия заголовков вне режима отладки"""
+        response = authenticated_client.get('/employees')
+
+        assert 'X-Query-Count' not in response.headers
+
+    def test_repeats_logged_without_debug(self, app, authenticated_client, init_database, caplog):
+        """Тест записи в журнал о повторяющихся запросах"""
+        app.config['QUERY_REPEAT_THRESHOLD'] = 1
+        try:
+            with caplog.at_level(logging.WARNING, logger='app.query_stats'):
+                authenticated_client.get('/employees')
+        finally:
+            app.config['QUERY_REPEAT_THRESHOLD'] = 5
+
+        assert any('/employees' in record.getMessage() for record in caplog.records)
+
+
+class TestQueryBudgets:
+    """Число запросов страниц не зависит от числа строк"""
+
+    @pytest.mark.parametrize('url, max_queries', [
+        ('/employees', 3),
+        ('/employees?sort_by=salary&sort_order=desc', 3),
+        ('/employees?search=Сотрудник', 4),
+        ('/api/employees', 3),
+        ('/api/employees/bosses?q=Сотрудник', 3),
+        ('/api/positions/stats', 3),
+        ('/employee/1', 4),
+        ('/user/logs', 3),
+    ])
+    def test_route_budget(self, authenticated_client, many_employees, query_budget, url, max_queries):
+        """Тест бюджета запросов страницы"""
+        with query_budget(max_queries):
+            response = authenticated_client.get(url)
+
+        assert response.status_code == 200
@@ -333,4 +333,225 @@ class TestRoutes:
         assert response.status_code == 200
         
         data = json.loads(response.data)
-        assert isinstance(data, list)
\ No newline at end of file
+        assert isinstance(data, list)
+
+    def test_api_employees_cursor(self, authenticated_client):
+        """Тест API списка сотрудников с курсорной пагинацией"""
+        response = authenticated_client.get('/api/employees?sort_by=salary&sort_order=desc&per_page=2')
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert 'items' in data
+        assert 'next_cursor' in data
+        
+        if data['has_next']:
+            response = authenticated_client.get(
+                f"/api/employees?sort_by=salary&sort_order=desc&per_page=2&cursor={data['next_cursor']}"
+            )
+            assert response.status_code == 200
+        
+        response = authenticated_client.get('/api/employees?cursor=broken')
+        assert response.status_code == 400
+        
+        # Подделанный курсор не доходит до базы и не раскрывает SQL
+        from app.services.search_service import SearchService
+        cursor = SearchService.encode_cursor('salary', [1, 2], 1)
+        response = authenticated_client.get(f'/api/employees?sort_by=salary&cursor={cursor}')
+        assert response.status_code == 400
+        assert 'SELECT' not in response.get_data(as_text=True)
+        
+    def test_api_cache_stats(self, authenticated_client):
+        """Тест API статистики кешей"""
+        authenticated_client.get('/employees')
+        authenticated_client.get('/employees')
+        
+        response = authenticated_client.get('/api/cache/stats')
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert data['employee_pages']['hits'] >= 1
+        assert 'misses' in data['employee_counts']
+        
+    def test_export_employees(self, authenticated_client):
+        """Тест потоковой выгрузки сотрудников"""
+        response = authenticated_client.get('/employees/export?format=csv&min_salary=100000')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert response.is_streamed
+        
+        lines = response.get_data(as_text=True).splitlines()
+        assert lines[0].startswith('id,full_name')
+        
+        response = authenticated_client.get('/employees/export?format=jsonl')
+        assert response.status_code == 200
+        
+        response = authenticated_client.get('/employees/export?format=xml')
+        assert response.status_code == 400
+        
+    def test_import_employees(self, authenticated_client):
+        """Тест загрузки CSV с сотрудниками"""
+        import io
+        csv_data = (
+            'full_name,position,hire_date,salary\n'
+            'Новый Сотрудник,Аналитик,2024-04-01,70000\n'
+            'Без Зарплаты,Аналитик,2024-04-01,\n'
+        ).encode('utf-8')
+        response = authenticated_client.post(
+            '/employees/import',
+            data={'file': (io.BytesIO(csv_data), 'employees.csv')},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['imported'] == 1
+        assert data['errors'][0]['line'] == 3
+        assert data['warnings'] == []
+        
+        response = authenticated_client.post('/employees/import', data={}, content_type='multipart/form-data')
+        assert response.status_code == 400
+        
+    def test_api_bulk_operations(self, init_database, authenticated_client):
+        """Тест API массовых операций над сотрудниками"""
+        response = authenticated_client.post('/api/employees/raise-salary', json={
+            'filters': {'position': 'Разработчик'}, 'percent': 10
+        })
+        assert response.status_code == 200
+        assert json.loads(response.data)['updated'] == 2
+        
+        response = authenticated_client.post('/api/employees/2/reassign', json={'to_id': 1})
+        assert json.loads(response.data)['moved'] == [3, 5]
+        
+        response = authenticated_client.post('/api/employees/delete', json={'ids': [2]})
+        assert json.loads(response.data)['deleted'] == [2]
+        
+        response = authenticated_client.post('/api/employees/delete', json={'ids': 'all'})
+        assert response.status_code == 400
+        
+        response = authenticated_client.post('/api/employees/delete', json={'ids': [True]})
+        assert response.status_code == 400
+        
+        for to_id in ('1', [1], {'id': 1}, True):
+            response = authenticated_client.post('/api/employees/1/reassign', json={'to_id': to_id})
+            assert response.status_code == 400
+        
+    def test_api_raise_salary_validation(self, init_database, authenticated_client):
+        """Тест проверки процента и обязательного фильтра при массовом повышении"""
+        filters = {'position': 'Разработчик'}
+        for percent in ('nan', 'inf', -100, -500, 5000):
+            response = authenticated_client.post('/api/employees/raise-salary', json={
+                'filters': filters, 'percent': percent
+            })
+            assert response.status_code == 400
+        
+        response = authenticated_client.post('/api/employees/raise-salary', json={'filters': {}, 'percent': 10})
+        assert response.status_code == 400
+        response = authenticated_client.post('/api/employees/raise-salary', json={'percent': 10, 'all': 'yes'})
+        assert response.status_code == 400
+        
+        response = authenticated_client.post('/api/employees/raise-salary', json={'percent': 10, 'all': True})
+        assert response.status_code == 200
+        assert json.loads(response.data)['updated'] == 5
+        
+    def test_api_boss_lookup(self, init_database, authenticated_client):
+        """Тест постраничного поиска кандидатов в руководители"""
+        response = authenticated_client.get('/api/employees/bosses?per_page=2&exclude=1')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [boss['full_name'] for boss in data['items']] == ['Анна Аннова', 'Мария Маринова']
+        assert data['has_next'] is True
+        
+        response = authenticated_client.get('/api/employees/bosses?q=Петр')
+        data = json.loads(response.data)
+        assert [boss['id'] for boss in data['items']] == [2]
+        assert data['has_next'] is False
+        
+    def test_edit_employee_boss_validation(self, init_database, authenticated_client):
+        """Тест формы: в списке только выбранный руководитель, boss_id проверяется по базе"""
+        response = authenticated_client.get('/employee/3')
+        response_text = response.get_data(as_text=True)
+        assert 'Петр Петров (Менеджер)' in response_text
+        assert 'Мария Маринова' not in response_text
+        
+        data = {
+            'full_name': 'Сидор Сидоров',
+            'position': 'Аналитик',
+            'hire_date': '2022-03-10',
+            'salary': '120000',
+            'submit': 'Сохранить'
+        }
+        response = authenticated_client.post('/employee/3', data=dict(data, boss_id='999'))
+        assert 'Руководитель не найден' in response.get_data(as_text=True)
+        
+        response = authenticated_client.post('/employee/3', data=dict(data, boss_id='3'))
+        assert 'Сотрудник не может быть руководителем сам себе' in response.get_data(as_text=True)
+        
+        response = authenticated_client.post('/employee/3', data=dict(data, boss_id='5'))
+        assert response.status_code == 302
+        with authenticated_client.application.app_context():
+            from app.models import Employee
+            from app import db
+            assert db.session.get(Employee, 3).boss_id == 5
+        
+    def test_api_employee_subtree(self, init_database, authenticated_client):
+        """Тест API поддерева сотрудника"""
+        response = authenticated_client.get('/api/employees/2/subtree')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [row['id'] for row in data['items']] == [5, 3]
+        assert [row['id'] for row in data['ancestors']] == [1]
+        assert data['total'] == 2
+        
+        response = authenticated_client.get('/api/employees/999/subtree')
+        assert response.status_code == 404
+        
+    def test_api_employee_subtree_pages(self, init_database, authenticated_client):
+        """Тест постраничного чтения поддерева по курсору"""
+        response = authenticated_client.get('/api/employees/1/subtree?limit=3')
+        data = json.loads(response.data)
+        assert [row['id'] for row in data['items']] == [4, 2, 5]
+        assert data['total'] == 4
+        assert data['has_next']
+        
+        response = authenticated_client.get(f"/api/employees/1/subtree?limit=3&cursor={data['next_cursor']}")
+        data = json.loads(response.data)
+        assert [row['id'] for row in data['items']] == [3]
+        assert data['total'] == 4
+        assert not data['has_next']
+        
+        response = authenticated_client.get('/api/employees/1/subtree?cursor=not-a-cursor')
+        assert response.status_code == 400
+        
+    def test_api_employee_rollup(self, init_database, authenticated_client):
+        """Тест API сводки по структуре сотрудника"""
+        response = authenticated_client.get('/api/employees/2/rollup')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['headcount'] == 3
+        assert data['salary_total'] == 360000
+        
+        response = authenticated_client.get('/api/employees/999/rollup')
+        assert response.status_code == 404
+        
+    def test_edit_employee_rejects_subordinate_boss(self, init_database, authenticated_client):
+        """Тест формы: руководителем нельзя выбрать своего подчиненного"""
+        response = authenticated_client.post('/employee/1', data={
+            'full_name': 'Иван Иванов',
+            'position': 'Разработчик',
+            'hire_date': '2020-01-15',
+            'salary': '100000',
+            'boss_id': '5',
+            'submit': 'Сохранить'
+        })
+        assert 'Нельзя назначить руководителем своего подчиненного' in response.get_data(as_text=True)
+        
+        response = authenticated_client.post('/api/employees/1/reassign', json={'to_id': 3})
+        assert response.status_code == 400
+        
+    def test_api_position_stats(self, init_database, authenticated_client):
+        """Тест API статистики по должностям"""
+        response = authenticated_client.get('/api/positions/stats?max_salary=120000')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert {row['position']: row['headcount'] for row in data} == {
+            'Разработчик': 2, 'Аналитик': 1, 'Тестировщик': 1
+        }
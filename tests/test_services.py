@@ -9,17 +9,14 @@ from app import db
 
 class TestAuthService:
     
-    def test_init_auth_service(self):
+    def test_init_auth_service(self, tmp_path):
         """Тест инициализации AuthService"""
-        service = AuthService(log_file='test_auth.csv')
-        assert service.log_file == 'test_auth.csv'
+        log_file = str(tmp_path / 'test_auth.csv')
+        service = AuthService(log_file=log_file)
+        assert service.log_file == log_file
         
         # Проверяем, что файл создан
-        assert os.path.exists('test_auth.csv')
-        
-        # Очистка после тестов
-        if os.path.exists('test_auth.csv'):
-            os.remove('test_auth.csv')
+        assert os.path.exists(log_file)
     
     def test_log_auth_event(self, auth_service):
         """Тест логирования события аутентификации"""
@@ -34,10 +31,10 @@ class TestAuthService:
         assert os.path.exists(auth_service.log_file)
         assert os.path.getsize(auth_service.log_file) > 0
         
-    def test_create_and_update_login_log(self, app, init_database):
+    def test_create_and_update_login_log(self, app, init_database, tmp_path):
         """Тест создания и обновления лога входа"""
         with app.app_context():
-            auth_service = AuthService(log_file='test_auth.csv')
+            auth_service = AuthService(log_file=str(tmp_path / 'test_auth.csv'))
             from app.models import User
             
             user = User.query.first()
@@ -179,6 +176,69 @@ class TestEmployeeService:
             # Проверяем, что подчиненному сбросился boss_id
             updated_subordinate = employee_service.get_employee_by_id(subordinate.id)
             assert updated_subordinate.boss_id is None
+    
+    def test_raise_salary_by_filter(self, app, init_database, employee_service):
+        """Тест массового повышения зарплаты по фильтру"""
+        from app.services.employee_filter import EmployeeFilter
+        with app.app_context():
+            updated = employee_service.raise_salary(EmployeeFilter(position='Разработчик'), 10)
+            
+            assert updated == 2
+            assert employee_service.get_employee_by_id(1).salary == 110000
+            assert employee_service.get_employee_by_id(4).salary == 121000
+            assert employee_service.get_employee_by_id(2).salary == 150000
+    
+    def test_raise_salary_with_search(self, app, init_database, employee_service):
+        """Тест повышения зарплаты с текстовым поиском в фильтре"""
+        from app.services.employee_filter import EmployeeFilter
+        with app.app_context():
+            updated = employee_service.raise_salary(EmployeeFilter(search='Сидор', min_salary=100000), 5)
+            
+            assert updated == 1
+            assert employee_service.get_employee_by_id(3).salary == 126000
+    
+    def test_raise_salary_invalid_percent(self, app, init_database, employee_service):
+        """Тест отказа для нечислового, отрицательного до нуля и слишком большого процента"""
+        from app.services.employee_filter import EmployeeFilter
+        with app.app_context():
+            for percent in (float('nan'), float('inf'), -100, -500, 1001):
+                with pytest.raises(ValueError):
+                    employee_service.raise_salary(EmployeeFilter(position='Разработчик'), percent)
+            
+            assert employee_service.get_employee_by_id(1).salary == 100000
+    
+    def test_reassign_subordinates(self, app, init_database, employee_service):
+        """Тест перевода всех подчиненных к другому руководителю"""
+        with app.app_context():
+            moved = employee_service.reassign_subordinates(2, 1)
+            
+            assert moved == [3, 5]
+            assert Employee.query.filter_by(boss_id=2).count() == 0
+            assert employee_service.get_employee_by_id(5).boss_id == 1
+    
+    def test_reassign_subordinates_to_own_subordinate(self, app, init_database, employee_service):
+        """Тест перевода к одному из подчиненных: он сам остается на месте"""
+        with app.app_context():
+            moved = employee_service.reassign_subordinates(2, 3)
+            
+            assert moved == [5]
+            assert employee_service.get_employee_by_id(3).boss_id == 2
+    
+    def test_reassign_subordinates_unknown_boss(self, app, init_database, employee_service):
+        """Тест перевода к несуществующему руководителю"""
+        with app.app_context():
+            with pytest.raises(ValueError):
+                employee_service.reassign_subordinates(2, 999)
+    
+    def test_delete_employees(self, app, init_database, employee_service):
+        """Тест удаления набора сотрудников одной транзакцией"""
+        with app.app_context():
+            deleted = employee_service.delete_employees([2, 4, 999])
+            
+            assert deleted == [2, 4]
+            assert Employee.query.count() == 3
+            assert employee_service.get_employee_by_id(3).boss_id is None
+            assert employee_service.get_employee_by_id(5).boss_id is None
 
 class TestSearchService:
     
@@ -275,4 +335,823 @@ class TestSearchService:
             
             # Третья страница
             page3 = search_service.search_employees('', page=3, per_page=2)
-            assert len(page3.items) == 1
\ No newline at end of file
+            assert len(page3.items) == 1
+
+    def test_keyset_pagination_matches_offset(self, app, init_database, search_service):
+        """Тест курсорной пагинации по всем столбцам сортировки"""
+        with app.app_context():
+            for sort_by in ('id', 'full_name', 'position', 'hire_date', 'salary'):
+                for sort_order in ('asc', 'desc'):
+                    expected = [emp.id for emp in search_service.get_sorted_employees(
+                        sort_by, sort_order, page=1, per_page=10
+                    ).items]
+                    
+                    collected = []
+                    cursor = None
+                    while True:
+                        page = search_service.get_sorted_employees_keyset(
+                            sort_by, sort_order, cursor, per_page=2
+                        )
+                        collected.extend(emp.id for emp in page.items)
+                        if not page.has_next:
+                            break
+                        cursor = page.next_cursor
+                    
+                    if sort_by in ('id', 'salary', 'hire_date'):
+                        assert collected == expected
+                    else:
+                        # При равных значениях порядок определяется id
+                        assert sorted(collected) == sorted(expected)
+                        assert len(collected) == 5
+    
+    def test_keyset_pagination_with_filters(self, app, init_database, search_service):
+        """Тест курсорной пагинации с фильтрами и поиском"""
+        with app.app_context():
+            page = search_service.get_sorted_employees_keyset(
+                'salary', 'asc', None, per_page=10, min_salary=100000
+            )
+            assert [emp.salary for emp in page.items] == [100000, 110000, 120000, 150000]
+            assert page.next_cursor is None
+            
+            page = search_service.search_employees_keyset('Разработчик', None, per_page=1)
+            assert len(page.items) == 1
+            page = search_service.search_employees_keyset('Разработчик', page.next_cursor, per_page=1)
+            assert len(page.items) == 1
+            assert page.items[0].position == 'Разработчик'
+            assert not page.has_next
+    
+    def test_keyset_invalid_cursor(self, app, init_database, search_service):
+        """Тест обработки поврежденного курсора"""
+        from app.services.search_service import InvalidCursorError
+        with app.app_context():
+            with pytest.raises(InvalidCursorError):
+                search_service.get_sorted_employees_keyset('id', 'asc', 'not-a-cursor', per_page=2)
+            
+            cursor = search_service.encode_cursor('salary', 100000, 1)
+            with pytest.raises(InvalidCursorError):
+                search_service.get_sorted_employees_keyset('hire_date', 'asc', cursor, per_page=2)
+            
+            # Значение курсора должно иметь тип столбца сортировки
+            for sort_by, value in (('salary', [1, 2]), ('id', True), ('full_name', 5),
+                                   ('position', None), ('hire_date', '2020-13-01')):
+                cursor = search_service.encode_cursor(sort_by, value, 1)
+                with pytest.raises(InvalidCursorError):
+                    search_service.get_sorted_employees_keyset(sort_by, 'asc', cursor, per_page=2)
+    
+    def test_search_backend_sqlite_fts(self, app, init_database):
+        """Тест полнотекстового бэкенда поиска на SQLite"""
+        from app.services.search_backend import get_search_backend, SqliteFtsSearchBackend
+        with app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                pytest.skip('FTS5 есть только в SQLite')
+            assert isinstance(get_search_backend(), SqliteFtsSearchBackend)
+    
+    def test_search_index_skipped_without_privileges(self):
+        """Тест пропуска триграммного индекса, если роли нельзя создать расширение"""
+        from unittest.mock import MagicMock
+        from app.services.search_backend import install_search_index
+        connection = MagicMock()
+        connection.dialect.name = 'postgresql'
+        connection.exec_driver_sql.side_effect = [
+            MagicMock(first=MagicMock(return_value=(1,))),
+            Exception('permission denied to create extension "pg_trgm"'),
+        ]
+        
+        assert install_search_index(connection) is False
+        connection.begin_nested.return_value.rollback.assert_called_once()
+    
+    def test_search_index_synced_by_triggers(self, app, init_database, search_service, employee_service):
+        """Тест синхронизации поискового индекса при изменении сотрудников"""
+        with app.app_context():
+            employee_service.update_employee(3, full_name='Семен Семенов')
+            assert search_service.search_employees('Сидор', page=1, per_page=10).total == 0
+            assert search_service.search_employees('Семенов', page=1, per_page=10).total == 1
+            
+            employee_service.delete_employee(3)
+            assert search_service.search_employees('Семенов', page=1, per_page=10).total == 0
+    
+    def test_search_relevance_order(self, app, init_database, search_service, employee_service):
+        """Тест сортировки результатов поиска по релевантности"""
+        with app.app_context():
+            employee_service.create_employee(
+                full_name='Анна Разработчикова',
+                position='Разработчик Разработчик',
+                hire_date=date(2024, 2, 1),
+                salary=100000,
+                boss_id=None
+            )
+            
+            result = search_service.search_employees('Разработчик', page=1, per_page=10)
+            assert result.total == 3
+            assert result.items[0].full_name == 'Анна Разработчикова'
+    
+    def test_search_ilike_fallback(self, app, init_database):
+        """Тест резервного поиска через ilike"""
+        from app.services.search_backend import IlikeSearchBackend
+        with app.app_context():
+            service = SearchService(backend=IlikeSearchBackend())
+            result = service.search_employees('Разработчик', page=1, per_page=10)
+            assert result.total == 2
+            
+            # Короткие запросы обрабатываются без триграммного индекса
+            result = SearchService().search_employees('Ив', page=1, per_page=10)
+            assert result.total >= 1
+
+class TestEmployeeNameIndex:
+    
+    def test_prefix_search(self, app, init_database):
+        """Тест префиксного поиска по токенам ФИО"""
+        from app.services.name_index import EmployeeNameIndex
+        with app.app_context():
+            index = EmployeeNameIndex()
+            index.rebuild()
+            
+            assert len(index) == 5
+            assert [r['full_name'] for r in index.search('Иван')] == ['Иван Иванов']
+            assert [r['full_name'] for r in index.search('петр')] == ['Петр Петров']
+            assert [r['full_name'] for r in index.search('ан ан')] == ['Анна Аннова']
+            assert index.search('Сидоров Петр') == []
+            assert len(index.search('а', limit=1)) == 1
+    
+    def test_incremental_updates(self, app, init_database, employee_service):
+        """Тест инкрементального обновления индекса из EmployeeService"""
+        from app.services.name_index import employee_name_index
+        with app.app_context():
+            employee_name_index.rebuild()
+            
+            employee = employee_service.create_employee(
+                full_name='Олег Олегов',
+                position='Аналитик',
+                hire_date=date(2024, 1, 1),
+                salary=90000,
+                boss_id=None
+            )
+            assert [r['id'] for r in employee_name_index.search('Олег')] == [employee.id]
+            
+            employee_service.update_employee(employee.id, full_name='Глеб Глебов')
+            assert employee_name_index.search('Олег') == []
+            assert [r['id'] for r in employee_name_index.search('Глеб')] == [employee.id]
+            
+            employee_service.delete_employee(employee.id)
+            assert employee_name_index.search('Глеб') == []
+    
+    def test_rebuilt_after_other_process_write(self, app, init_database):
+        """Тест перестроения индекса после записи другого процесса по версии таблицы"""
+        from sqlalchemy import update
+        from app.models import TableVersionRow
+        from app.services.name_index import EmployeeNameIndex
+        index = EmployeeNameIndex()
+        with app.app_context():
+            index.rebuild()
+            assert index.search('Глеб') == []
+        
+        # Другой процесс пишет в ту же базу, индекс этого процесса об этом не знает
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(update(Employee.__table__).where(Employee.id == 5).values(full_name='Глеб Глебов'))
+                connection.execute(update(TableVersionRow.__table__).values(version='other-process'))
+        
+        with app.app_context():
+            assert [r['id'] for r in index.search('Глеб')] == [5]
+            assert index.search('Мария') == []
+
+class TestEmployeeRows:
+    
+    def test_list_employee_rows(self, app, init_database, search_service):
+        """Тест проекции списка сотрудников с именем руководителя"""
+        from app.services.search_service import EmployeeRow
+        with app.app_context():
+            result = search_service.list_employee_rows('', 'salary', 'desc', page=1, per_page=3)
+            
+            assert result.total == 5
+            assert result.pages == 2
+            assert all(isinstance(row, EmployeeRow) for row in result.items)
+            assert [row.salary for row in result.items] == [150000, 120000, 110000]
+            
+            # Имя руководителя получено без загрузки Employee.boss
+            rows = {row.id: row for row in search_service.list_employee_rows(per_page=10).items}
+            assert rows[1].boss_name is None
+            assert rows[2].boss_name == 'Иван Иванов'
+            assert rows[3].to_dict()['boss_name'] == 'Петр Петров'
+            assert not hasattr(rows[1], '__dict__')
+    
+    def test_list_employee_rows_search(self, app, init_database, search_service):
+        """Тест поиска и фильтров в проекции списка сотрудников"""
+        with app.app_context():
+            result = search_service.list_employee_rows('Разработчик', per_page=10, max_salary=105000)
+            assert [row.full_name for row in result.items] == ['Иван Иванов']
+            assert result.total == 1
+    
+    def test_list_employee_rows_single_query(self, app, init_database, search_service):
+        """Тест отсутствия дополнительных запросов за руководителями"""
+        from sqlalchemy import event
+        from app.services.cache import employees_version
+        with app.app_context():
+            # Версия таблицы для ключей кешей читается один раз за запрос - заранее
+            employees_version.value
+            statements = []
+            
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                result = search_service.list_employee_rows(per_page=20)
+                [row.boss_name for row in result.items]
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            
+            # Страница вместе с общим количеством (COUNT(*) OVER ()) - одна выборка
+            assert len(statements) == 1
+    
+    def test_count_cache_and_invalidation(self, app, init_database, employee_service):
+        """Тест кеширования общего количества и его сброса при записи"""
+        from app.services.cache import LRUCache
+        with app.app_context():
+            service = SearchService(count_cache=LRUCache())
+            
+            assert service.list_employee_rows(per_page=2, min_salary=100000).total == 4
+            assert service.count_cache.misses == 1
+            
+            # Повторный запрос с другой страницей и сортировкой берет количество из кеша
+            result = service.list_employee_rows('', 'salary', 'desc', page=2, per_page=2, min_salary=100000)
+            assert result.total == 4
+            assert len(result.items) == 2
+            assert service.count_cache.hits == 1
+            
+            employee_service.create_employee(
+                full_name='Новый Сотрудник',
+                position='Аналитик',
+                hire_date=date(2024, 5, 1),
+                salary=130000,
+                boss_id=None
+            )
+            assert service.list_employee_rows(per_page=2, min_salary=100000).total == 5
+    
+    def test_count_for_page_past_end(self, app, init_database):
+        """Тест подсчета для пустой страницы за пределами списка"""
+        from app.services.cache import LRUCache
+        with app.app_context():
+            result = SearchService(count_cache=LRUCache()).list_employee_rows(page=10, per_page=2)
+            assert result.items == []
+            assert result.total == 5
+    
+    def test_estimated_count_mode(self, app, init_database):
+        """Тест оценки количества по статистике планировщика"""
+        from app.services.cache import LRUCache
+        with app.app_context():
+            db.session.execute(db.text('ANALYZE'))
+            app.config['EMPLOYEE_COUNT_MODE'] = 'estimated'
+            try:
+                service = SearchService(count_cache=LRUCache())
+                assert service.list_employee_rows(per_page=2).total == 5
+                # С фильтрами количество всегда точное
+                assert service.list_employee_rows(per_page=2, max_salary=100000).total == 2
+            finally:
+                app.config['EMPLOYEE_COUNT_MODE'] = 'exact'
+    
+    def test_page_cache_hits_and_versioning(self, app, init_database, employee_service):
+        """Тест кеша страниц списка и его сброса по версии таблицы"""
+        from sqlalchemy import event
+        from app.services.cache import LRUCache
+        with app.app_context():
+            service = SearchService(count_cache=LRUCache(), page_cache=LRUCache())
+            
+            first = service.list_employee_rows('', 'salary', 'asc', page=1, per_page=2)
+            
+            statements = []
+            
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                cached = service.list_employee_rows('', 'salary', 'asc', page=1, per_page=2)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            
+            assert statements == []
+            assert [row.id for row in cached.items] == [row.id for row in first.items]
+            assert cached.total == 5
+            assert cached.pages == 3
+            assert service.page_cache.hits == 1
+            assert service.page_cache.misses == 1
+            
+            employee_service.update_employee(5, full_name='Мария Обновленная')
+            updated = service.list_employee_rows('', 'salary', 'asc', page=1, per_page=2)
+            assert updated.items[0].full_name == 'Мария Обновленная'
+            assert service.page_cache.misses == 2
+            
+            stats = service.cache_stats()
+            assert stats['employee_pages']['hits'] == 1
+            assert 'hit_ratio' in stats['employee_counts']
+    
+    def test_page_cache_reset_by_other_process(self, app, init_database):
+        """Тест сброса кеша страниц записью из другого процесса через общую версию таблицы"""
+        from sqlalchemy import update
+        from app.models import TableVersionRow
+        from app.services.cache import LRUCache, employees_version
+        service = SearchService(count_cache=LRUCache(), page_cache=LRUCache())
+        with app.app_context():
+            service.list_employee_rows('', 'salary', 'asc', page=1, per_page=2)
+        
+        # Другой процесс пишет в ту же базу мимо кешей этого процесса
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(update(Employee.__table__).where(Employee.id == 5).values(full_name='Мария Другая'))
+                connection.execute(update(TableVersionRow.__table__).values(version='other-process'))
+        
+        with app.app_context():
+            updated = service.list_employee_rows('', 'salary', 'asc', page=1, per_page=2)
+            assert employees_version.value == 'other-process'
+            assert updated.items[0].full_name == 'Мария Другая'
+            assert service.page_cache.misses == 2
+
+class TestEmployeeFilter:
+    
+    def test_from_args(self):
+        """Тест разбора фильтра из параметров запроса"""
+        from app.services.employee_filter import EmployeeFilter
+        spec, errors = EmployeeFilter.from_args({
+            'search': ' Иван ',
+            'min_salary': '150000',
+            'max_salary': '100000',
+            'start_date': '2024-01-01',
+            'end_date': 'invalid'
+        })
+        
+        assert spec.search == 'Иван'
+        assert (spec.min_salary, spec.max_salary) == (100000, 150000)
+        assert spec.start_date == date(2024, 1, 1)
+        assert spec.end_date is None
+        assert len(errors) == 2
+    
+    def test_from_json_and_hashing(self):
+        """Тест разбора фильтра из JSON и использования как ключа"""
+        from app.services.employee_filter import EmployeeFilter
+        spec = EmployeeFilter.from_json({
+            'min_salary': '100000',
+            'start_date': 'invalid-date',
+            'position': 'Разработчик'
+        })
+        same = EmployeeFilter(min_salary=100000, position='Разработчик')
+        
+        assert spec == same
+        assert hash(spec) == hash(same)
+        assert spec.criteria() is same.criteria()
+        assert EmployeeFilter.from_json(None).is_empty
+    
+    def test_apply(self, app, init_database):
+        """Тест применения фильтра к запросу"""
+        from app.services.employee_filter import EmployeeFilter
+        with app.app_context():
+            spec = EmployeeFilter.from_json({
+                'min_salary': '100000',
+                'max_salary': '150000',
+                'start_date': '2020-01-01',
+                'end_date': '2024-12-31',
+                'position': 'Разработчик'
+            })
+            results = spec.apply(Employee.query).all()
+            
+            assert len(results) == 2
+            assert all(emp.position == 'Разработчик' for emp in results)
+            assert EmployeeFilter().apply(Employee.query).count() == 5
+    
+    def test_search_service_accepts_spec(self, app, init_database, search_service):
+        """Тест передачи фильтра в SearchService"""
+        from app.services.employee_filter import EmployeeFilter
+        with app.app_context():
+            spec = EmployeeFilter(search='Разработчик', max_salary=105000)
+            result = search_service.list_employee_rows(spec=spec)
+            assert [row.full_name for row in result.items] == ['Иван Иванов']
+            
+            page = search_service.get_sorted_employees_keyset(
+                'salary', 'desc', None, per_page=10, spec=EmployeeFilter(position='Разработчик')
+            )
+            assert [row.salary for row in page.items] == [110000, 100000]
+
+class TestExportService:
+    
+    def test_iter_csv(self, app, init_database):
+        """Тест потоковой выгрузки в CSV порциями"""
+        import csv
+        from app.services.employee_filter import EmployeeFilter
+        from app.services.export_service import ExportService
+        with app.app_context():
+            chunks = list(ExportService(chunk_size=2).iter_csv(EmployeeFilter(), 'salary', 'desc'))
+            
+            # Заголовок и первая порция, затем еще две порции
+            assert len(chunks) == 3
+            rows = list(csv.reader(''.join(chunks).splitlines()))
+            assert rows[0][:3] == ['id', 'full_name', 'position']
+            assert [int(row[4]) for row in rows[1:]] == [150000, 120000, 110000, 100000, 90000]
+            assert rows[1][6] == 'Иван Иванов'
+    
+    def test_iter_jsonl_with_filters(self, app, init_database):
+        """Тест выгрузки в JSONL с поиском и фильтрами"""
+        import json
+        from app.services.employee_filter import EmployeeFilter
+        from app.services.export_service import ExportService
+        with app.app_context():
+            spec = EmployeeFilter(search='Разработчик', min_salary=105000)
+            lines = ''.join(ExportService().iter_jsonl(spec)).splitlines()
+            
+            assert [json.loads(line)['full_name'] for line in lines] == ['Анна Аннова']
+            assert json.loads(lines[0])['hire_date'] == '2023-08-05'
+
+
+class TestImportService:
+    
+    def test_import_csv_with_refs(self, app, init_database):
+        """Тест импорта с разрешением ссылок на руководителей внутри файла"""
+        import io
+        from app.services.import_service import ImportService
+        csv_data = (
+            'full_name,position,hire_date,salary,boss_id,ref,boss_ref\n'
+            'Олег Олегов,Разработчик,2024-02-01,95000,,dev1,lead\n'
+            'Ольга Лидова,Тимлид,2024-01-15,180000,1,lead,\n'
+            'Павел Павлов,Тестировщик,2024-03-01,80000,2,,\n'
+        )
+        with app.app_context():
+            report = ImportService(chunk_size=2).import_csv(io.StringIO(csv_data))
+            
+            assert report.imported == 3
+            assert report.errors == {}
+            lead = Employee.query.filter_by(full_name='Ольга Лидова').first()
+            assert lead.boss_id == 1
+            assert Employee.query.filter_by(full_name='Олег Олегов').first().boss_id == lead.id
+            assert Employee.query.filter_by(full_name='Павел Павлов').first().boss_id == 2
+    
+    def test_import_csv_reports_invalid_rows(self, app, init_database):
+        """Тест отчета об ошибках: неверные строки пропускаются, верные добавляются"""
+        import io
+        from app.services.import_service import ImportService
+        csv_data = (
+            'full_name,position,hire_date,salary,boss_id\n'
+            'Верный Сотрудник,Аналитик,2024-04-01,70000,\n'
+            ',Аналитик,2024-04-01,70000,\n'
+            'Кривая Дата,Аналитик,01.04.2024,70000,\n'
+            'Кривая Зарплата,Аналитик,2024-04-01,-5,\n'
+            'Нет Руководителя,Аналитик,2024-04-01,70000,999\n'
+            'Огромная Зарплата,Аналитик,2024-04-01,2147483648,\n'
+        )
+        with app.app_context():
+            report = ImportService().import_csv(io.StringIO(csv_data))
+            
+            assert report.total == 6
+            assert report.imported == 1
+            assert sorted(report.errors) == [3, 4, 5, 6, 7]
+            assert report.errors[6] == ['Руководитель с указанным boss_id не найден']
+            assert report.errors[7] == ['Зарплата больше 2147483647']
+            assert Employee.query.count() == 6
+    
+    def test_import_csv_warns_unresolved_refs(self, app, init_database):
+        """Тест: строка с boss_ref на неимпортированную строку добавляется с предупреждением, а не ошибкой"""
+        import io
+        from app.services.import_service import ImportService
+        csv_data = (
+            'full_name,position,hire_date,salary,ref,boss_ref\n'
+            'Сирота,Аналитик,2024-04-01,70000,,nobody\n'
+            'Без Даты,Аналитик,,70000,nobody,\n'
+        )
+        with app.app_context():
+            report = ImportService().import_csv(io.StringIO(csv_data))
+            
+            assert report.imported == 1
+            assert report.rejected == 1
+            assert list(report.errors) == [3]
+            assert list(report.warnings) == [2]
+            assert Employee.query.filter_by(full_name='Сирота').first().boss_id is None
+    
+    def test_import_csv_missing_columns(self, app, init_database):
+        """Тест ошибки формата при отсутствии обязательных колонок"""
+        import io
+        from app.services.import_service import ImportService, ImportFormatError
+        with app.app_context():
+            with pytest.raises(ImportFormatError):
+                ImportService().import_csv(io.StringIO('full_name,salary\nИмя,100\n'))
+            assert Employee.query.count() == 5
+
+
+class TestHierarchyService:
+    """Тесты таблицы замыкания иерархии.
+    
+    Тестовая иерархия: 1 -> (2, 4), 2 -> (3, 5).
+    """
+    
+    @staticmethod
+    def _closure():
+        from app.models import EmployeeClosure
+        return {
+            (row.ancestor_id, row.descendant_id): row.depth
+            for row in EmployeeClosure.query.all()
+        }
+    
+    def _assert_matches_rebuild(self, hierarchy):
+        # Инкрементальные изменения должны совпадать с полным пересчетом
+        maintained = self._closure()
+        hierarchy.rebuild()
+        assert maintained == self._closure()
+    
+    def test_subtree_and_ancestors(self, app, init_database):
+        """Тест поддерева на всю глубину и цепочки руководителей"""
+        from app.services.hierarchy_service import HierarchyService
+        with app.app_context():
+            hierarchy = HierarchyService()
+            subtree = hierarchy.get_subtree(1)
+            
+            assert [(row['id'], row['depth']) for row in subtree] == [(4, 1), (2, 1), (5, 2), (3, 2)]
+            assert [row['id'] for row in hierarchy.get_subtree(1, max_depth=1)] == [4, 2]
+            assert [row['id'] for row in hierarchy.get_ancestors(5)] == [2, 1]
+            assert hierarchy.get_ancestors(1) == []
+    
+    def test_subtree_pages(self, app, init_database):
+        """Тест курсорных страниц поддерева и подсчета подчиненных"""
+        from app.services.hierarchy_service import HierarchyService
+        from app.services.search_service import InvalidCursorError
+        with app.app_context():
+            hierarchy = HierarchyService()
+            pages, cursor = [], None
+            while True:
+                page = hierarchy.get_subtree_page(1, cursor=cursor, limit=1)
+                pages.append([row['id'] for row in page.items])
+                if not page.has_next:
+                    break
+                cursor = page.next_cursor
+            
+            assert pages == [[4], [2], [5], [3]]
+            assert hierarchy.count_subtree(1) == 4
+            assert hierarchy.count_subtree(1, max_depth=1) == 2
+            for crafted in ([1, 'Петр Петров', True], ['1', 'Петр Петров', 2], [1, None, 2]):
+                with pytest.raises(InvalidCursorError):
+                    hierarchy.decode_cursor(HierarchyService.encode_cursor(*crafted))
+    
+    def test_create_and_update_maintain_closure(self, app, init_database, employee_service):
+        """Тест поддержки замыкания при добавлении и переводе сотрудника"""
+        with app.app_context():
+            employee = employee_service.create_employee(
+                full_name='Новый Подчиненный',
+                position='Стажер',
+                hire_date=date.today(),
+                salary=50000,
+                boss_id=3
+            )
+            assert [row['id'] for row in employee_service.hierarchy.get_ancestors(employee.id)] == [3, 2, 1]
+            
+            # Переводим 2 вместе с поддеревом под 4
+            employee_service.update_employee(2, boss_id=4)
+            assert [row['id'] for row in employee_service.hierarchy.get_ancestors(employee.id)] == [3, 2, 4, 1]
+            self._assert_matches_rebuild(employee_service.hierarchy)
+    
+    def test_delete_and_reassign_maintain_closure(self, app, init_database, employee_service):
+        """Тест поддержки замыкания при удалении и массовом переводе"""
+        with app.app_context():
+            employee_service.reassign_subordinates(2, 4)
+            assert [row['id'] for row in employee_service.hierarchy.get_ancestors(5)] == [4, 1]
+            self._assert_matches_rebuild(employee_service.hierarchy)
+            
+            employee_service.delete_employee(4)
+            assert employee_service.hierarchy.get_ancestors(5) == []
+            assert employee_service.hierarchy.get_subtree(1) == [
+                {'id': 2, 'full_name': 'Петр Петров', 'position': 'Менеджер', 'boss_id': 1, 'depth': 1}
+            ]
+            self._assert_matches_rebuild(employee_service.hierarchy)
+    
+    def test_import_maintains_closure(self, app, init_database):
+        """Тест поддержки замыкания при импорте со ссылками внутри файла"""
+        import io
+        from app.services.import_service import ImportService
+        csv_data = (
+            'full_name,position,hire_date,salary,boss_id,ref,boss_ref\n'
+            'Младший,Разработчик,2024-02-01,95000,,junior,senior\n'
+            'Старший,Разработчик,2024-01-15,180000,,senior,lead\n'
+            'Лид,Тимлид,2024-01-10,200000,5,lead,\n'
+        )
+        with app.app_context():
+            service = ImportService(chunk_size=1)
+            service.import_csv(io.StringIO(csv_data))
+            junior = Employee.query.filter_by(full_name='Младший').first()
+            
+            assert [row['full_name'] for row in service.hierarchy.get_ancestors(junior.id)] == [
+                'Старший', 'Лид', 'Мария Маринова', 'Петр Петров', 'Иван Иванов'
+            ]
+            self._assert_matches_rebuild(service.hierarchy)
+
+
+class TestHierarchyCycles:
+    """Тесты защиты от циклов в иерархии 1 -> (2, 4), 2 -> (3, 5)"""
+    
+    def test_update_rejects_descendant_boss(self, app, init_database, employee_service):
+        """Тест: руководителем нельзя назначить подчиненного на любой глубине"""
+        from app.services.hierarchy_service import HierarchyError
+        with app.app_context():
+            with pytest.raises(HierarchyError):
+                employee_service.update_employee(1, boss_id=5)
+            with pytest.raises(HierarchyError):
+                employee_service.update_employee(2, boss_id=2)
+            
+            db.session.rollback()
+            assert employee_service.get_employee_by_id(1).boss_id is None
+            
+            # Перевод в соседнюю ветку допустим
+            employee_service.update_employee(4, boss_id=3)
+            assert employee_service.get_employee_by_id(4).boss_id == 3
+    
+    def test_reassign_rejects_cycle(self, app, init_database, employee_service):
+        """Тест: подчиненных нельзя перевести к сотруднику из их же поддерева"""
+        from app.services.hierarchy_service import HierarchyError
+        with app.app_context():
+            with pytest.raises(HierarchyError):
+                employee_service.reassign_subordinates(1, 3)
+            assert employee_service.get_employee_by_id(2).boss_id == 1
+    
+    def test_import_rejects_reference_cycle(self, app, init_database):
+        """Тест: ссылки boss_ref по кругу не создают цикл при импорте"""
+        import io
+        from app.services.import_service import ImportService
+        csv_data = (
+            'full_name,position,hire_date,salary,ref,boss_ref\n'
+            'Первый,Аналитик,2024-02-01,70000,a,b\n'
+            'Второй,Аналитик,2024-02-01,70000,b,c\n'
+            'Третий,Аналитик,2024-02-01,70000,c,a\n'
+        )
+        with app.app_context():
+            service = ImportService()
+            report = service.import_csv(io.StringIO(csv_data))
+            
+            assert report.imported == 3
+            assert report.errors == {}
+            assert len(report.warnings) == 1
+            bosses = [row.boss_id for row in Employee.query.filter(Employee.id > 5).order_by(Employee.id)]
+            assert bosses.count(None) == 1
+            # Иерархия осталась деревом: у каждого не больше двух руководителей
+            assert all(len(service.hierarchy.get_ancestors(employee_id)) <= 2 for employee_id in (6, 7, 8))
+
+
+class TestRollupService:
+    """Тесты сводок по поддеревьям на иерархии 1 -> (2, 4), 2 -> (3, 5)"""
+    
+    @staticmethod
+    def _rollups():
+        from app.models import EmployeeRollup
+        return {
+            row.employee_id: (row.headcount, row.salary_total, row.depth)
+            for row in EmployeeRollup.query.all()
+        }
+    
+    def _assert_matches_rebuild(self, rollups):
+        # Приращения должны давать тот же результат, что и полный пересчет
+        maintained = self._rollups()
+        rollups.rebuild()
+        assert maintained == self._rollups()
+    
+    def test_rebuild(self, app, init_database):
+        """Тест полного пересчета сводок"""
+        from app.services.rollup_service import RollupService
+        with app.app_context():
+            assert RollupService().rebuild(batch_size=2) == 5
+            rollups = self._rollups()
+            
+            assert rollups[1] == (5, 570000, 0)
+            assert rollups[2] == (3, 360000, 1)
+            assert rollups[5] == (1, 90000, 2)
+    
+    def test_salary_changes_update_chain(self, app, init_database, employee_service):
+        """Тест переноса изменений зарплат на цепочку руководителей"""
+        from app.services.employee_filter import EmployeeFilter
+        with app.app_context():
+            employee_service.update_employee(5, salary=100000)
+            assert employee_service.hierarchy.rollups.get_rollup(1)['salary_total'] == 580000
+            assert employee_service.hierarchy.rollups.get_rollup(2)['salary_total'] == 370000
+            
+            employee_service.raise_salary(EmployeeFilter(position='Разработчик'), 10)
+            assert employee_service.hierarchy.rollups.get_rollup(1)['salary_total'] == 601000
+            self._assert_matches_rebuild(employee_service.hierarchy.rollups)
+    
+    def test_moves_and_deletes_update_chain(self, app, init_database, employee_service):
+        """Тест сводок при добавлении, переводе и удалении сотрудников"""
+        with app.app_context():
+            rollups = employee_service.hierarchy.rollups
+            employee = employee_service.create_employee(
+                full_name='Стажер',
+                position='Стажер',
+                hire_date=date.today(),
+                salary=30000,
+                boss_id=3
+            )
+            assert rollups.get_rollup(employee.id) == {
+                'employee_id': employee.id, 'headcount': 1, 'salary_total': 30000, 'depth': 3
+            }
+            assert rollups.get_rollup(1)['headcount'] == 6
+            
+            employee_service.update_employee(2, boss_id=4)
+            assert rollups.get_rollup(4)['headcount'] == 5
+            assert rollups.get_rollup(employee.id)['depth'] == 4
+            self._assert_matches_rebuild(rollups)
+            
+            employee_service.reassign_subordinates(2, 1)
+            self._assert_matches_rebuild(rollups)
+            
+            employee_service.delete_employees([1, 3])
+            assert rollups.get_rollup(2) == {'employee_id': 2, 'headcount': 1, 'salary_total': 150000, 'depth': 1}
+            assert rollups.get_rollup(employee.id)['depth'] == 0
+            self._assert_matches_rebuild(rollups)
+    
+    def test_nested_deletes(self, app, init_database, employee_service):
+        """Тест удаления руководителя вместе с его подчиненным"""
+        with app.app_context():
+            employee_service.delete_employees([2, 3])
+            
+            assert employee_service.hierarchy.rollups.get_rollup(1) == {
+                'employee_id': 1, 'headcount': 2, 'salary_total': 210000, 'depth': 0
+            }
+            self._assert_matches_rebuild(employee_service.hierarchy.rollups)
+
+
+class TestPositionService:
+    
+    def test_position_id_kept_in_sync(self, app, init_database, employee_service):
+        """Тест заполнения position_id при создании и изменении сотрудника"""
+        from app.models import Position
+        with app.app_context():
+            employee = employee_service.create_employee(
+                full_name='Новый Сотрудник',
+                position='Архитектор',
+                hire_date=date.today(),
+                salary=200000
+            )
+            assert db.session.get(Position, employee.position_id).name == 'Архитектор'
+            
+            employee_service.update_employee(employee.id, position='Разработчик')
+            assert employee.position_id == employee_service.get_employee_by_id(1).position_id
+    
+    def test_insert_positions_skips_existing(self, app, init_database):
+        """Тест добавления должности, которую уже добавила другая транзакция"""
+        from sqlalchemy import func, select
+        from app.models import Position, insert_positions
+        with app.app_context():
+            connection = db.session.connection()
+            insert_positions(connection, ['Разработчик', 'Архитектор'])
+            insert_positions(connection, ['Архитектор'])
+            
+            counts = dict(db.session.execute(
+                select(Position.name, func.count()).group_by(Position.name)
+            ).all())
+            assert counts['Разработчик'] == 1
+            assert counts['Архитектор'] == 1
+            db.session.rollback()
+    
+    def test_names_cached_until_write(self, app, init_database, employee_service):
+        """Тест кеша списка должностей и его сброса при записи"""
+        from app.services.cache import LRUCache
+        from app.services.position_service import PositionService
+        with app.app_context():
+            service = PositionService(cache=LRUCache(maxsize=8, ttl=None))
+            assert service.get_names() == ['Аналитик', 'Менеджер', 'Разработчик', 'Тестировщик']
+            service.get_names()
+            assert service.cache.hits == 1
+            
+            employee_service.delete_employee(3)
+            assert 'Аналитик' not in service.get_names()
+            assert service.cache.misses == 2
+    
+    def test_ids_for_and_grouping(self, app, init_database):
+        """Тест справочника и группировки по целочисленному ключу"""
+        from app.services.employee_filter import EmployeeFilter
+        from app.services.position_service import PositionService
+        with app.app_context():
+            service = PositionService()
+            ids = service.ids_for(['Разработчик', 'Дизайнер'])
+            assert set(ids) == {'Разработчик', 'Дизайнер'}
+            assert service.ids_for(['Дизайнер']) == {'Дизайнер': ids['Дизайнер']}
+            
+            stats = service.headcount_by_position(EmployeeFilter(min_salary=95000))
+            assert stats[0] == {'position': 'Разработчик', 'headcount': 2, 'avg_salary': 105000.0}
+            assert len(stats) == 3
+    
+    def test_migrate_legacy_schema(self):
+        """Тест перевода базы без справочника: колонка добавляется и заполняется"""
+        from sqlalchemy import create_engine, text
+        from app.services.position_service import migrate_positions
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE employees (id INTEGER PRIMARY KEY, full_name VARCHAR(100) NOT NULL, '
+                'position VARCHAR(50) NOT NULL, hire_date DATE NOT NULL, salary INTEGER NOT NULL, '
+                'boss_id INTEGER REFERENCES employees (id))'
+            ))
+            connection.execute(text(
+                "INSERT INTO employees (full_name, position, hire_date, salary) VALUES "
+                "('А', 'Инженер', '2020-01-01', 1), ('Б', 'Инженер', '2020-01-01', 1), "
+                "('В', 'Директор', '2020-01-01', 1)"
+            ))
+            assert migrate_positions(connection) == 3
+            # Повторный запуск ничего не меняет
+            assert migrate_positions(connection) == 0
+            
+            rows = connection.execute(text(
+                'SELECT e.position, p.name FROM employees e JOIN positions p ON p.id = e.position_id'
+            )).all()
+            assert len(rows) == 3
+            assert all(position == name for position, name in rows)